@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# Trends of the diaries, computed over one compact array per column: the day (as an offset from the first filled
+# date), the intensity, migraine and medicine. NumPy is an optional dependency: when it is installed, every figure is
+# computed with whole-array operations; otherwise the array module and itertools give the same figures, more slowly.
+
+from array import array
+from datetime import date  # the figures are reported with dates
+from itertools import accumulate, groupby
+from operator import itemgetter
+
+ROLLING_WINDOW = 28  # days of the rolling average of the intensity
+FREQUENCY_WINDOW = 30  # days of the rolling count of headache days
+OVERUSE_DAYS = 10  # medicine days, within OVERUSE_WINDOW days, from which the medication is overused
+OVERUSE_WINDOW = 30
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+NAN = float('nan')
+
+numpy = None  # the module once imported, False when it is not installed
+
+
+def load_numpy():
+    """Return the numpy module, or None when it is not installed; it is only imported when first needed."""
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            module = False
+        numpy = module
+    return numpy or None
+
+
+class Series:
+    """
+    The diary of a patient as one compact array per column, days being offsets from first (a day ordinal), in date
+    order. The arrays are NumPy ones when np is the numpy module, array module ones otherwise.
+    """
+
+    def __init__(self, first, days, intensity, migraine, medicine, np=None):
+        self.first = first
+        self.days = days
+        self.intensity = intensity
+        self.migraine = migraine
+        self.medicine = medicine
+        self.np = np
+        self.span = int(days[-1]) + 1 if len(days) else 0  # calendar days from the first to the last filled date
+        self.dense = None  # the columns over every day of the span, once computed by grid()
+
+    @classmethod
+    def from_rows(cls, rows, vectorized=True):
+        """Return the Series of (day ordinal, intensity, migraine, medicine) rows, in date order."""
+        np = load_numpy() if vectorized else None
+        if np is not None:
+            return cls.from_table(np.array(rows, dtype=np.int32).reshape(-1, 4), np)
+        columns = list(zip(*rows)) or [(), (), (), ()]
+        first = columns[0][0] if columns[0] else 0
+        return cls(first, array('i', (day - first for day in columns[0])), array('b', columns[1]),
+                   array('b', columns[2]), array('b', columns[3]))
+
+    @classmethod
+    def from_table(cls, table, np):
+        """Return the Series of a NumPy table whose columns are the day ordinal, intensity, migraine and medicine."""
+        first = int(table[0, 0]) if len(table) else 0
+        return cls(first, table[:, 0] - first, np.ascontiguousarray(table[:, 1], dtype=np.int8),
+                   np.ascontiguousarray(table[:, 2], dtype=np.int8), np.ascontiguousarray(table[:, 3], dtype=np.int8),
+                   np)
+
+    @classmethod
+    def load(cls, database, start=None, end=None, vectorized=True):
+        """Return the Series of the selected patient of database, from start to end (both optional)."""
+        return cls.from_rows(database.series(start, end).fetchall(), vectorized)
+
+    def __len__(self):
+        return len(self.days)
+
+    def date(self, day):
+        return date.fromordinal(self.first + int(day)).isoformat()
+
+    def grid(self):
+        """Return the (filled, intensity, headache, medicine) columns over every day of the span, 0 when not filled."""
+        if self.dense is None:
+            np = self.np
+            if np is not None:
+                filled = np.zeros(self.span, dtype=np.int8)
+                filled[self.days] = 1
+                intensity = np.zeros(self.span, dtype=np.int8)
+                intensity[self.days] = self.intensity
+                medicine = np.zeros(self.span, dtype=np.int8)
+                medicine[self.days] = self.medicine
+                headache = (intensity > 0).view(np.int8)
+            else:
+                filled = array('b', bytes(self.span))
+                intensity = array('b', bytes(self.span))
+                medicine = array('b', bytes(self.span))
+                for day, value, taken in zip(self.days, self.intensity, self.medicine):
+                    filled[day] = 1
+                    intensity[day] = value
+                    medicine[day] = taken
+                headache = array('b', (value > 0 for value in intensity))
+            self.dense = filled, intensity, headache, medicine
+        return self.dense
+
+    def window_sums(self, values, window):
+        """Return, for each day, the sum of values over the window days ending on it."""
+        np = self.np
+        if np is not None:
+            sums = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+            ends = np.arange(1, len(values) + 1)
+            return sums[ends] - sums[np.maximum(ends - window, 0)]
+        sums = list(accumulate(values, initial=0))
+        return array('q', (sums[end] - sums[max(end - window, 0)] for end in range(1, len(values) + 1)))
+
+    def rolling_average(self, window=ROLLING_WINDOW):
+        """Return, for each day, the average intensity of the filled days among the window days ending on it (nan
+        when none is filled)."""
+        filled, intensity, headache, medicine = self.grid()
+        total = self.window_sums(intensity, window)
+        count = self.window_sums(filled, window)
+        np = self.np
+        if np is not None:
+            return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+        return array('d', (value / days if days else NAN for value, days in zip(total, count)))
+
+    def headache_frequency(self, window=FREQUENCY_WINDOW):
+        """Return, for each day, the amount of headache days among the window days ending on it."""
+        return self.window_sums(self.grid()[2], window)
+
+    def runs(self, mask):
+        """Return the first days and the lengths of the runs of consecutive true days of mask."""
+        np = self.np
+        if np is not None:
+            edges = np.diff(np.concatenate(([0], mask, [0])).astype(np.int8))
+            starts = np.flatnonzero(edges == 1)
+            return starts, np.flatnonzero(edges == -1) - starts
+        starts = array('i')
+        lengths = array('i')
+        day = 0
+        for value, days in groupby(mask):
+            length = sum(1 for _ in days)
+            if value:
+                starts.append(day)
+                lengths.append(length)
+            day += length
+        return starts, lengths
+
+    def streak_runs(self, headache=True):
+        """Return the runs of consecutive filled days with a headache, or without one; a day not filled ends a run."""
+        filled, intensity, with_headache, medicine = self.grid()
+        if self.np is not None:
+            return self.runs(with_headache if headache else filled & (1 - with_headache))
+        return self.runs(with_headache if headache else array('b', (a and not b for a, b in zip(filled,
+                                                                                                  with_headache))))
+
+    def streaks(self, headache=True, minimum=1):
+        """Return the (first date, last date, length) of each streak of at least minimum days (see streak_runs())."""
+        starts, lengths = self.streak_runs(headache)
+        if self.np is not None:
+            kept = lengths >= minimum
+            starts, lengths = starts[kept].tolist(), lengths[kept].tolist()
+        return [(self.date(start), self.date(start + length - 1), length) for start, length in zip(starts, lengths)
+                if length >= minimum]
+
+    def longest_streak(self, headache=True):
+        """Return the (first date, last date, length) of the longest streak (the first one on a tie), or None."""
+        starts, lengths = self.streak_runs(headache)
+        if not len(lengths):
+            return None
+        longest = int(self.np.argmax(lengths)) if self.np is not None else lengths.index(max(lengths))
+        start, length = int(starts[longest]), int(lengths[longest])
+        return self.date(start), self.date(start + length - 1), length
+
+    def current_streak(self, headache=True):
+        """Return the length of the streak ending on the last filled date, 0 when there is none."""
+        starts, lengths = self.streak_runs(headache)
+        if len(lengths) and starts[-1] + lengths[-1] == self.span:
+            return int(lengths[-1])
+        return 0
+
+    def overuse(self, threshold=OVERUSE_DAYS, window=OVERUSE_WINDOW):
+        """
+        Return the (first date, last date, most medicine days) of each period of medication overuse: the union of
+        the windows of window days holding at least threshold medicine days.
+        """
+        counts = self.window_sums(self.grid()[3], window)
+        np = self.np
+        over = (counts >= threshold).view(np.int8) if np is not None else array('b', (c >= threshold for c in counts))
+        periods = list()
+        for end, length in zip(*self.runs(over)):
+            end, length = int(end), int(length)
+            start = max(0, end - window + 1)  # the first window ending on end starts window - 1 days before it
+            last = end + length - 1
+            peak = int(max(counts[end:last + 1]))
+            if periods and start <= periods[-1][1] + 1:
+                periods[-1] = (periods[-1][0], last, max(periods[-1][2], peak))
+            else:
+                periods.append((start, last, peak))
+        return [(self.date(start), self.date(last), peak) for start, last, peak in periods]
+
+    def weekdays(self):
+        """Return the (weekday, filled days, headache days, average intensity, migraine days, medicine days) of each
+        day of the week, from monday."""
+        np = self.np
+        if np is not None:
+            weekday = (self.days + (self.first - 1)) % 7  # the day ordinal 1 is a monday
+            columns = [np.bincount(weekday, minlength=7)] + [np.bincount(weekday, weights, minlength=7).astype(np.int64)
+                                                              for weights in (self.intensity > 0, self.intensity,
+                                                                              self.migraine, self.medicine)]
+            columns = [column.tolist() for column in columns]
+        else:
+            columns = [[0] * 7 for _ in range(5)]
+            for day, intensity, migraine, medicine in zip(self.days, self.intensity, self.migraine, self.medicine):
+                weekday = (self.first + day - 1) % 7
+                columns[0][weekday] += 1
+                columns[1][weekday] += intensity > 0
+                columns[2][weekday] += intensity
+                columns[3][weekday] += migraine
+                columns[4][weekday] += medicine
+        filled, headache, intensity, migraine, medicine = columns
+        return [(WEEKDAYS[i], filled[i], headache[i], intensity[i] / filled[i] if filled[i] else 0.0, migraine[i],
+                 medicine[i]) for i in range(7)]
+
+
+def load_every(database, vectorized=True):
+    """Return the Series of every diary of database, by patient_id, read in a single query."""
+    rows = database.every_series().fetchall()
+    np = load_numpy() if vectorized else None
+    if np is not None:
+        table = np.array(rows, dtype=np.int32).reshape(-1, 5)
+        bounds = np.flatnonzero(np.diff(table[:, 0])) + 1
+        return {int(part[0, 0]): Series.from_table(part[:, 1:], np) for part in np.split(table, bounds) if len(part)}
+    return {patient_id: Series.from_rows([row[1:] for row in part], vectorized=False)
+            for patient_id, part in groupby(rows, key=itemgetter(0))}
+
+
+def plural(count, word):
+    return '{} {}{}'.format(count, word, '' if count == 1 else 's')
+
+
+def describe(series):
+    """Return the trends of series as lines of text, for the statistics window and the command line."""
+    if not len(series):
+        return ['No filled date.']
+    last = series.span - 1
+    lines = ['{} filled days from {} to {}.'.format(len(series), series.date(0), series.date(last))]
+    average = series.rolling_average()[last]
+    if average == average:  # not nan
+        lines.append('Average intensity of the {} days to {}: {:.2f}.'.format(ROLLING_WINDOW, series.date(last),
+                                                                            float(average)))
+    lines.append('Headache days in the {} days to {}: {}.'.format(FREQUENCY_WINDOW, series.date(last),
+                                                                  int(series.headache_frequency()[last])))
+    for headache, name in ((True, 'headache'), (False, 'headache-free')):
+        longest = series.longest_streak(headache)
+        if longest is not None:
+            lines.append('Longest {} streak: {}, from {} to {}.'.format(name, plural(longest[2], 'day'), *longest[:2]))
+        current = series.current_streak(headache)
+        if current:
+            lines.append('Current {} streak: {}.'.format(name, plural(current, 'day')))
+    periods = series.overuse()
+    lines.append('Medication overuse ({} medicine days or more in {}): {}.'.format(
+        OVERUSE_DAYS, OVERUSE_WINDOW, '; '.join('{} to {} (up to {})'.format(first, final, plural(peak, 'day'))
+                                                for first, final, peak in periods) if periods else 'none'))
+    lines.append('')
+    lines.append('{:<12}{:>8}{:>10}{:>10}{:>10}{:>10}'.format('weekday', 'filled', 'headache', 'average', 'migraine',
+                                                            'medicine'))
+    for weekday in series.weekdays():
+        lines.append('{:<12}{:>8}{:>10}{:>10.2f}{:>10}{:>10}'.format(*weekday))
+    return lines
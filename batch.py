@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# The batch entry window, where a range of dates is staged in a grid, the same values for every date or different
+# ones per day, then saved at once: one query finds the dates already filled, and one transaction writes the batch,
+# instead of a click, a query and a commit per date in the main window.
+
+import tkinter as tk  # GUI toolkit
+from tkinter import ttk  # widget for the separator
+from tkinter import tix
+from datetime import date  # dates of the staged range
+from datetime import timedelta  # some date calculations
+import storage  # database queries
+from widgets import DISABLED_BUTTON_BKGRND, ENABLED_BUTTON_BKGRND, load_tix
+
+MAX_DAYS = 366  # staged at once
+GRID_HEIGHT = 300  # pixels of the visible part of the staging grid
+INTENSITIES = ('0 - none', '1 - weak', '2 - medium', '3 - strong')
+
+
+class StagedDate:
+    """The widgets and values of a date of the staging grid."""
+
+    def __init__(self, frame, row, full_date, intensity, migraine, medicine, comment):
+        self.date = full_date
+        self.filled = False  # whether the date is already filled, once checked
+        self.include_value = tk.IntVar(value=1)
+        self.intensity_value = tk.StringVar(value=intensity)
+        self.migraine_value = tk.IntVar(value=migraine)
+        self.medicine_value = tk.IntVar(value=medicine)
+        self.comment_value = tk.StringVar(value=comment)
+
+        self.widgets = (
+            tk.Checkbutton(frame, variable=self.include_value),
+            tk.Label(frame, text=date.fromisoformat(full_date).strftime('%Y-%m-%d %a')),
+            tk.OptionMenu(frame, self.intensity_value, *INTENSITIES),
+            tk.Checkbutton(frame, variable=self.migraine_value),
+            tk.Checkbutton(frame, variable=self.medicine_value),
+            tk.Entry(frame, textvariable=self.comment_value, width=40),
+            tk.Label(frame, text='', width=14, anchor=tk.W),
+        )
+        for column, widget in enumerate(self.widgets):
+            widget.grid(row=row, column=column, sticky=tk.W + tk.E, padx=2)
+
+    def mark_filled(self, replace):
+        self.filled = True
+        self.include_value.set(int(replace))
+        self.widgets[-1].configure(text='already filled')
+
+    def entry(self):
+        """Return the entry of the date, as the headache table wants it."""
+        comment = self.comment_value.get().strip()
+        return (self.date, int(self.intensity_value.get()[0]), self.migraine_value.get(), self.medicine_value.get(),
+                comment + '\n' if comment else None)  # stored like the comments typed in the main window
+
+    def destroy(self):
+        for widget in self.widgets:
+            widget.destroy()
+
+
+class BatchEntry(tk.Toplevel):
+
+    def __init__(self, worker, master=None, saved=None):
+        tk.Toplevel.__init__(self)
+
+        # Properties:
+        self.worker = worker
+        self.master = master
+        self.on_saved = saved  # called once a batch is saved
+        self.staged = list()  # StagedDate of each date of the grid
+        self.title('Batch entry')
+        self.resizable(True, True)
+        load_tix(self)
+
+        # data
+        yesterday = date.today() + timedelta(days=-1)
+        self.start_value = tk.StringVar(value=(yesterday + timedelta(days=-6)).isoformat())
+        self.end_value = tk.StringVar(value=yesterday.isoformat())
+        self.list_value_headache = tk.StringVar(value=INTENSITIES[0])
+        self.check_migraine_value = tk.IntVar(value=0)
+        self.check_medicine_value = tk.IntVar(value=0)
+        self.comment_value = tk.StringVar()
+        self.replace_value = tk.IntVar(value=0)
+
+        # widget creation
+        self.frame_range = tk.Frame(self)
+        self.label_start = tk.Label(self.frame_range, text='From:')
+        self.entry_start = tk.Entry(self.frame_range, textvariable=self.start_value, width=12)
+        self.label_end = tk.Label(self.frame_range, text='To:')
+        self.entry_end = tk.Entry(self.frame_range, textvariable=self.end_value, width=12)
+        self.label_intensity = tk.Label(self.frame_range, text='Intensity:')
+        self.combo_headache = tk.OptionMenu(self.frame_range, self.list_value_headache, *INTENSITIES)
+        self.check_migraine = tk.Checkbutton(self.frame_range, text='Migraine', variable=self.check_migraine_value)
+        self.check_medicine = tk.Checkbutton(self.frame_range, text='Medicine', variable=self.check_medicine_value)
+        self.label_comment = tk.Label(self.frame_range, text='Comment:')
+        self.entry_comment = tk.Entry(self.frame_range, textvariable=self.comment_value, width=30)
+        self.button_stage = tk.Button(self.frame_range, text='Stage', command=self.stage)
+
+        self.frame_grid = tk.Frame(self)
+        self.vscroll_grid = tk.Scrollbar(self.frame_grid, orient=tk.VERTICAL)
+        self.canvas_grid = tk.Canvas(self.frame_grid, height=GRID_HEIGHT, highlightthickness=0,
+                                     yscrollcommand=self.vscroll_grid.set)
+        self.vscroll_grid.configure(command=self.canvas_grid.yview)
+        self.frame_staged = tk.Frame(self.canvas_grid)
+        self.canvas_grid.create_window(0, 0, window=self.frame_staged, anchor=tk.NW)
+        self.frame_staged.bind('<Configure>', self.resize_grid)
+        for column, title in enumerate(('Save', 'Date', 'Intensity', 'Migraine', 'Medicine', 'Comment', '')):
+            tk.Label(self.frame_staged, text=title).grid(row=0, column=column, sticky=tk.W, padx=2)
+
+        self.check_replace = tk.Checkbutton(self, text='Replace the dates already filled',
+                                            variable=self.replace_value, command=self.replace_changed)
+        self.button_save = tk.Button(self, text='Save', command=self.save)
+        self.button_close = tk.Button(self, text='Close', command=self.destroy)
+        self.separator = ttk.Separator(self, orient=tk.HORIZONTAL)
+        self.label_status = tk.Label(self, text='Choose the range of dates and their values, then click on Stage.')
+
+        self.balloon = tix.Balloon(self.master)
+
+        self.balloon.bind_widget(self.button_stage,
+                                 balloonmsg='Add every date of the range to the grid below, with these values,\n'
+                                            'which can then be changed for each day.')
+        self.balloon.bind_widget(self.check_replace,
+                                 balloonmsg='Overwrite the values of the dates already filled, instead of\n'
+                                            'leaving them out of the batch.')
+        self.balloon.bind_widget(self.button_save,
+                                 balloonmsg='Save every marked date of the grid at once.')
+
+        # widgets manipulation on window startup
+        self.button_save.configure(state=tk.DISABLED)
+        self.button_save.configure(background=DISABLED_BUTTON_BKGRND)
+
+        # row and column configuration
+        self.rowconfigure(0, weight=0)
+        self.rowconfigure(1, weight=1)
+        self.rowconfigure(2, weight=0)
+        self.rowconfigure(3, weight=0)
+        self.rowconfigure(4, weight=0)
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(1, weight=0)
+        self.columnconfigure(2, weight=0)
+        self.frame_grid.rowconfigure(0, weight=1)
+        self.frame_grid.columnconfigure(0, weight=1)
+
+        # widget deployment
+        self.frame_range.grid(row=0, column=0, sticky=tk.W + tk.E, padx=5, pady=5, columnspan=3)
+        self.label_start.grid(row=0, column=0, sticky=tk.W)
+        self.entry_start.grid(row=0, column=1, sticky=tk.W, padx=2)
+        self.label_end.grid(row=0, column=2, sticky=tk.W)
+        self.entry_end.grid(row=0, column=3, sticky=tk.W, padx=2)
+        self.button_stage.grid(row=0, column=6, sticky=tk.E, padx=2)
+        self.label_intensity.grid(row=1, column=0, sticky=tk.W)
+        self.combo_headache.grid(row=1, column=1, sticky=tk.W + tk.E, padx=2)
+        self.check_migraine.grid(row=1, column=2, sticky=tk.W)
+        self.check_medicine.grid(row=1, column=3, sticky=tk.W)
+        self.label_comment.grid(row=1, column=4, sticky=tk.W)
+        self.entry_comment.grid(row=1, column=5, sticky=tk.W + tk.E, padx=2, columnspan=2)
+        self.frame_grid.grid(row=1, column=0, sticky=tk.W + tk.E + tk.N + tk.S, padx=5, columnspan=3)
+        self.canvas_grid.grid(row=0, column=0, sticky=tk.W + tk.E + tk.N + tk.S)
+        self.vscroll_grid.grid(row=0, column=1, sticky=tk.N + tk.S)
+        self.check_replace.grid(row=2, column=0, sticky=tk.W, pady=5, padx=5)
+        self.button_close.grid(row=2, column=1, sticky=tk.E, pady=5, padx=5)
+        self.button_save.grid(row=2, column=2, sticky=tk.E, pady=5, padx=5)
+        self.separator.grid(row=3, column=0, sticky=tk.W + tk.E, columnspan=3)
+        self.label_status.grid(row=4, column=0, sticky=tk.W, columnspan=3)
+
+    def resize_grid(self, event):
+        self.canvas_grid.configure(scrollregion=self.canvas_grid.bbox(tk.ALL), width=event.width)
+
+    def stage(self):
+        """Fill the grid with the dates of the range, then look for the ones already filled in a single query."""
+        try:
+            start = date.fromisoformat(self.start_value.get().strip())
+            end = date.fromisoformat(self.end_value.get().strip())
+        except ValueError:
+            self.label_status.configure(text='( X ) The dates must be written as YYYY-MM-DD.')
+            return
+        days = (end - start).days + 1
+        if days < 1:
+            self.label_status.configure(text='( X ) The range ends before it starts.')
+            return
+        if days > MAX_DAYS:
+            self.label_status.configure(text='( X ) At most {} dates can be staged at once.'.format(MAX_DAYS))
+            return
+        self.clear()
+        for day in range(days):
+            self.staged.append(StagedDate(self.frame_staged, day + 1, (start + timedelta(days=day)).isoformat(),
+                                          self.list_value_headache.get(), self.check_migraine_value.get(),
+                                          self.check_medicine_value.get(), self.comment_value.get()))
+        self.canvas_grid.yview_moveto(0)
+        self.label_status.configure(text='Looking for the dates already filled...')
+        self.worker.submit(storage.Storage.existing_dates, [staged.date for staged in self.staged],
+                           callback=self.filled_found, errback=self.save_failed)
+
+    def filled_found(self, existing):
+        if not self.winfo_exists():
+            return
+        for staged in self.staged:
+            if staged.date in existing:
+                staged.mark_filled(self.replace_value.get())
+        text = '{} dates staged'.format(len(self.staged))
+        if existing:
+            text += ', {} of them already filled'.format(len(existing))
+        self.label_status.configure(text=text + '.')
+        self.button_save.configure(state=tk.NORMAL)
+        self.button_save.configure(background=ENABLED_BUTTON_BKGRND)
+
+    def replace_changed(self):
+        for staged in self.staged:
+            if staged.filled:
+                staged.include_value.set(self.replace_value.get())
+
+    def save(self):
+        entries = [staged.entry() for staged in self.staged if staged.include_value.get()]
+        if not entries:
+            self.label_status.configure(text='( X ) No date is marked to be saved.')
+            return
+        self.button_save.configure(state=tk.DISABLED)
+        self.button_save.configure(background=DISABLED_BUTTON_BKGRND)
+        self.label_status.configure(text='Saving {} dates...'.format(len(entries)))
+        self.worker.submit(storage.Storage.save_batch, entries, self.replace_value.get() == 1,
+                           callback=self.saved, errback=self.save_failed)
+
+    def saved(self, count):
+        if self.on_saved is not None:
+            self.on_saved()
+        if self.winfo_exists():
+            self.clear()
+            self.label_status.configure(text='( ! ) {} dates saved successfully!'.format(count))
+
+    def save_failed(self, error):
+        if not self.winfo_exists():
+            return
+        if isinstance(error, storage.DatesConflict):  # filled in the meantime, e.g. from the command line
+            for staged in self.staged:
+                if staged.date in error.dates:
+                    staged.mark_filled(False)
+        self.button_save.configure(state=tk.NORMAL)
+        self.button_save.configure(background=ENABLED_BUTTON_BKGRND)
+        self.label_status.configure(text='( X ) The dates could not be saved: ' + str(error))
+
+    def clear(self):
+        for staged in self.staged:
+            staged.destroy()
+        self.staged = list()
+        self.button_save.configure(state=tk.DISABLED)
+        self.button_save.configure(background=DISABLED_BUTTON_BKGRND)
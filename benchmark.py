@@ -0,0 +1,890 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3 as sql
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date  # synthetic dates end today
+from datetime import timedelta  # some date calculations
+import storage
+import export
+import importer
+import migrations
+import synthetic  # synthetic diaries
+import analytics
+import __init__  # to get the application version
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+SHAPE = dict()  # keyword arguments of synthetic.entries(), from the command line
+REGRESSIONS = list()  # the new paths measured slower than the legacy ones; main() then fails
+REGRESSION_TOLERANCE = 1.1  # slower by more than this factor is a regression, below it is noise
+REGRESSION_MARGIN = 0.05  # milliseconds below which a difference is the noise of the clock, whatever the factor
+RESULTS = list()  # every row of every table, written by --json
+
+
+def create_synthetic_diary(path, rows, seed=0, profile=storage.DEFAULT_PROFILE, patients=1):
+    """Create a database at path filled with rows synthetic entries of the shape given on the command line."""
+    return synthetic.create_diary(path, rows, seed, profile, patients, **SHAPE)
+
+
+class Table:
+    """
+    Print the rows of a benchmark as aligned columns, and keep them for the JSON results. Each column is a
+    (title, format) pair, with an optional suffix printed after the value, e.g. ('speedup', '>9.2f', 'x').
+    """
+
+    def __init__(self, benchmark, *columns):
+        self.benchmark = benchmark
+        self.columns = columns
+        print(''.join('{:{}{}}'.format(column[0], column[1][0], self.width(column)) for column in columns))
+
+    @staticmethod
+    def width(column):
+        return int(re.match(r'[<>](\d+)', column[1]).group(1)) + len(column[2] if len(column) > 2 else '')
+
+    def row(self, *values):
+        print(''.join(format(value, column[1]) + (column[2] if len(column) > 2 else '')
+                      for column, value in zip(self.columns, values)))
+        result = dict(benchmark=self.benchmark)
+        result.update((column[0].replace(' ', '_'), value) for column, value in zip(self.columns, values))
+        RESULTS.append(result)
+
+
+def legacy_search_report(db, report_filter, ord='ASC'):
+    """The report query as it used to be: a count(*) followed by the select, with str/int round-trips."""
+    start = None
+    if report_filter[0] == '1':  # last 31 days
+        start = (date.today() + timedelta(days=-31)).isoformat()
+    elif report_filter[0] == '2':  # this month, without upper bound
+        start = date.today().isoformat()[:7]
+    if start is None:
+        quantity = db.execute('select count(*) from headache where patient_id = ?', (storage.DEFAULT_PATIENT_ID,))
+        quantity = str(quantity.fetchall()[0][0])
+        cursor = db.execute('select * from headache where patient_id = ? order by date {ord}'.format(ord=ord),
+                            (storage.DEFAULT_PATIENT_ID,))
+    else:
+        quantity = db.execute('select count(*) from headache where patient_id = ? and date >= ?',
+                              (storage.DEFAULT_PATIENT_ID, start))
+        quantity = str(quantity.fetchall()[0][0])
+        cursor = db.execute('select * from headache where patient_id = ? and date >= ? order by date {ord}'.
+                            format(ord=ord), (storage.DEFAULT_PATIENT_ID, start))
+    rows = cursor.fetchall()
+    return rows, int(quantity)
+
+
+def measure(function, repeat):
+    """Return the best wall time, in milliseconds, of repeat calls of function."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - start) * 1000
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def latencies(function, calls):
+    """Return the median and 95th percentile latency, in microseconds, of function(*arguments) for each of calls."""
+    elapsed = list()
+    for arguments in calls:
+        start = time.perf_counter()
+        function(*arguments)
+        elapsed.append((time.perf_counter() - start) * 1000000)
+    elapsed.sort()
+    return len(elapsed), elapsed[len(elapsed) // 2], elapsed[min(len(elapsed) - 1, len(elapsed) * 95 // 100)]
+
+
+def bench_hot_paths(sizes, repeat):
+    """
+    What each action of the windows costs in the storage layer, so that it runs without a display: the Save button
+    (MainForm.save_value), the check of each date change (validate_date), each report filter (Report.search_data:
+    the count and the first page), the txt export and its line breaking, and the Save of the maintenance window.
+    """
+    visible_rows = 25
+    table = Table('hot_paths', ('rows', '<10'), ('path', '<32'), ('calls', '>8'), ('median us', '>14.1f'),
+                  ('p95 us', '>14.1f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            generator = random.Random(0)
+            first, last = db.connection.execute('select min(date), max(date) from headache').fetchone()
+            first, last = date.fromisoformat(first), date.fromisoformat(last)
+            span = (last - first).days
+            new_dates = [((last + timedelta(days=day)).isoformat(), 1, 0, 0, None) for day in range(1, 201)]
+            table.row(size, 'save_value', *latencies(db.insert, new_dates))
+            dates = [((first + timedelta(days=generator.randint(-10, span + 10))).isoformat(),) for _ in range(10000)]
+            table.row(size, 'validate_date', *latencies(db.exists, dates))
+            for report_filter in storage.REPORT_FILTERS:
+                def search_data():
+                    db.pagers.clear()
+                    return db.pager(report_filter).rows(0, visible_rows)
+
+                table.row(size, 'search_data ' + report_filter, *latencies(search_data, [()] * repeat))
+            comments = [(i[5], export.COLUMN_SIZE) for i in db.report('3 - everything') if i[5] is not None]
+            table.row(size, 'breaklines', *latencies(export.breaklines, comments[:10000]))
+            path = os.path.join(folder, 'report.txt')
+            table.row(size, 'export_to_txt', *latencies(export.export_txt, [(db, path, '3 - everything')] * repeat))
+            updates = [(full_date, 2, 1, 1, 'updated\n') for full_date, in generator.sample(dates, 200)
+                       if db.exists(full_date)]
+            table.row(size, 'Maintenance.save_data', *latencies(db.update, updates))
+            db.close()
+
+
+def check_speedup(name, before, after):
+    """Warn when the new path, measured in after, is slower than the legacy one, measured in before."""
+    if after > before * REGRESSION_TOLERANCE and after - before > REGRESSION_MARGIN:
+        REGRESSIONS.append(name)
+        print('warning: {} is slower than before ({:.2f} ms against {:.2f} ms)'.format(name, after, before),
+              file=sys.stderr)
+
+
+def bench_report_query(sizes, repeat):
+    table = Table('report_query', ('rows', '<10'), ('filter', '<20'), ('before ms', '>12.2f'), ('after ms', '>12.2f'),
+                  ('speedup', '>9.2f', 'x'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            for report_filter in storage.REPORT_FILTERS:
+                before = measure(lambda: legacy_search_report(db.connection, report_filter), repeat)
+                after = measure(lambda: len(db.search_report(report_filter)), repeat)
+                table.row(size, report_filter, before, after, before / after)
+                check_speedup('report_query {} at {} rows'.format(report_filter, size), before, after)
+            db.close()
+
+
+def bench_report_pages(sizes, repeat):
+    """Latency of what the report window does per frame: open a filter and scroll through it."""
+    visible_rows = 25
+    table = Table('report_pages', ('rows', '<10'), ('filter', '<20'), ('open ms', '>12.2f'),
+                  ('scroll max ms', '>16.2f'), ('jump max ms', '>14.2f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            generator = random.Random(0)
+            for report_filter in storage.REPORT_FILTERS:
+                pager = None
+
+                def open_report():
+                    nonlocal pager
+                    db.pagers.clear()
+                    pager = db.pager(report_filter)
+                    pager.rows(0, visible_rows)
+
+                opening = measure(open_report, repeat)
+                scroll = 0
+                for offset in range(0, min(pager.total, 20000), 3):
+                    scroll = max(scroll, measure(lambda: pager.rows(offset, visible_rows), 1))
+                jump = 0
+                for _ in range(100):
+                    offset = generator.randint(0, pager.total)
+                    jump = max(jump, measure(lambda: pager.rows(offset, visible_rows), 1))
+                table.row(size, report_filter, opening, scroll, jump)
+            db.close()
+
+
+def client_side_filter(db, report_filter):
+    """Read every row and keep the ones matching report_filter in python, as a report without filter push-down."""
+    comment = None if report_filter.comment is None else report_filter.comment.lower()
+    return [i for i in db.execute('select * from headache order by date')
+            if (report_filter.start is None or i[1] >= report_filter.start) and
+            (report_filter.end is None or i[1] <= report_filter.end) and
+            i[2] >= report_filter.min_intensity and (not report_filter.migraine or i[3]) and
+            (not report_filter.medicine or i[4]) and
+            (comment is None or (i[5] is not None and comment in i[5].lower()))]
+
+
+def bench_filters(sizes, repeat):
+    """Slices of a diary, filtered in python after reading everything vs. pushed down into the query."""
+    today = date.today()
+    filters = (
+        ('one year', storage.ReportFilter(today.replace(year=today.year - 1), today)),
+        ('strong migraines', storage.ReportFilter(min_intensity=3, migraine=True)),
+        ('year + medicine', storage.ReportFilter(today.replace(year=today.year - 1), None, 2, medicine=True)),
+        ('comment "wine"', storage.ReportFilter(comment='wine')),
+    )
+    table = Table('filters', ('rows', '<10'), ('filter', '<20'), ('items', '>10'), ('before ms', '>12.2f'),
+                  ('after ms', '>12.2f'), ('speedup', '>9.2f', 'x'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            for name, report_filter in filters:
+                items = len(db.search_report(report_filter))
+                if items != len(client_side_filter(db.connection, report_filter)):
+                    raise AssertionError('{}: the filters disagree'.format(name))
+                before = measure(lambda: client_side_filter(db.connection, report_filter), repeat)
+                after = measure(lambda: len(db.search_report(report_filter)), repeat)
+                table.row(size, name, items, before, after, before / after)
+            db.close()
+
+
+def bench_search(sizes, repeat):
+    """A word found in 1% of the comments: LIKE scan of every comment vs. the full-text index."""
+    table = Table('search', ('rows', '<10'), ('items', '>10'), ('like ms', '>12.2f'), ('fts ms', '>12.2f'),
+                  ('ranked ms', '>14.2f'), ('speedup', '>9.2f', 'x'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            with db.transaction():
+                db.connection.execute("update headache set comment = comment || ' ibuprofen' "
+                                      "where comment is not null and _id % 30 = 0")
+            like = storage.ReportFilter(comment='ibuprofen')
+            full_text = storage.ReportFilter(search='ibuprofen')
+            items = len(db.search_report(full_text))
+            before = measure(lambda: len(db.search_report(like)), repeat)
+            after = measure(lambda: len(db.search_report(full_text)), repeat)
+            ranked = measure(lambda: len(db.search_comments('ibuprofen')), repeat)
+            table.row(size, items, before, after, ranked, before / after)
+            db.close()
+
+
+def bench_patients(sizes, repeat):
+    """Queries of a single patient, alone in the database vs. sharing it with 99 others (same rows each)."""
+    patients = 100
+    table = Table('patients', ('rows', '<10'), ('patients', '<10'), ('report ms', '>12.2f'), ('page ms', '>12.2f'),
+                  ('dates ms', '>12.2f'), ('stats ms', '>12.2f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            for count in (1, patients):
+                path = os.path.join(folder, 'diary_{}_{}.db'.format(size, count))
+                db = create_synthetic_diary(path, size // patients * count, patients=count)
+                report = measure(lambda: len(db.search_report('1 - last 31 days')), repeat)
+
+                def page():
+                    db.pagers.clear()
+                    return db.pager('3 - everything').rows(0, 25)
+
+                page = measure(page, repeat)
+
+                def dates():
+                    db.dates = None
+                    db.filled_dates()
+
+                loading = measure(dates, repeat)
+                stats = measure(lambda: db.statistics('month'), repeat)
+                table.row(size // patients * count, count, report, page, loading, stats)
+                db.close()
+
+
+def bench_migration(sizes, repeat):
+    """
+    Migration of a diary of version 1 (a single diary per database, without index, aggregates nor full-text
+    index) to the current schema: its duration, the longest time between two batches or migrations (during which
+    the database is locked for writing), and the cost of the check on an up to date database.
+    """
+    table = Table('migration', ('rows', '<10'), ('migrate ms', '>14.0f'), ('longest lock ms', '>18.0f'),
+                  ('current us', '>14.2f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = storage.Storage(os.path.join(folder, 'diary_{}.db'.format(size)))
+            migrations.migrate(db, target=1)
+            db.connection.executemany('insert into headache (date, intensity, migraine, medicine, comment) '
+                                      'values (?, ?, ?, ?, ?)', synthetic.entries(size, **SHAPE))
+            db.connection.commit()
+            last = time.perf_counter()
+            longest = 0
+
+            def progress(description, done, total):
+                nonlocal last, longest
+                now = time.perf_counter()
+                longest = max(longest, now - last)
+                last = now
+
+            start = time.perf_counter()
+            db.initialize(progress)
+            end = time.perf_counter()
+            longest = max(longest, end - last)
+            current = measure(lambda: [migrations.migrate(db) for _ in range(1000)], repeat)
+            table.row(size, (end - start) * 1000, longest * 1000, current)
+            db.close()
+
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+LEGACY_IMPORTS = ('import tkinter, tkinter.ttk, tkinter.filedialog, tkinter.messagebox, tkinter.simpledialog, '
+                  'tkinter.tix, storage, export, worker, report')  # what main.py imported before it was lazy
+
+
+def run_python(repeat, *args, env=None):
+    """Return the best wall time, in milliseconds, and the stderr of the best of repeat runs of python args."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run((sys.executable,) + args, cwd=FOLDER, env=env, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, universal_newlines=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if process.returncode != 0:
+            return None, process.stderr
+        if best is None or elapsed < best[0]:
+            best = elapsed, process.stderr
+    return best
+
+
+def startup_times(stderr):
+    """Return the times printed by main.py with HEADACHE_DIARY_STARTUP, by event."""
+    times = dict()
+    for line in stderr.splitlines():
+        event, separator, value = line.rpartition(': ')
+        if separator and value.endswith(' ms'):
+            times[event] = float(value[:-3])
+    return times
+
+
+def bench_startup(sizes, repeat):
+    """
+    Start of the application: the imports of the main window, before and after they were made lazy (interpreter
+    start included), then the time until its first frame and until the diary is loaded, measured by main.py itself.
+    The windows need a display; without one only the imports are measured.
+    """
+    before = run_python(repeat, '-c', LEGACY_IMPORTS)[0]
+    after = run_python(repeat, '-c', 'import main')[0]
+    Table('startup', ('imports', '<10'), ('before ms', '>12.1f'), ('after ms', '>12.1f')).row('main', before, after)
+    if os.name != 'nt' and not os.environ.get('DISPLAY'):
+        print('no display: the windows are not measured')
+        return
+    table = Table('startup', ('rows', '<10'), ('first frame ms', '>16.1f'), ('diary loaded ms', '>18.1f'),
+                  ('total ms', '>12.1f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            path = os.path.join(folder, 'diary_{}.db'.format(size))
+            create_synthetic_diary(path, size).close()
+            env = dict(os.environ, HEADACHE_DIARY_STARTUP='exit', HEADACHE_DIARY_DATABASE=path)
+            total, stderr = run_python(repeat, 'main.py', env=env)
+            if total is None:
+                print('{:<10}{}'.format(size, stderr.strip().splitlines()[-1]))
+                continue
+            times = startup_times(stderr)
+            table.row(size, times['first frame'], times['diary loaded'], total)
+
+
+def bench_chart(sizes, repeat):
+    """The chart of the report: each filter summarized by the database, then read again from the cache."""
+    table = Table('chart', ('rows', '<10'), ('filter', '<20'), ('columns', '>10'), ('query ms', '>12.2f'),
+                  ('cached us', '>12.2f'), ('read rows ms', '>14.2f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            for report_filter in storage.REPORT_FILTERS:
+                def query():
+                    db.charts.clear()
+                    return db.chart(report_filter)
+
+                columns = len(query().columns)
+                before = measure(lambda: db.search_report(report_filter), repeat)  # what a chart of every row reads
+                after = measure(query, repeat)
+                cached = measure(lambda: [db.chart(report_filter) for _ in range(1000)], repeat)
+                table.row(size, report_filter, columns, after, cached, before)
+            db.close()
+
+
+def bench_report_cache(sizes, repeat):
+    """
+    Filtering again and reversing the report, as a user toggling between the filters does: its count and first page
+    read by the database each time, or from the cache of the pagers.
+    """
+    visible_rows = 25
+    table = Table('report_cache', ('rows', '<10'), ('filter', '<20'), ('order', '<7'), ('query ms', '>12.2f'),
+                  ('cached us', '>12.2f'), ('speedup', '>10.1f', 'x'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            for report_filter in storage.REPORT_FILTERS:
+                for ord in storage.ORDERS:
+                    def query():
+                        db.pagers.clear()
+                        return db.pager(report_filter, ord).rows(0, visible_rows)
+
+                    def reverse():
+                        # the other order first, so that this one is read through the pages of the cached pager
+                        db.pager(report_filter, 'DESC' if ord == 'ASC' else 'ASC').rows(0, visible_rows)
+                        return db.pager(report_filter, ord).rows(0, visible_rows)
+
+                    assert query() == reverse()
+                    after = measure(query, repeat)
+                    db.pager(report_filter, ord).rows(0, visible_rows)
+                    cached = measure(lambda: [db.pager(report_filter, ord).rows(0, visible_rows)
+                                              for _ in range(1000)], repeat)
+                    table.row(size, report_filter, ord, after, cached, after * 1000 / cached)
+            hits, misses, bytes_ = db.pager_cache()
+            print('{:<10}cache: {} hits, {} misses, {:.0f} KiB'.format(size, hits, misses, bytes_ / 1024))
+            db.close()
+
+
+def bench_analytics(sizes, repeat):
+    """Trends of a diary computed with NumPy (when installed) vs. the array module, shared by 100 patients or not."""
+    table = Table('analytics', ('rows', '<10'), ('patients', '<10'), ('numpy', '<7'), ('load ms', '>10.1f'),
+                  ('rolling ms', '>12.2f'), ('streaks ms', '>12.2f'), ('overuse ms', '>12.2f'),
+                  ('weekdays ms', '>13.2f'))
+    backends = (True, False) if analytics.load_numpy() is not None else (False,)
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            for patients in (1, 100):
+                db = create_synthetic_diary(os.path.join(folder, 'diary_{}_{}.db'.format(size, patients)), size,
+                                            patients=patients)
+                for vectorized in backends:
+                    every = dict()
+
+                    def load():
+                        every.update(analytics.load_every(db, vectorized))
+
+                    def compute(name):
+                        def run():
+                            for series in every.values():
+                                series.dense = None  # the daily grid is built again, as for a new Series
+                                getattr(series, name)()
+                        return measure(run, repeat)
+
+                    loading = measure(load, repeat)
+                    table.row(size, patients, 'yes' if vectorized else 'no', loading,
+                              compute('rolling_average') + compute('headache_frequency'),
+                              compute('longest_streak') + compute('current_streak'), compute('overuse'),
+                              compute('weekdays'))
+                db.close()
+
+
+def legacy_breaklines(message, column_size):
+    """Report.breaklines as it used to be, rebuilding the comment by string concatenation."""
+    if len(message) > column_size:
+        array = message.split()
+        lenght = -1
+        count = -1
+        for word in array:
+            count += 1
+            lenght += len(word) + 1
+            if lenght > column_size:
+                array[count - 1] += '\n'
+                lenght = 0
+                lenght += len(array[count]) + 1
+        postmessage = ''
+        for word in array:
+            if str(word).find('\n') < 0:
+                postmessage += word + ' '
+            else:
+                postmessage += word
+        return postmessage + '\n'
+    else:
+        return message
+
+
+def legacy_export_txt(db, path, report_filter):
+    """The txt export as it used to be: every row held in memory, then written one line at a time."""
+    report_data = [(i[1], i[2], i[3], i[4], i[5]) for i in db.report(report_filter).fetchall()]
+    with open(path, 'w') as file:
+        for i in report_data:
+            file.write('{a:.<{width}}{b:.>{width}}{c:.>{width}}{d:.>{width}}\n'.
+                       format(a=i[0], b=i[1], c=i[2], d=i[3], width=30))
+            if i[4] is not None:
+                file.write('Comments:\n{e}'.format(e=legacy_breaklines(i[4], export.COLUMN_SIZE)))
+                file.writelines('\n')
+
+
+def bench_export_txt(sizes, repeat):
+    table = Table('export_txt', ('rows', '<10'), ('before ms', '>12.2f'), ('after ms', '>12.2f'),
+                  ('speedup', '>9.2f', 'x'), ('after peak KiB', '>16.0f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            path = os.path.join(folder, 'report.txt')
+            report_filter = storage.REPORT_FILTERS[2]
+            before = measure(lambda: legacy_export_txt(db, path, report_filter), repeat)
+            after = measure(lambda: export.export_txt(db, path, report_filter), repeat)
+            tracemalloc.start()
+            export.export_txt(db, path, report_filter)
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+            table.row(size, before, after, before / after, peak)
+            db.close()
+
+
+def traced_memory(function):
+    """Return the result of function and the bytes it holds once it returned, as traced by tracemalloc."""
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = function()
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return result, held
+
+
+def bench_rows(sizes, repeat):
+    """Memory and time of every row of a diary loaded as tuples, as Row objects, and as the columns of Rows."""
+    loaders = (
+        ('tuples', lambda db: db.report('3 - everything').fetchall()),
+        ('Row', lambda db: list(itertools.starmap(storage.Row, db.report('3 - everything')))),
+        ('Rows', lambda db: storage.Rows.of(db.report('3 - everything'))),
+    )
+    table = Table('rows', ('rows', '<10'), ('model', '<8'), ('load ms', '>12.1f'), ('memory KiB', '>14.0f'),
+                  ('bytes/row', '>11.1f'), ('vs tuples', '>11.2f', 'x'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            tuples = None
+            for model, load in loaders:
+                elapsed = measure(lambda: load(db), repeat)
+                rows, held = traced_memory(lambda: load(db))
+                tuples = tuples or held
+                table.row(size, model, elapsed, held / 1024, held / len(rows), tuples / held)
+                del rows
+            db.close()
+
+
+def bench_export_formats(sizes, repeat):
+    """Throughput of each export format, streaming every row of the diary."""
+    table = Table('export_formats', ('rows', '<10'), ('format', '<10'), ('export ms', '>12.2f'), ('rows/s', '>14.0f'),
+                  ('MB/s', '>9.1f'), ('size KiB', '>12.0f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            for name, (function, extension) in export.FORMATS.items():
+                path = os.path.join(folder, 'export' + extension)
+                elapsed = measure(lambda: export.export(db, path, storage.ReportFilter(), format=name), repeat)
+                length = os.path.getsize(path)
+                table.row(size, name, elapsed, size / elapsed * 1000, length / elapsed / 1000, length / 1024)
+            db.close()
+
+
+def bench_export_many(sizes, repeat):
+    """Export of 8 diaries sharing the rows, one after the other vs. in the pool of processes of export_many()."""
+    diaries = 8
+    table = Table('export_many', ('rows', '<10'), ('format', '<10'), ('serial ms', '>12.0f'), ('pool ms', '>12.0f'),
+                  ('speedup', '>9.2f', 'x'), ('rows/s', '>14.0f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            paths = list()
+            for diary in range(diaries):
+                paths.append(os.path.join(folder, 'diary_{}_{}.db'.format(size, diary)))
+                create_synthetic_diary(paths[-1], size // diaries, seed=diary).close()
+            output = os.path.join(folder, 'exports')
+            os.makedirs(output, exist_ok=True)
+            for name in ('csv', 'columnar'):
+                serial = measure(lambda: [export.export_diary(path, output, name) for path in paths], repeat)
+                pool = measure(lambda: export.export_many(paths, output, name), repeat)
+                table.row(size, name, serial, pool, serial / pool, size / pool * 1000)
+
+
+def bench_batch_entry(sizes, repeat):
+    """Backfill of a range of dates: one insert and commit per date, like the Save button, vs. save_batch()."""
+    table = Table('batch_entry', ('rows', '<10'), ('dates', '<8'), ('per date ms', '>14.1f'), ('batch ms', '>12.1f'),
+                  ('speedup', '>9.2f', 'x'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            last = date.fromisoformat(db.connection.execute('select max(date) from headache').fetchone()[0])
+            for days in (7, 31, 365):
+                entries = [((last + timedelta(days=day)).isoformat(), 1, 0, 0, None) for day in range(1, days + 1)]
+
+                def one_by_one():
+                    if db.existing_dates(entry[0] for entry in entries):
+                        raise ValueError('the dates are already filled')
+                    for entry in entries:
+                        db.insert(*entry)
+
+                def saved(function):
+                    """Best time of function, the backfilled dates being removed before each run."""
+                    best = None
+                    for _ in range(repeat):
+                        db.connection.execute('delete from headache where date > ?', (last.isoformat(),))
+                        db.connection.commit()
+                        db.dates = None
+                        elapsed = measure(function, 1)
+                        best = elapsed if best is None else min(best, elapsed)
+                    return best
+
+                before = saved(one_by_one)
+                after = saved(lambda: db.save_batch(entries))
+                table.row(size, days, before, after, before / after)
+            db.close()
+
+
+async def http_get(reader, writer, target, headers=''):
+    """Send a GET on a kept-alive connection and read the whole response; return its status, ETag and body size."""
+    writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\n{}\r\n'.format(target, headers).encode('latin-1'))
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').lower()
+    etag = re.search(r'\netag: (.*)\r', head)
+    size = 0
+    if not head.startswith('http/1.1 304'):
+        size = int(re.search(r'content-length: (\d+)', head).group(1))
+        await reader.readexactly(size)
+    return int(head[9:12]), etag.group(1) if etag else None, size
+
+
+async def http_clients(port, target, clients, requests, revalidate=False):
+    """
+    Run clients concurrent connections, each sending requests GETs of target one after the other (revalidating the
+    ETag of the first response, when asked). target may also be a function of the number of the client.
+    Return the latency of each request, in milliseconds, and the bytes read.
+    """
+    elapsed = list()
+    read = [0]
+
+    async def client(number):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=1024 * 1024)
+        headers = ''
+        for _ in range(requests):
+            start = time.perf_counter()
+            status, etag, size = await http_get(reader, writer, target(number) if callable(target) else target,
+                                                headers)
+            elapsed.append((time.perf_counter() - start) * 1000)
+            read[0] += size
+            if status not in (200, 304):
+                raise RuntimeError('{} answered {}'.format(target, status))
+            if revalidate:
+                headers = 'If-None-Match: {}\r\n'.format(etag)
+        writer.close()
+        await writer.wait_closed()
+
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    return elapsed, read[0]
+
+
+def bench_server(sizes, repeat):
+    """
+    Requests per second and latency of server.py, run in a process of its own, under hundreds of concurrent
+    clients kept alive: small JSON responses, their revalidation (304), the same range requested by every client
+    (answered from the cache of the server after the first one), a different range per request, and the export
+    of a whole diary.
+    """
+    table = Table('server', ('rows', '<10'), ('request', '<22'), ('clients', '>8'), ('requests', '>10'),
+                  ('req/s', '>10.0f'), ('MB/s', '>8.1f'), ('p50 ms', '>9.2f'), ('p95 ms', '>9.2f'))
+    def month_of(request):
+        """Return the target of the entries of the month ending request days ago (within 10 years)."""
+        end = date.today() + timedelta(days=-(request % 3650))
+        return '/api/entries?from={}&to={}'.format((end + timedelta(days=-30)).isoformat(), end.isoformat())
+
+    scenarios = (  # title, target, clients, requests per client, revalidate
+        ('statistics', '/api/statistics', 200, 10, False),
+        ('statistics revalidated', '/api/statistics', 200, 10, True),
+        ('entries of a month', month_of(0), 200, 10, False),
+        ('a different month each', lambda number, requests=itertools.count(): month_of(next(requests)), 200, 10,
+         False),
+        ('every entry', '/api/entries', 1, 1, False),
+        ('csv export', '/api/export.csv', 1, 1, False),
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            path = os.path.join(folder, 'diary_{}.db'.format(size))
+            create_synthetic_diary(path, size).close()
+            log = open(os.path.join(folder, 'server_{}.log'.format(size)), 'w+')  # never blocks the server
+            process = subprocess.Popen((sys.executable, os.path.join(FOLDER, 'server.py'), '--database', path,
+                                        '--port', '0'), stderr=log)
+            try:
+                started = None
+                while started is None:
+                    if process.poll() is not None:
+                        raise RuntimeError('server.py exited: ' + open(log.name).read())
+                    time.sleep(0.05)
+                    started = re.search(r'http://[^:]+:(\d+)/', open(log.name).read())
+                port = int(started.group(1))
+                for title, target, clients, requests, revalidate in scenarios:
+                    best = None
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        elapsed, read = asyncio.run(http_clients(port, target, clients, requests, revalidate))
+                        seconds = time.perf_counter() - start
+                        if best is None or seconds < best[0]:
+                            best = seconds, sorted(elapsed), read
+                    seconds, elapsed, read = best
+                    table.row(size, title, clients, len(elapsed), len(elapsed) / seconds, read / seconds / 1e6,
+                              elapsed[len(elapsed) // 2], elapsed[len(elapsed) * 95 // 100])
+            finally:
+                process.terminate()
+                process.wait()
+                log.close()
+
+
+def bench_profiles(sizes, repeat):
+    """Insert throughput (one commit per entry, like the Save button) and range query latency per profile."""
+    inserts = 1000
+    table = Table('profiles', ('rows', '<10'), ('profile', '<10'), ('inserts/s', '>14.0f'), ('31 days ms', '>16.3f'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            for profile in sorted(storage.PROFILES):
+                path = os.path.join(folder, 'diary_{}_{}.db'.format(size, profile))
+                db = create_synthetic_diary(path, size, profile=profile)
+                last = date.fromisoformat(db.connection.execute('select max(date) from headache').fetchone()[0])
+                start = time.perf_counter()
+                for day in range(1, inserts + 1):
+                    db.insert((last + timedelta(days=day)).isoformat(), 1, 0, 0, None)
+                throughput = inserts / (time.perf_counter() - start)
+                generator = random.Random(0)
+                first = date.fromisoformat(db.connection.execute('select min(date) from headache').fetchone()[0])
+                span = (last - first).days
+                latency = 0
+                for _ in range(100):
+                    begin = first + timedelta(days=generator.randint(0, span))
+                    latency += measure(lambda: db.range(begin.isoformat(),
+                                                        (begin + timedelta(days=30)).isoformat()).fetchall(),
+                                       repeat)
+                table.row(size, profile, throughput, latency / 100)
+                db.close()
+
+
+def bench_import(sizes, repeat):
+    """Bulk import of a CSV history into an empty diary, and into a full one with each policy."""
+    table = Table('import', ('rows', '<10'), ('policy', '<10'), ('import ms', '>12.0f'), ('rows/s', '>14.0f'),
+                  ('peak KiB', '>16'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            source = create_synthetic_diary(os.path.join(folder, 'source_{}.db'.format(size)), size)
+            path = os.path.join(folder, 'history_{}.csv'.format(size))
+            with open(path, 'w', newline='') as file:
+                file.write('date,intensity,migraine,medicine,comment\n')
+                for i in source.range():
+                    file.write('{},{},{},{},"{}"\n'.format(i[1], i[2], i[3], i[4], (i[5] or '').rstrip('\n')))
+            source.close()
+            for policy in ('skip', 'update'):
+                db = storage.Storage(os.path.join(folder, 'target_{}_{}.db'.format(size, policy)))
+                db.initialize()
+                start = time.perf_counter()
+                importer.import_file(db, path, policy=policy)
+                elapsed = (time.perf_counter() - start) * 1000
+                table.row(size, 'empty', elapsed, size / elapsed * 1000, '')
+                tracemalloc.start()
+                start = time.perf_counter()
+                importer.import_file(db, path, policy=policy)
+                elapsed = (time.perf_counter() - start) * 1000
+                peak = tracemalloc.get_traced_memory()[1] / 1024
+                tracemalloc.stop()
+                table.row(size, policy, elapsed, size / elapsed * 1000, round(peak))
+                db.close()
+
+
+def bench_validate_date(sizes, repeat):
+    """Cost of the check run by MainForm.validate_date on every date change: a query before, the DateIndex now."""
+    lookups = 10000
+    table = Table('validate_date', ('rows', '<10'), ('query us', '>14.2f'), ('index us', '>14.2f'),
+                  ('load ms', '>12.1f'), ('index B', '>12'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            last = date.today().toordinal()
+            generator = random.Random(0)
+            dates = [date.fromordinal(max(1, last - generator.randint(-10, size))).isoformat()
+                     for _ in range(lookups)]
+
+            def query():
+                for full_date in dates:
+                    db.connection.execute('select count(*) from headache where patient_id = ? and date = ?',
+                                          (storage.DEFAULT_PATIENT_ID, full_date)).fetchall()
+
+            def index():
+                for full_date in dates:
+                    db.exists(full_date)
+
+            def load():
+                db.dates = None
+                db.filled_dates()
+
+            loading = measure(load, repeat)
+            before = measure(query, repeat) * 1000 / lookups
+            after = measure(index, repeat) * 1000 / lookups
+            table.row(size, before, after, loading, len(db.filled_dates().bits))
+            db.close()
+
+
+def bench_statistics(sizes, repeat):
+    """Monthly statistics read from the aggregate table, against the same figures computed from every row."""
+    table = Table('statistics', ('rows', '<10'), ('scan ms', '>14.2f'), ('aggregate ms', '>16.2f'),
+                  ('speedup', '>9.2f', 'x'))
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            db = create_synthetic_diary(os.path.join(folder, 'diary_{}.db'.format(size)), size)
+            before = measure(lambda: db.connection.execute(
+                'select substr(date, 1, 7), count(*), sum(intensity > 0), round(1.0 * sum(intensity) / count(*), 2), '
+                'sum(migraine != 0), sum(medicine != 0) from headache group by 1 order by 1').fetchall(), repeat)
+            after = measure(lambda: db.statistics('month'), repeat)
+            table.row(size, before, after, before / after)
+            db.close()
+
+
+BENCHMARKS = {
+    'analytics': bench_analytics,
+    'chart': bench_chart,
+    'report_cache': bench_report_cache,
+    'hot_paths': bench_hot_paths,
+    'report_query': bench_report_query,
+    'report_pages': bench_report_pages,
+    'filters': bench_filters,
+    'search': bench_search,
+    'patients': bench_patients,
+    'migration': bench_migration,
+    'startup': bench_startup,
+    'export_txt': bench_export_txt,
+    'rows': bench_rows,
+    'server': bench_server,
+    'batch_entry': bench_batch_entry,
+    'export_formats': bench_export_formats,
+    'export_many': bench_export_many,
+    'profiles': bench_profiles,
+    'import': bench_import,
+    'validate_date': bench_validate_date,
+    'statistics': bench_statistics,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headache Diary benchmarks.')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run, among: {} (default: all)'.format(', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='amount of synthetic rows of each database')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each measurement, the best one is kept')
+    parser.add_argument('--density', type=float, default=synthetic.DENSITY,
+                        help='filled days of the synthetic diaries, from 0 to 1 (default: %(default)s)')
+    parser.add_argument('--headache-rate', type=float, default=synthetic.HEADACHE_RATE,
+                        help='days with a headache, among the filled ones (default: %(default)s)')
+    parser.add_argument('--comment-rate', type=float, default=synthetic.COMMENT_RATE,
+                        help='filled days with a comment (default: %(default)s)')
+    parser.add_argument('--comment-words', type=float, default=synthetic.COMMENT_WORDS,
+                        help='mean amount of words of a comment (default: %(default)s)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='also write the results to this JSON file, to compare them between versions')
+    args = parser.parse_args()
+    SHAPE.update(density=args.density, headache_rate=args.headache_rate, comment_rate=args.comment_rate,
+                 comment_words=args.comment_words)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {}'.format(name))
+    if not args.benchmarks:
+        args.benchmarks = sorted(BENCHMARKS)
+    for name in args.benchmarks:
+        print('== {} =='.format(name))
+        BENCHMARKS[name](args.sizes, args.repeat)
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump({'version': __init__.version, 'python': sys.version.split()[0], 'sqlite': sql.sqlite_version,
+                       'benchmarks': args.benchmarks, 'sizes': args.sizes, 'repeat': args.repeat, 'shape': SHAPE,
+                       'results': RESULTS}, file, indent=1)
+    if REGRESSIONS:
+        sys.exit('{} regression(s): {}'.format(len(REGRESSIONS), ', '.join(REGRESSIONS)))
+
+
+if __name__ == '__main__':
+    main()
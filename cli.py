@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# The command line interface never imports tkinter, so that it starts fast and runs without a display.
+
+import argparse
+import os
+import sqlite3 as sql  # database operations
+import sys
+import time
+from datetime import date  # date validation
+import __init__  # to get the application version
+import storage  # database queries
+
+
+EXPORT_FORMATS = ('txt', 'csv', 'jsonl', 'columnar')  # export.FORMATS, without importing export to build the parser
+
+
+def iso_date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid date: {} (expected YYYY-MM-DD)'.format(value))
+
+
+def intensity(value):
+    if value not in ('0', '1', '2', '3'):
+        raise argparse.ArgumentTypeError('invalid intensity: {} (expected 0, 1, 2 or 3)'.format(value))
+    return int(value)
+
+
+def report_filter(args):
+    """Return the ReportFilter of the filter options; --from and --to override the range of --filter."""
+    preset = storage.ReportFilter()
+    if args.filter is not None:
+        preset = storage.ReportFilter.preset(storage.REPORT_FILTERS[args.filter - 1])
+    return storage.ReportFilter(preset.start if args.start is None else args.start,
+                                preset.end if args.end is None else args.end,
+                                args.min_intensity, args.migraine, args.medicine, args.comment, args.search)
+
+
+def add(database, args):
+    comment = None
+    if args.comment:
+        comment = args.comment + '\n'  # stored like the comments typed in the main window
+    database.insert(args.date, args.intensity, int(args.migraine), int(args.medicine), comment)
+    print('{date} saved.'.format(date=args.date))
+
+
+def fill(database, args):
+    """Fill every date from args.start to args.end with the same values, in a single transaction."""
+    first, last = date.fromisoformat(args.start), date.fromisoformat(args.end)
+    if last < first:
+        raise ValueError('the range ends before it starts')
+    comment = args.comment + '\n' if args.comment else None  # stored like the comments typed in the main window
+    entries = [(date.fromordinal(day).isoformat(), args.intensity, int(args.migraine), int(args.medicine), comment)
+               for day in range(first.toordinal(), last.toordinal() + 1)]
+    count = database.save_batch(entries, args.replace)
+    print('{count} dates saved.'.format(count=count))
+
+
+def edit(database, args):
+    entry = database.get(args.date)
+    if entry is None:
+        raise LookupError('{date} is not filled.'.format(date=args.date))
+    # entry[0] = date; entry[1] = intensity; entry[2] = migraine; entry[3] = medicine; entry[4] = comments
+    new_intensity = entry[1] if args.intensity is None else args.intensity
+    migraine = entry[2] if args.migraine is None else int(args.migraine)
+    medicine = entry[3] if args.medicine is None else int(args.medicine)
+    comment = entry[4]
+    if args.comment is not None:
+        comment = args.comment or None
+    database.update(args.date, new_intensity, migraine, medicine, comment)
+    print('{date} updated.'.format(date=args.date))
+
+
+def query(database, args):
+    ord = 'DESC' if args.reverse else 'ASC'
+    yes_no, strip_line_break = storage.YES_NO, storage.strip_line_break
+    # the plain rows of the cursor, as the report displays them: i[1] = date; i[2] = intensity; i[3] = migraine;
+    # i[4] = medicine; i[5] = comments
+    write_rows((i[1], i[2], yes_no[i[3] != 0], yes_no[i[4] != 0], strip_line_break(i[5]) or '')
+               for i in database.report(report_filter(args), ord))
+
+
+def search(database, args):
+    write_rows(row.display() for row in database.search_comments(' '.join(args.words), report_filter(args), args.limit))
+
+
+def write_rows(rows):
+    write = sys.stdout.write
+    for full_date, intensity, migraine, medicine, comment in rows:
+        write('{}\t{}\t{}\t{}\t{}\n'.format(full_date, intensity, migraine, medicine, comment.replace('\n', ' ')))
+
+
+def statistics(database, args):
+    print('period\tdays\theadache days\taverage intensity\tmigraine days\tmedicine days')
+    for i in database.statistics(args.period, args.start, args.end):
+        print('{}\t{}\t{}\t{:.2f}\t{}\t{}'.format(*i))
+
+
+def trends(database, args):
+    import analytics  # only needed by this command
+    if args.every_patient:
+        names = dict(database.patients())
+        for patient_id, series in sorted(analytics.load_every(database).items()):
+            print('== {} =='.format(names[patient_id]))
+            print('\n'.join(analytics.describe(series)))
+    else:
+        print('\n'.join(analytics.describe(analytics.Series.load(database, args.start, args.end))))
+
+
+def throughput(rows, size, seconds):
+    seconds = max(seconds, 1e-9)
+    return '{:,.0f} rows/s, {:.1f} MB/s'.format(rows / seconds, size / seconds / 1e6)
+
+
+def export_report(database, args):
+    import export  # only needed by this command
+    ord = 'DESC' if args.reverse else 'ASC'
+    start = time.perf_counter()
+    count = export.export(database, args.path, report_filter(args), ord, args.format)
+    seconds = time.perf_counter() - start
+    print('{count} items exported to "{path}" in {seconds:.2f} s ({throughput}).'.format(
+        count=count, path=args.path, seconds=seconds,
+        throughput=throughput(count, os.path.getsize(args.path), seconds)))
+
+
+def export_many(database, args):
+    import export  # only needed by this command
+
+    def exported(results):
+        for path, rows, size, seconds in results:
+            print('{} items exported to "{}" ({}).'.format(rows, path, throughput(rows, size, seconds)))
+    start = time.perf_counter()
+    results = export.export_many(args.diaries, args.output_dir, args.format, report_filter(args), args.workers,
+                                 exported)
+    seconds = time.perf_counter() - start
+    rows = sum(result[1] for result in results)
+    print('{} items of {} diaries exported in {:.2f} s ({}).'.format(
+        rows, len(args.diaries), seconds, throughput(rows, sum(result[2] for result in results), seconds)))
+
+
+def list_patients(database, args):
+    for patient_id, name in database.patients():
+        print(name)
+
+
+def add_patient(database, args):
+    database.add_patient(args.name)
+    print('{name} added.'.format(name=args.name.strip()))
+
+
+def import_history(database, args):
+    import importer  # only needed by this command
+    summary = importer.import_file(database, args.path, args.format, args.policy)
+    print(summary)
+
+
+def add_filter_arguments(command):
+    command.add_argument('--filter', type=int, choices=(1, 2, 3),
+                         help='date range of one of the report filters: ' + ', '.join(storage.REPORT_FILTERS))
+    command.add_argument('--from', dest='start', type=iso_date, help='first date (inclusive)')
+    command.add_argument('--to', dest='end', type=iso_date, help='last date (inclusive)')
+    command.add_argument('--min-intensity', type=intensity, default=0,
+                         help='only the dates with this intensity or more')
+    command.add_argument('--migraine', action='store_true', help='only the dates connected to migraine')
+    command.add_argument('--medicine', action='store_true', help='only the dates when some medicine was taken')
+    command.add_argument('--comment', help='only the dates whose comment contains this text (ignoring the case)')
+    command.add_argument('--search', help='only the dates whose comment has all these words (full-text search)')
+
+
+def migration_progress(description, done, total):
+    if total > 0:
+        print('\rupgrading the database: {} {}%'.format(description, done * 100 // total), end='', file=sys.stderr)
+        if done == total:
+            print(file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='Headache Diary v' + __init__.version +
+                                     ' - command line interface.')
+    parser.add_argument('--database', default=storage.DEFAULT_DATABASE, help='database file (default: %(default)s)')
+    parser.add_argument('--patient', default=storage.DEFAULT_PATIENT,
+                        help='name of the patient whose diary is used (default: %(default)s)')
+    parser.add_argument('--profile', choices=sorted(storage.PROFILES), default=storage.DEFAULT_PROFILE,
+                        help='connection settings (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    command = commands.add_parser('add', help='fill a date')
+    command.add_argument('date', type=iso_date, help='date to fill, as YYYY-MM-DD')
+    command.add_argument('--intensity', type=intensity, default=0, help='headache intensity from 0 to 3')
+    command.add_argument('--migraine', action='store_true', help='the headache is connected to migraine')
+    command.add_argument('--medicine', action='store_true', help='some medicine was taken')
+    command.add_argument('--comment', help='comment of the date')
+    command.set_defaults(function=add)
+
+    command = commands.add_parser('fill', help='fill a range of dates with the same values at once')
+    command.add_argument('start', type=iso_date, help='first date to fill, as YYYY-MM-DD')
+    command.add_argument('end', type=iso_date, help='last date to fill (inclusive)')
+    command.add_argument('--intensity', type=intensity, default=0, help='headache intensity from 0 to 3')
+    command.add_argument('--migraine', action='store_true', help='the headache is connected to migraine')
+    command.add_argument('--medicine', action='store_true', help='some medicine was taken')
+    command.add_argument('--comment', help='comment of every date')
+    command.add_argument('--replace', action='store_true',
+                         help='overwrite the dates already filled (default: fail, writing nothing)')
+    command.set_defaults(function=fill)
+
+    command = commands.add_parser('edit', help='change a date already filled')
+    command.add_argument('date', type=iso_date, help='date to change, as YYYY-MM-DD')
+    command.add_argument('--intensity', type=intensity, help='headache intensity from 0 to 3')
+    command.add_argument('--migraine', action=argparse.BooleanOptionalAction, help='migraine or not')
+    command.add_argument('--medicine', action=argparse.BooleanOptionalAction, help='medicine or not')
+    command.add_argument('--comment', help='new comment of the date (an empty one removes it)')
+    command.set_defaults(function=edit)
+
+    command = commands.add_parser('query', help='print the entries matching a filter, tab separated')
+    add_filter_arguments(command)
+    command.add_argument('--reverse', action='store_true', help='most recent on top')
+    command.set_defaults(function=query)
+
+    command = commands.add_parser('search', help='print the entries whose comment has all the words, best matches '
+                                                 'first, with the words in brackets')
+    command.add_argument('words', nargs='+', help='words to find, e.g. a trigger or the name of a medicine')
+    command.add_argument('--limit', type=int, default=storage.SEARCH_LIMIT, help='(default: %(default)s)')
+    add_filter_arguments(command)
+    command.set_defaults(function=search)
+
+    command = commands.add_parser('stats', help='print the statistics of each month or week, tab separated')
+    command.add_argument('--period', choices=('month', 'week'), default='month', help='(default: %(default)s)')
+    command.add_argument('--from', dest='start', help='first period (inclusive): YYYY-MM, or the monday of a week')
+    command.add_argument('--to', dest='end', help='last period (inclusive)')
+    command.set_defaults(function=statistics)
+
+    command = commands.add_parser('trends', help='print the rolling averages, streaks, medication overuse and '
+                                                 'weekday patterns of the diary (faster with NumPy installed)')
+    command.add_argument('--from', dest='start', type=iso_date, help='first date (inclusive)')
+    command.add_argument('--to', dest='end', type=iso_date, help='last date (inclusive)')
+    command.add_argument('--every-patient', action='store_true', help='the trends of every diary of the database')
+    command.set_defaults(function=trends)
+
+    command = commands.add_parser('export', help='export the entries of a filter (default: everything) as a txt '
+                                                 'report, CSV, JSON Lines or in the columnar format')
+    command.add_argument('path', help='file to write')
+    command.add_argument('--format', choices=EXPORT_FORMATS, help='format of the file (default: from its extension, '
+                                                                  'txt when unknown)')
+    add_filter_arguments(command)
+    command.add_argument('--reverse', action='store_true', help='most recent on top')
+    command.set_defaults(function=export_report)
+
+    command = commands.add_parser('export-many', help='export every diary of many database files at once, in a pool '
+                                                      'of processes')
+    command.add_argument('diaries', nargs='+', help='database files to export')
+    command.add_argument('--output-dir', default='.', help='folder of the exported files (default: %(default)s)')
+    command.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='(default: %(default)s)')
+    command.add_argument('--workers', type=int, help='processes of the pool (default: one per processor)')
+    add_filter_arguments(command)
+    command.set_defaults(function=export_many, standalone=True)
+
+    command = commands.add_parser('import', help='import the history of another tracker from CSV or JSON Lines')
+    command.add_argument('path', help='file to read, whose records have the fields date, intensity (0 to 3), '
+                                      'migraine, medicine and comment')
+    command.add_argument('--format', choices=('csv', 'jsonl'), help='format of the file (default: from its extension)')
+    command.add_argument('--policy', choices=('skip', 'update', 'fail'), default='skip',
+                         help='what to do with the dates already filled (default: %(default)s)')
+    command.set_defaults(function=import_history)
+
+    command = commands.add_parser('patients', help='print the name of every patient')
+    command.set_defaults(function=list_patients)
+
+    command = commands.add_parser('add-patient', help='add a patient, with an empty diary')
+    command.add_argument('name', help='name of the patient')
+    command.set_defaults(function=add_patient)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'standalone', False):  # the command opens its own database files
+        try:
+            args.function(None, args)
+        except (sql.Error, LookupError, ValueError, OSError) as e:
+            print('error: {}'.format(e), file=sys.stderr)
+            return 1
+        return 0
+    database = storage.Storage(args.database, args.profile)
+    try:
+        database.initialize(migration_progress)
+        database.select_patient(args.patient)
+        args.function(database, args)
+    except (sql.Error, LookupError, ValueError, OSError) as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    finally:
+        database.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
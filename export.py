@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# Besides the txt report, meant to be read by people, the rows of a filter can be exported for other tools: as CSV and
+# JSON Lines (both in the layout read back by importer.py), and in a compact columnar binary format. Each export
+# streams the rows from the database cursor, and export_many() exports many diaries at once in a pool of processes.
+#
+# The columnar format is made of groups of up to GROUP_SIZE rows, each holding one block per column, so that a
+# reader only decodes the columns it needs; every integer is little-endian:
+#   header: COLUMNAR_MAGIC (8 bytes)
+#   group:  rows (uint32), then for each column its size in bytes (uint32) followed by its data:
+#           day ordinals (int32 per row), intensities (uint8 per row), flags (uint8 per row: 1 = migraine,
+#           2 = medicine, 4 = has a comment, 8 = the comment ends with a line break), comment ends (uint32 per row,
+#           offsets in the next block), and the comments (UTF-8, one after the other, without that line break)
+#   footer: 0 (uint32), then the total of the rows (uint64)
+# Version 1 of the format had no flag 8: every comment read from it ends with a line break.
+
+import csv
+import io
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor  # many diaries exported at once
+from datetime import date  # day ordinals of the columnar format
+from datetime import datetime  # for report footer
+import __init__  # to get the application version
+import storage  # the diaries of export_many(), and the comments as they are exported
+from instrumentation import timed  # opt-in timing of the exports
+
+COLUMN_SIZE = 120
+BUFFER_SIZE = 1024 * 1024  # bytes written to the disk at once
+PROGRESS_STEP = 10000  # rows exported between two progress notifications
+FIELDS = ('date', 'intensity', 'migraine', 'medicine', 'comment')  # of the CSV and JSON Lines exports
+COLUMNAR_MAGIC = b'HDCOL\x00\x02\x00'  # 'HDCOL', then the version of the format
+COLUMNAR_MAGIC_V1 = b'HDCOL\x00\x01\x00'  # still read, see read_columnar()
+GROUP_SIZE = 65536  # rows of a group of the columnar format
+MIGRAINE_FLAG = 1
+MEDICINE_FLAG = 2
+COMMENT_FLAG = 4
+LINE_BREAK_FLAG = 8
+
+
+def breaklines(message, column_size):
+    """Wrap a comment in lines of about column_size characters, in a single pass over its words."""
+    if len(message) <= column_size:
+        return message
+    lines = list()
+    line = list()
+    lenght = -1
+    for word in message.split():
+        lenght += len(word) + 1
+        if lenght > column_size and line:
+            lines.append(' '.join(line))
+            line = list()
+            lenght = len(word) + 1
+        line.append(word)
+    lines.append(' '.join(line))
+    return '\n'.join(lines) + ' \n'  # every line but the last ends right after its last word
+
+
+def batches(cursor, size=PROGRESS_STEP):
+    """Yield the rows of cursor in lists of up to size rows."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+# Each format is produced by a generator of chunks, each one with the amount of rows it holds, so that the same
+# encoding serves the exports to a file and the responses streamed by server.py.
+
+def txt_chunks(cursor, column_size=COLUMN_SIZE):
+    """Yield the text of the txt report of the rows of cursor, in chunks of PROGRESS_STEP rows."""
+    header = ('*'*column_size) + '\n' + '{:*^{}}'.format(' HEADACHE DIARY v' + __init__.version + ' ', column_size)
+    header += '\n' + ('*'*column_size) + '\n\n'
+    table_header = '{a:<{width}}{b:>{width}}{c:>{width}}{d:>{width}}\n'.\
+        format(a='Date:', b='Intensity:', c='Migraine:', d='Medicine:', width=int(column_size/4))
+    footer = '{:*>{}}'.format(' Generated in ' + str(str(datetime.now()).split('.')[0]) + ' ***', column_size)
+    footer += '\n{:*>{}}'.format(' Copyright (C) 2018 Gidalti Lourenço Junior ***', column_size)
+    line = '{:.<30}{:.>30}{:.>30}{:.>30}\n'.format
+
+    yield header + table_header, 0
+    for rows in batches(cursor):
+        text = list()
+        for i in rows:
+            # i[1] = date; i[2] = intensity; i[3] = migraine; i[4] = medicine; i[5] = comments
+            text.append(line(i[1], i[2], i[3], i[4]))
+            if i[5] is not None:
+                text.append('Comments:\n' + breaklines(i[5], column_size) + '\n')
+        yield ''.join(text), len(rows)
+    yield footer, 0
+
+
+def csv_chunks(cursor):
+    """Yield the rows of cursor as CSV with a header, in chunks of PROGRESS_STEP rows."""
+    file = io.StringIO(newline='')
+    writer = csv.writer(file)
+    writer.writerow(FIELDS)
+    strip_line_break = storage.strip_line_break
+    for rows in batches(cursor):
+        writer.writerows((i[1], i[2], i[3], i[4], strip_line_break(i[5]) or '') for i in rows)
+        yield file.getvalue(), len(rows)
+        file.seek(0)
+        file.truncate()
+
+
+def jsonl_chunks(cursor):
+    """Yield the rows of cursor as JSON Lines, one object per row, in chunks of PROGRESS_STEP rows."""
+    line = '{{"date": "{}", "intensity": {}, "migraine": {}, "medicine": {}, "comment": {}}}\n'.format
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    flags = ('false', 'true')
+    strip_line_break = storage.strip_line_break
+    for rows in batches(cursor):
+        yield ''.join(line(i[1], i[2], flags[i[3] != 0], flags[i[4] != 0],
+                           'null' if i[5] is None else dumps(strip_line_break(i[5]))) for i in rows), len(rows)
+
+
+def little_endian(values):
+    """Return the bytes of an array, in little-endian order."""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def columnar_chunks(cursor):
+    """Yield the bytes of the rows of cursor in the columnar format, a group of GROUP_SIZE rows per chunk."""
+    yield COLUMNAR_MAGIC, 0
+    strip_line_break = storage.strip_line_break
+    count = 0
+    for rows in batches(cursor, GROUP_SIZE):
+        days = array('i', (date.fromisoformat(i[1]).toordinal() for i in rows))
+        intensities = array('B', (i[2] for i in rows))
+        flags = array('B', ((i[3] != 0) * MIGRAINE_FLAG | (i[4] != 0) * MEDICINE_FLAG |
+                            (i[5] is not None) * COMMENT_FLAG |
+                            (i[5] is not None and i[5].endswith('\n')) * LINE_BREAK_FLAG for i in rows))
+        comments = [strip_line_break(i[5]).encode('utf-8') if i[5] is not None else b'' for i in rows]
+        ends = array('I')
+        end = 0
+        for comment in comments:
+            end += len(comment)
+            ends.append(end)
+        group = [struct.pack('<I', len(rows))]
+        for block in (little_endian(days), intensities.tobytes(), flags.tobytes(), little_endian(ends),
+                      b''.join(comments)):
+            group.append(struct.pack('<I', len(block)))
+            group.append(block)
+        count += len(rows)
+        yield b''.join(group), len(rows)
+    yield struct.pack('<IQ', 0, count), 0
+
+
+def write_chunks(file, chunks, progress=None):
+    """
+    Write the chunks of an export to file. progress, when given, is called with the amount of exported rows every
+    PROGRESS_STEP rows and at the end. Return the amount of exported rows.
+    """
+    count = 0
+    for data, rows in chunks:
+        file.write(data)
+        if rows:
+            count += rows
+            if progress is not None:
+                progress(count)
+    if progress is not None:
+        progress(count)
+    return count
+
+
+@timed('export.export_txt')
+def export_txt(database, path, report_filter, ord='ASC', column_size=COLUMN_SIZE, progress=None):
+    """
+    Write the txt report of a filter to path, streaming the rows from the database.
+    progress, when given, is called with the amount of exported rows every PROGRESS_STEP rows and at the end.
+    Return the amount of exported rows.
+    """
+    with open(path, 'w', buffering=BUFFER_SIZE) as file:
+        return write_chunks(file, txt_chunks(database.report(report_filter, ord), column_size), progress)
+
+
+@timed('export.export_csv')
+def export_csv(database, path, report_filter, ord='ASC', progress=None):
+    """Write the rows of a filter to path as CSV with a header. Return the amount of exported rows."""
+    with open(path, 'w', newline='', encoding='utf-8', buffering=BUFFER_SIZE) as file:
+        return write_chunks(file, csv_chunks(database.report(report_filter, ord)), progress)
+
+
+@timed('export.export_jsonl')
+def export_jsonl(database, path, report_filter, ord='ASC', progress=None):
+    """Write the rows of a filter to path as JSON Lines, one object per row. Return the amount of exported rows."""
+    with open(path, 'w', encoding='utf-8', buffering=BUFFER_SIZE) as file:
+        return write_chunks(file, jsonl_chunks(database.report(report_filter, ord)), progress)
+
+
+@timed('export.export_columnar')
+def export_columnar(database, path, report_filter, ord='ASC', progress=None):
+    """Write the rows of a filter to path in the columnar format. Return the amount of exported rows."""
+    with open(path, 'wb', buffering=BUFFER_SIZE) as file:
+        return write_chunks(file, columnar_chunks(database.report(report_filter, ord)), progress)
+
+
+def read_columnar(path):
+    """Yield the entries (date, intensity, migraine, medicine, comment) of a file in the columnar format."""
+    with open(path, 'rb') as file:
+        magic = file.read(len(COLUMNAR_MAGIC))
+        if magic not in (COLUMNAR_MAGIC, COLUMNAR_MAGIC_V1):
+            raise ValueError('not a columnar export: {}'.format(path))
+        # version 1 stored no flag of the line breaks, which every comment was given back
+        line_break = LINE_BREAK_FLAG if magic == COLUMNAR_MAGIC else 0
+        while True:
+            rows = struct.unpack('<I', file.read(4))[0]
+            if rows == 0:
+                return
+            blocks = list()
+            for typecode in ('i', 'B', 'B', 'I', None):
+                data = file.read(struct.unpack('<I', file.read(4))[0])
+                if typecode is None:
+                    blocks.append(data)
+                    continue
+                values = array(typecode, data)
+                if sys.byteorder == 'big' and values.itemsize > 1:
+                    values.byteswap()
+                blocks.append(values)
+            days, intensities, flags, ends, comments = blocks
+            start = 0
+            for row in range(rows):
+                comment = None
+                if flags[row] & COMMENT_FLAG:
+                    comment = comments[start:ends[row]].decode('utf-8')
+                    if not line_break or flags[row] & LINE_BREAK_FLAG:
+                        comment += '\n'
+                start = ends[row]
+                yield (date.fromordinal(days[row]).isoformat(), intensities[row], int(flags[row] & MIGRAINE_FLAG != 0),
+                       int(flags[row] & MEDICINE_FLAG != 0), comment)
+
+
+FORMATS = {  # format: (function, extension)
+    'txt': (export_txt, '.txt'),
+    'csv': (export_csv, '.csv'),
+    'jsonl': (export_jsonl, '.jsonl'),
+    'columnar': (export_columnar, '.hdcol'),
+}
+CHUNKS = {  # format: generator of the chunks of the rows of a cursor
+    'txt': txt_chunks,
+    'csv': csv_chunks,
+    'jsonl': jsonl_chunks,
+    'columnar': columnar_chunks,
+}
+
+
+def format_of(path):
+    """Return the export format of a file name from its extension, 'txt' when it is unknown."""
+    extension = os.path.splitext(path)[1].lower()
+    for name, (function, known) in FORMATS.items():
+        if extension == known:
+            return name
+    return 'txt'
+
+
+def export(database, path, report_filter, ord='ASC', format=None, progress=None):
+    """Export the rows of a filter to path in format (default: from the extension of path)."""
+    if format is None:
+        format = format_of(path)
+    if format not in FORMATS:
+        raise ValueError('invalid export format: {}'.format(format))
+    return FORMATS[format][0](database, path, report_filter, ord, progress=progress)
+
+
+def export_diary(diary, folder, format, report_filter=None):
+    """
+    Export every patient of the database file diary to folder, one file per patient named after the diary (and the
+    patient, except the default one). Return the (output path, rows, bytes, seconds) of each export.
+    The diary is only read: a missing file, or one that must be upgraded by the application first, is an error.
+    Run in the processes of export_many().
+    """
+    report_filter = storage.ReportFilter() if report_filter is None else report_filter
+    if not os.path.isfile(diary):
+        raise FileNotFoundError('no such diary: "{}"'.format(diary))
+    database = storage.Storage(diary, read_only=True)
+    results = list()
+    try:
+        for patient_id, name in database.patients():
+            database.select_patient(name)
+            stem = os.path.splitext(os.path.basename(diary))[0]
+            if name != storage.DEFAULT_PATIENT:
+                stem += '-' + ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+            path = os.path.join(folder, stem + FORMATS[format][1])
+            start = time.perf_counter()
+            rows = export(database, path, report_filter, format=format)
+            results.append((path, rows, os.path.getsize(path), time.perf_counter() - start))
+    finally:
+        database.close()
+    return results
+
+
+def export_many(diaries, folder, format='csv', report_filter=None, workers=None, progress=None):
+    """
+    Export many database files to folder, each one by a process of a pool of workers processes (default: one per
+    processor), see export_diary(). progress, when given, is called with the results of each diary once exported.
+    Return the results of every export.
+    """
+    if format not in FORMATS:
+        raise ValueError('invalid export format: {}'.format(format))
+    os.makedirs(folder, exist_ok=True)
+    results = list()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for diary_results in executor.map(export_diary, diaries, [folder] * len(diaries), [format] * len(diaries),
+                                          [report_filter] * len(diaries)):
+            results.extend(diary_results)
+            if progress is not None:
+                progress(diary_results)
+    return results
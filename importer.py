@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# Bulk import of headache histories kept in other trackers. The input is read as a stream and written in batches,
+# so that the memory used does not depend on the size of the history.
+
+import csv
+import json
+import os
+from datetime import date  # date validation
+
+FORMATS = ('csv', 'jsonl')
+POLICIES = ('skip', 'update', 'fail')  # what to do with the dates already filled
+BATCH_SIZE = 10000
+MAX_ERRORS = 20  # invalid rows described in the summary, the others are only counted
+TRUE_VALUES = ('1', 'yes', 'true', 'y')
+FALSE_VALUES = ('0', 'no', 'false', 'n', '')
+
+
+class ImportConflict(ValueError):
+    """A date of the input is already filled, and the policy is 'fail'."""
+
+
+class ImportSummary:
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.errors = list()  # (line, message) of the first invalid rows
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self):
+        text = '{} inserted, {} updated, {} skipped, {} rejected.'.format(self.inserted, self.updated, self.skipped,
+                                                                          self.rejected)
+        for line, message in self.errors:
+            text += '\nline {}: {}'.format(line, message)
+        if self.rejected > len(self.errors):
+            text += '\n...'
+        return text
+
+
+def read_csv(file):
+    """Yield (line, record) of a CSV file whose header names the fields."""
+    reader = csv.DictReader(file)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_jsonl(file):
+    """Yield (line, text) of a JSON Lines file, one object per line; the text is parsed by validate()."""
+    for line, text in enumerate(file, start=1):
+        if text.strip():
+            yield line, text
+
+
+def flag(value):
+    if isinstance(value, bool) or isinstance(value, int):
+        if value not in (0, 1):
+            raise ValueError('invalid flag: {}'.format(value))
+        return int(value)
+    if value is None:
+        return 0
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return 1
+    if value in FALSE_VALUES:
+        return 0
+    raise ValueError('invalid flag: {}'.format(value))
+
+
+def intensity_of(value):
+    """Return the intensity of a record, an integer from 0 to 3, given as a number or a text, but no bool or float."""
+    if isinstance(value, str):
+        try:
+            intensity = int(value.strip())
+        except ValueError:
+            raise ValueError('invalid intensity: {}'.format(value)) from None
+    elif isinstance(value, int) and not isinstance(value, bool):
+        intensity = value
+    else:
+        raise ValueError('invalid intensity: {}'.format(value))
+    if not 0 <= intensity <= 3:
+        raise ValueError('invalid intensity: {}'.format(intensity))
+    return intensity
+
+
+def validate(record):
+    """Return the entry (date, intensity, migraine, medicine, comment) of a record, as the headache table wants it."""
+    if isinstance(record, str):
+        record = json.loads(record)
+    full_date = date.fromisoformat(str(record.get('date', '')).strip()).isoformat()
+    intensity = intensity_of(record.get('intensity', 1))
+    comment = record.get('comment')
+    if comment is not None:
+        comment = str(comment).rstrip('\n')
+        # stored like the comments typed in the main window
+        comment = comment + '\n' if comment else None
+    return full_date, intensity, flag(record.get('migraine')), flag(record.get('medicine')), comment
+
+
+def import_file(database, path, format=None, policy='skip', batch_size=BATCH_SIZE, progress=None):
+    """
+    Import a CSV or JSON Lines file into the diary, in a single transaction: with the 'fail' policy, a date
+    already filled cancels the whole import. progress, when given, is called with the amount of rows read after
+    each batch. Return an ImportSummary.
+    """
+    if format is None:
+        format = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json', '.ndjson') else 'csv'
+    if format not in FORMATS:
+        raise ValueError('invalid import format: {}'.format(format))
+    if policy not in POLICIES:
+        raise ValueError('invalid import policy: {}'.format(policy))
+    reader = read_csv if format == 'csv' else read_jsonl
+    summary = ImportSummary()
+    with open(path, newline='', encoding='utf-8') as file, database.transaction():
+        batch = dict()  # date -> entry; a date repeated in the input is handled like a date already filled
+        read = 0
+        for line, record in reader(file):
+            read += 1
+            try:
+                entry = validate(record)
+            except (ValueError, TypeError, AttributeError) as e:
+                summary.reject(line, str(e))
+                continue
+            if entry[0] in batch:
+                if policy == 'fail':
+                    raise ImportConflict('line {}: {} appears more than once.'.format(line, entry[0]))
+                if policy == 'skip':
+                    summary.skipped += 1
+                    continue
+                summary.updated += 1
+            batch[entry[0]] = entry
+            if len(batch) >= batch_size:
+                write_batch(database, batch, policy, summary)
+                batch = dict()
+                if progress is not None:
+                    progress(read)
+        write_batch(database, batch, policy, summary)
+        if progress is not None:
+            progress(read)
+    return summary
+
+
+def write_batch(database, batch, policy, summary):
+    if not batch:
+        return
+    existing = database.existing_dates(batch)
+    if existing and policy == 'fail':
+        raise ImportConflict('{} is already filled.'.format(min(existing)))
+    if policy == 'update':
+        database.upsert_many(batch.values())
+        summary.updated += len(existing)
+    else:
+        database.insert_many(entry for full_date, entry in batch.items() if full_date not in existing)
+        summary.skipped += len(existing)
+    summary.inserted += len(batch) - len(existing)
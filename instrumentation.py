@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# Opt-in timing of the application, to find out what is slow on the computer of a user. It is enabled by the
+# environment variable HEADACHE_DIARY_INSTRUMENT: the latency of the queries, of the population of the windows and of
+# the exports is then recorded in histograms, printed to stderr on exit (or written to the file named by the variable,
+# when it is not 1). HEADACHE_DIARY_CPROFILE names a file where the cProfile statistics of the session are written,
+# for pstats or snakeviz: each profiled thread stops its own profile, see end_thread_profile(). When disabled, timed()
+# returns the functions unchanged, so that the instrumentation costs nothing.
+
+import atexit  # the summary is written on exit
+import os
+import sys
+import threading  # the database thread records too
+import time
+from functools import wraps
+
+OUTPUT = os.environ.get('HEADACHE_DIARY_INSTRUMENT')
+PROFILE = os.environ.get('HEADACHE_DIARY_CPROFILE')
+ENABLED = bool(OUTPUT or PROFILE)
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # upper bounds, in milliseconds
+BAR_SIZE = 40
+
+lock = threading.Lock()
+histograms = dict()  # operation -> Histogram
+profiles = list()  # one cProfile.Profile per profiled thread
+local = threading.local()  # the profile of the calling thread
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one counts what is slower than every bound
+        self.calls = 0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    def add(self, milliseconds):
+        bucket = 0
+        while bucket < len(BUCKETS) and milliseconds > BUCKETS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.calls += 1
+        self.total += milliseconds
+        self.slowest = max(self.slowest, milliseconds)
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the given fraction of the calls (the slowest call past them)."""
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * self.calls:
+                return min(BUCKETS[bucket], self.slowest) if bucket < len(BUCKETS) else self.slowest
+        return self.slowest
+
+
+def record(operation, seconds):
+    """Add a call of operation, which took seconds, to its histogram."""
+    with lock:
+        histogram = histograms.get(operation)
+        if histogram is None:
+            histogram = histograms[operation] = Histogram()
+        histogram.add(seconds * 1000)
+
+
+def timed(operation):
+    """Decorator recording every call of the function as a call of operation."""
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(operation, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def profile_thread():
+    """Profile the calling thread with cProfile until the end of the session, when HEADACHE_DIARY_CPROFILE is set."""
+    if PROFILE:
+        import cProfile  # only needed when profiling
+        profile = cProfile.Profile()
+        with lock:
+            profiles.append(profile)
+        local.profile = profile
+        profile.enable()
+
+
+def end_thread_profile():
+    """Stop the profile that profile_thread() started in the calling thread, if any: only its thread can stop it."""
+    profile = getattr(local, 'profile', None)
+    if profile is not None:
+        profile.disable()
+        local.profile = None
+
+
+def summary():
+    """Return the table of the recorded operations, slowest total first, with the histogram of each."""
+    lines = ['{:<36}{:>8}{:>12}{:>10}{:>10}{:>10}{:>10}'.format('operation', 'calls', 'total ms', 'mean ms', 'p50 ms',
+                                                               'p95 ms', 'max ms')]
+    with lock:
+        items = sorted(histograms.items(), key=lambda item: -item[1].total)
+        for operation, histogram in items:
+            lines.append('{:<36}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+                operation, histogram.calls, histogram.total, histogram.total / histogram.calls,
+                histogram.percentile(0.5), histogram.percentile(0.95), histogram.slowest))
+        for operation, histogram in items:
+            lines.append('')
+            lines.append(operation + ':')
+            most = max(histogram.counts)
+            for bucket, count in enumerate(histogram.counts):
+                if count:
+                    bound = '<= {} ms'.format(BUCKETS[bucket]) if bucket < len(BUCKETS) else '> {} ms'.format(
+                        BUCKETS[-1])
+                    lines.append('  {:>12}{:>8} {}'.format(bound, count, '#' * max(1, count * BAR_SIZE // most)))
+    return '\n'.join(lines) + '\n'
+
+
+def write_summary():
+    if histograms:
+        if OUTPUT and OUTPUT != '1':
+            with open(OUTPUT, 'w') as file:
+                file.write(summary())
+        else:
+            sys.stderr.write(summary())
+    if profiles:
+        import pstats  # only needed when profiling
+        end_thread_profile()  # the one of the user interface, the database thread stopped its own on shutdown
+        statistics = pstats.Stats(*profiles)
+        statistics.dump_stats(PROFILE)
+        sys.stderr.write('cProfile statistics written to "{}".\n'.format(PROFILE))
+
+
+if ENABLED:
+    atexit.register(write_summary)
+    profile_thread()  # the thread importing the application, which runs the user interface
@@ -19,20 +19,29 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
 
+import time  # startup times
+STARTED = time.perf_counter()  # taken before the other imports, which are part of the start of the application
+
 import tkinter as tk  # GUI toolkit
 from tkinter import ttk  # widget for the separator
-from tkinter import filedialog  # file dialog for the report export
-from tkinter import messagebox  # messagebox for displaying error messages
-from tkinter import tix
-import sqlite3 as sql  # database operations
 from datetime import date  # most of the date strings are get from it
 from datetime import timedelta  # some date calculations
-from datetime import datetime  # for report footer
 import os
+import sys
 import __init__  # to get the application version
+import storage  # database queries
+from widgets import DISABLED_BUTTON_BKGRND, ENABLED_BUTTON_BKGRND, load_tix
+from worker import DatabaseWorker  # the database runs in its own thread
+
+# The windows of the report, the dialogs and the Tix extension (tooltips) are loaded when first needed, and the
+# database is only opened once the main window is drawn, so that it appears as soon as possible.
+
+STARTUP = os.environ.get('HEADACHE_DIARY_STARTUP')  # 'print' the startup times to stderr; 'exit' also quits
+
 
-DISABLED_BUTTON_BKGRND = 'DarkGray'
-ENABLED_BUTTON_BKGRND = 'LightGreen'
+def startup_time(event):
+    if STARTUP:
+        print('{}: {:.1f} ms'.format(event, (time.perf_counter() - STARTED) * 1000), file=sys.stderr)
 
 # TODO: create a new preferences Window: -> issue #5
 #  Date format options;
@@ -43,360 +52,6 @@ ENABLED_BUTTON_BKGRND = 'LightGreen'
 #  ASC or DESC Report display
 
 
-class Maintenance(tk.Toplevel):
-
-    def __init__(self, db, master=None, data=None):
-        tk.Toplevel.__init__(self)
-
-        # Properties:
-        self.db = db
-        self.master = master
-        self.date = data[0]
-        self.intensity = data[1]
-        self.migraine = data[2]
-        self.medicine = data[3]
-        self.comment = data[4]
-        self.title('Maintenance for {date}'.format(date=self.date))
-        self.resizable(True, True)
-
-        # data
-        self.list_values_headache = ('0 - none', '1 - weak', '2 - medium', '3 - strong')
-        self.list_value_headache = tk.StringVar()
-        self.list_value_headache.set(str(self.list_values_headache[self.intensity]))
-        self.check_migraine_value = tk.IntVar()
-        self.check_migraine_value.set(self.migraine)
-        self.check_medicine_value = tk.IntVar()
-        self.check_medicine_value.set(self.medicine)
-
-        # widget creation
-        self.label_date = tk.Label(self, text='Date under maintenance:')
-        self.label_date_value = tk.Label(self, text=self.date)
-        self.label_intensity = tk.Label(self, text='Headache intensity:')
-        self.combo_headache = tk.OptionMenu(self, self.list_value_headache, *self.list_values_headache)
-        self.label_migraine = tk.Label(self, text='Migraine:')
-        self.check_migraine = tk.Checkbutton(self, variable=self.check_migraine_value)
-        self.label_medicine = tk.Label(self, text='Medicine:')
-        self.check_medicine = tk.Checkbutton(self, variable=self.check_medicine_value)
-        self.label_comment = tk.Label(self, text='Comment:')
-        self.text_comment = tk.Text(self, wrap=tk.WORD, height=3, width=1)
-        self.button_save = tk.Button(self, text='Save', command=self.save_data)
-        self.button_cancel = tk.Button(self, text='Cancel', command=self.cancel)
-        self.separator = ttk.Separator(self, orient=tk.HORIZONTAL)
-        self.label_status = tk.Label(self, text='Maintenance ready.')
-
-        self.balloon = tix.Balloon(self.master)
-
-        self.balloon.bind_widget(self.combo_headache,
-                                 balloonmsg='Click to select the intensity of your headache.')
-        self.balloon.bind_widget(self.check_migraine,
-                                 balloonmsg='Mark this box if you feel like the headache is connected to migraine.')
-        self.balloon.bind_widget(self.check_medicine,
-                                 balloonmsg='Mark this box if you took some medicine to alleviate the headache.')
-        self.balloon.bind_widget(self.text_comment,
-                                 balloonmsg='Add any comment you think is relevant for the selected date.')
-        self.balloon.bind_widget(self.button_cancel,
-                                 balloonmsg='Dismiss this window without changing any value.')
-        self.balloon.bind_widget(self.button_save,
-                                 balloonmsg='Update all the input information for the current selected date.')
-
-        # widgets manipulation on window startup
-        self.text_comment.delete(tk.INSERT, tk.END)
-        if self.comment is not None:
-            self.text_comment.insert(tk.INSERT, self.comment)
-        self.button_save.configure(background=ENABLED_BUTTON_BKGRND)
-
-        # row and column configuration
-        self.rowconfigure(0, weight=0)
-        self.rowconfigure(1, weight=0)
-        self.rowconfigure(2, weight=0)
-        self.rowconfigure(3, weight=0)
-        self.rowconfigure(4, weight=0)
-        self.rowconfigure(5, weight=1)
-        self.rowconfigure(6, weight=0)
-        self.rowconfigure(7, weight=0)
-        self.rowconfigure(8, weight=0)
-        self.columnconfigure(0, weight=1)
-        self.columnconfigure(1, weight=1)
-
-        # widget deployment
-        self.label_date.grid(row=0, column=0, sticky=tk.W, padx=5)
-        self.label_date_value.grid(row=0, column=1, sticky=tk.E, padx=5)
-        self.label_intensity.grid(row=1, column=0, sticky=tk.W, padx=5)
-        self.combo_headache.grid(row=1, column=1, sticky=tk.W + tk.E, padx=5)
-        self.label_migraine.grid(row=2, column=0, sticky=tk.W, padx=5)
-        self.check_migraine.grid(row=2, column=1, sticky=tk.E, padx=5)
-        self.label_medicine.grid(row=3, column=0, sticky=tk.W, padx=5)
-        self.check_medicine.grid(row=3, column=1, sticky=tk.E, padx=5)
-        self.label_comment.grid(row=4, column=0, sticky=tk.W, padx=5)
-        self.text_comment.grid(row=5, column=0, sticky=tk.W + tk.E + tk.N + tk.S, padx=5, columnspan=2)
-        self.button_save.grid(row=6, column=1, sticky=tk.E, pady=5, padx=5)
-        self.button_cancel.grid(row=6, column=0, sticky=tk.W, pady=5, padx=5)
-        self.separator.grid(row=7, column=0, sticky=tk.W + tk.E, columnspan=2)
-        self.label_status.grid(row=8, column=0, sticky=tk.W, columnspan=2)
-
-    def save_data(self):
-        self.intensity = int(self.list_value_headache.get()[0])
-        self.migraine = self.check_migraine_value.get()
-        self.medicine = self.check_medicine_value.get()
-        self.comment = self.text_comment.get('1.0', tk.END)
-        if self.comment == '\n':
-            self.comment = None
-        if self.comment is not None and self.comment[-1] == '\n':
-            self.comment = self.comment[0:-1]
-        self.db.execute(
-            'update headache set intensity = ?, migraine = ?, medicine = ?, comment = ? where date = ?',
-            (self.intensity, self.migraine, self.medicine, self.comment, self.date))
-        self.db.commit()
-        self.destroy()
-
-    def cancel(self):
-        self.destroy()
-
-
-class Report(tk.Toplevel):
-
-    # TODO: EPIC: add a button to generate graphs of the filtered result with mathPlotLib -> issue #4
-
-    def __init__(self, db, master=None):
-        tk.Toplevel.__init__(self)
-
-        # Properties:
-        self.db = db
-        self.master = master
-        self.title('Report')
-        self.resizable(True, True)
-        self.report_data = list()
-        self.column_size = 120
-
-        # data
-        self.filter_values = ('1 - last 31 days', '2 - this month', '3 - everything')
-        self.filter_value = tk.StringVar()
-        self.filter_value.set(self.filter_values[0])
-        self.list_value = tk.StringVar()
-        self.check_reverse_dates = tk.IntVar()
-        self.check_reverse_dates.set(0)
-        self.ord = 'ASC'
-
-        # widget creation
-        self.label_filter = tk.Label(self, text='Choose a filter:')
-        self.label_reverse = tk.Label(self, text='Most recent on top:')
-        self.check_reverse = tk.Checkbutton(self, variable=self.check_reverse_dates)
-        self.combo_filter = tk.OptionMenu(self, self.filter_value, *self.filter_values)  # official
-        # self.combo_filter = ttk.Combobox(self, textvariable=self.filter_value, values=self.filter_values) # experiment
-        self.button_filter = tk.Button(self, text='Filter', command=self.search_data)
-
-        self.frame_hlist = tk.Frame(self)
-        self.vscroll_list = tk.Scrollbar(self.frame_hlist, orient=tk.VERTICAL)
-        self.hscroll_list = tk.Scrollbar(self.frame_hlist, orient=tk.HORIZONTAL)
-        self.hlist = tix.HList(self.frame_hlist, yscrollcommand=self.vscroll_list.set,
-                               xscrollcommand=self.hscroll_list.set, columns=5, header=True, height=25, width=100,
-                               indicator=True, selectmode='browse', command=self.double_click)
-        self.vscroll_list.configure(command=self.hlist.yview)
-        self.hscroll_list.configure(command=self.hlist.xview)
-
-        self.button_export_txt = tk.Button(self, text='Export to txt', command=self.export_to_txt)
-        self.button_close = tk.Button(self, text='Close', command=self.close)
-        self.separator = ttk.Separator(self, orient=tk.HORIZONTAL)
-        self.label_status = tk.Label(self, text='')
-        self.balloon = tix.Balloon(self.master)
-
-        self.balloon.bind_widget(self.check_reverse,
-                                 balloonmsg='Mark this option to display the most recent dates on top of the list.')
-        self.balloon.bind_widget(self.combo_filter,
-                                 balloonmsg='Select the range of your search.')
-        self.balloon.bind_widget(self.button_filter,
-                                 balloonmsg='Apply the filter based on your search.')
-        self.balloon.bind_widget(self.hlist,
-                                 balloonmsg='Double click to edit an entry.')
-        self.balloon.bind_widget(self.button_export_txt,
-                                 balloonmsg='Export the table values to a text file.')
-        self.balloon.bind_widget(self.button_close,
-                                 balloonmsg='Close this report window.')
-
-        # widgets manipulation on window startup
-        self.button_export_txt.configure(state=tk.DISABLED)
-        self.button_export_txt.configure(background=DISABLED_BUTTON_BKGRND)
-        # self.combo_filter.state(statespec=('!disabled', 'readonly'))  # experimental
-        self.hlist.header_create(0, text='Date                          ')
-        self.hlist.header_create(1, text='Intensity')
-        self.hlist.header_create(2, text='Migraine')
-        self.hlist.header_create(3, text='Medicine')
-        self.hlist.header_create(4, text='Comment')
-
-        # row and column configuration
-        self.rowconfigure(0, weight=0)
-        self.rowconfigure(1, weight=1)
-        self.rowconfigure(2, weight=0)
-        self.rowconfigure(3, weight=0)
-        self.rowconfigure(4, weight=0)
-        self.columnconfigure(0, weight=1)
-        self.columnconfigure(1, weight=0)
-        self.columnconfigure(2, weight=0)
-        self.columnconfigure(3, weight=0)
-        self.columnconfigure(4, weight=0)
-
-        self.frame_hlist.rowconfigure(0, weight=1)
-        self.frame_hlist.rowconfigure(1, weight=0)
-        self.frame_hlist.columnconfigure(0, weight=1)
-        self.frame_hlist.columnconfigure(1, weight=0)
-
-        # widget deployment
-        self.label_filter.grid(row=0, column=0, sticky=tk.W, padx=5)
-        self.label_reverse.grid(row=0, column=1, sticky=tk.W)
-        self.check_reverse.grid(row=0, column=2, sticky=tk.W)
-        self.combo_filter.grid(row=0, column=3, sticky=tk.W + tk.E, pady=5)
-        self.button_filter.grid(row=0, column=4, sticky=tk.W + tk.E, padx=5)
-
-        self.frame_hlist.grid(row=1, column=0, sticky=tk.W + tk.E + tk.N + tk.S, padx=5, columnspan=5)
-        self.hlist.grid(row=0, column=0, sticky=tk.W + tk.E + tk.N + tk.S)
-        self.vscroll_list.grid(row=0, column=1, sticky=tk.N + tk.S)
-        self.hscroll_list.grid(row=1, column=0, sticky=tk.W + tk.E)
-
-        self.button_export_txt.grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
-        self.button_close.grid(row=2, column=4, sticky=tk.W, padx=5, pady=5)
-        self.separator.grid(row=3, column=0, sticky=tk.W + tk.E, columnspan=5)
-        self.label_status.grid(row=4, column=0, sticky=tk.W, columnspan=5)
-
-    def double_click(self, entry):
-        entry_number = int(entry)
-        maintenance_data = self.report_data[entry_number]
-        maintenance = Maintenance(db=self.db, master=self, data=maintenance_data)
-        maintenance.transient(self)
-        maintenance.geometry('600x300')
-
-        if os.name == 'nt':
-            maintenance.update_idletasks()
-            x = (maintenance.winfo_screenwidth() - maintenance.winfo_reqwidth()) / 2
-            y = (maintenance.winfo_screenheight() - maintenance.winfo_reqheight()) / 2
-            maintenance.geometry('+%d+%d' % (x, y))
-
-        self.wait_window(maintenance)
-        self.search_data()
-
-    def search_data(self):
-        self.report_data.clear()
-        self.hlist.delete_all()
-        self.button_export_txt.configure(state=tk.DISABLED)
-        self.button_export_txt.configure(background=DISABLED_BUTTON_BKGRND)
-
-        if self.check_reverse_dates.get() == 1:
-            self.ord = 'DESC'
-        else:
-            self.ord = 'ASC'
-
-        quantity = 0
-        cursor = None
-        if self.filter_value.get()[0] == '1':  # last 31 days
-            ago31days = (date.today() + timedelta(days=-31)).isoformat()
-            quantity = self.db.execute('select count(*) from headache where date >= ?',
-                                       (ago31days,))
-            value = quantity.fetchall()
-            quantity = str(value[0][0])
-            cursor = self.db.execute('select * from headache where date >= ? order by date {ord}'.format(ord=self.ord),
-                                     (ago31days,))
-            self.label_status.configure(text='Report generated for last 31 days. Returned items: ' + quantity)
-        elif self.filter_value.get()[0] == '2':  # this month
-            thismonth = date.today().isoformat()[:7]
-            quantity = self.db.execute('select count(*) from headache where date >= ?',
-                                       (thismonth,))
-            value = quantity.fetchall()
-            quantity = str(value[0][0])
-            cursor = self.db.execute('select * from headache where date >= ? order by date {ord}'.format(ord=self.ord),
-                                     (thismonth,))
-            self.label_status.configure(text='Report generated for this month. Returned items: ' + quantity)
-        elif self.filter_value.get()[0] == '3':  # everything
-            quantity = self.db.execute('select count(*) from headache')
-            value = quantity.fetchall()
-            quantity = str(value[0][0])
-            cursor = self.db.execute('select * from headache order by date {ord}'.format(ord=self.ord))
-            self.label_status.configure(text='Report generated for all available data. Returned items: ' + quantity)
-
-        current_row = 0
-
-        for i in cursor:
-
-            self.hlist.add(current_row)
-
-            self.report_data.append((i[1], i[2], i[3], i[4], i[5]))
-            report_date = i[1]
-            report_intensity = str(i[2])
-            report_migraine = 'yes' if i[3] == 1 else 'no'
-            report_medicine = 'yes' if i[4] == 1 else 'no'
-
-            if i[5] is not None:
-                report_comment = i[5][:-1]
-            else:
-                report_comment = ''
-
-            self.hlist.item_create(current_row, 0, text=report_date)
-            self.hlist.item_create(current_row, 1, text=report_intensity)
-            self.hlist.item_create(current_row, 2, text=report_migraine)
-            self.hlist.item_create(current_row, 3, text=report_medicine)
-            self.hlist.item_create(current_row, 4, text=report_comment)
-
-            current_row += 1
-
-        if int(quantity) > 0:
-            self.button_export_txt.configure(state=tk.NORMAL)
-            self.button_export_txt.configure(background=ENABLED_BUTTON_BKGRND)
-            self.button_export_txt.flash()
-
-    def export_to_txt(self):
-        header = ('*'*self.column_size) + '\n' + '{:*^{}}'.format(' HEADACHE DIARY v' + __init__.version + ' ',
-                                                                  self.column_size)
-        header += '\n' + ('*'*self.column_size) + '\n\n'
-        table_header = '{a:<{width}}{b:>{width}}{c:>{width}}{d:>{width}}\n'.\
-            format(a='Date:', b='Intensity:', c='Migraine:', d='Medicine:', width=int(self.column_size/4))
-        footer = '{:*>{}}'.format(' Generated in ' + str(str(datetime.now()).split('.')[0]) + ' ***',
-                                  self.column_size)
-        footer += '\n{:*>{}}'.format(' Copyright (C) 2018 Gidalti Lourenço Junior ***', self.column_size)
-        path = filedialog.asksaveasfilename(defaultextension='.txt', filetypes=[('TXT', '.txt')],
-                                            initialfile='my_headache_diary_report', parent=self)
-
-        if path == () or path == '':
-            self.label_status.configure(text='Export to txt cancelled by the user.')
-        else:
-            with open(path, 'w') as file:
-                file.write(header)
-                file.write(table_header)
-                for i in self.report_data:
-                    # i[0] = date; i[1] = intensity; i[2] = migraine; i[3] = medicine; i[4] = comments
-                    file.write('{a:.<{width}}{b:.>{width}}{c:.>{width}}{d:.>{width}}\n'.
-                               format(a=i[0], b=i[1], c=i[2], d=i[3], width=30))
-                    if i[4] is not None:
-                        report_comment = self.breaklines(i[4], self.column_size)
-                        file.write('Comments:\n{e}'.format(e=report_comment))
-                        file.writelines('\n')
-                file.write(footer)
-                self.label_status.configure(text='Report exported to "' + path + '".')
-
-    @staticmethod
-    def breaklines(message, column_size):
-        if len(message) > column_size:
-            array = message.split()
-            lenght = -1
-            count = -1
-            for word in array:
-                count += 1
-                lenght += len(word) + 1
-                if lenght > column_size:
-                    array[count - 1] += '\n'
-                    lenght = 0
-                    lenght += len(array[count]) + 1
-            postmessage = ''
-            for word in array:
-                if str(word).find('\n') < 0:  # if the word has no '\n' then a ' '(empty space) will be added at the end
-                    postmessage += word + ' '
-                else:  # otherwise, if the word has '\n', then nothing is added
-                    postmessage += word
-            return postmessage + '\n'  # return the whole message, with all '\n' and ' '(empty spaces) between the words
-        else:
-            return message
-
-    def close(self):
-        self.destroy()
-
-
 class MainForm(tk.Frame):
 
     # TODO: Create a menu in the MainForm -> issue #6
@@ -419,8 +74,10 @@ class MainForm(tk.Frame):
 
         self.master.focus_force()
 
-        self.connection = self.load_database()
-        self.initialize_database()
+        self.worker = self.load_database()
+        self.worker.attach(self)
+        self.dates = None  # the filled dates, once loaded by the database thread
+        self.loaded = False  # whether the diary was loaded once, for the startup times
 
         self.grid(sticky=tk.W + tk.E + tk.N + tk.S)
 
@@ -445,6 +102,14 @@ class MainForm(tk.Frame):
         self.check_medicine_value = tk.IntVar()
         self.check_medicine_value.set(0)
 
+        self.patient_value = tk.StringVar()
+        self.patient_value.set(storage.DEFAULT_PATIENT)
+
+        self.frame_patient = tk.Frame(self)
+        self.label_patient = tk.Label(self.frame_patient, text='Patient:')
+        self.combo_patient = tk.OptionMenu(self.frame_patient, self.patient_value, storage.DEFAULT_PATIENT)
+        self.button_new_patient = tk.Button(self.frame_patient, text='New patient', command=self.new_patient)
+
         self.label_top = tk.Label(self, text='Choose the date and headache intensity, then click on Save:')
 
         self.frame_dates = tk.Frame(self)  # An organizer for the 4 widgets below
@@ -476,13 +141,42 @@ class MainForm(tk.Frame):
 
         self.button_save = tk.Button(self, text='Save', command=self.save_value)
         self.button_report = tk.Button(self, name='reportButton', text='Report', command=self.create_report)
+        self.button_batch = tk.Button(self, text='Several days', command=self.create_batch_entry)
 
         self.separator = ttk.Separator(self, orient=tk.HORIZONTAL)
         self.separator2 = ttk.Separator(self, orient=tk.HORIZONTAL)
         self.label_status = tk.Label(self, text='')
 
+        self.bind_all('<Alt-Right>', self.next_day)
+        self.bind_all('<Alt-Left>', self.previous_day)
+
+        self.validate_date()
+        self.create_widgets()
+
+        if os.name == 'nt':
+            self.update_idletasks()
+            x = (self.master.winfo_screenwidth() - self.master.winfo_reqwidth()) / 2
+            y = (self.master.winfo_screenheight() - self.master.winfo_reqheight()) / 2
+            self.master.geometry('+%d+%d' % (x, y))
+
+        self.after_idle(self.first_frame)
+
+    def first_frame(self):
+        """Once the window is drawn, do what it does not need to appear: open the database, then the tooltips."""
+        self.update_idletasks()
+        startup_time('first frame')
+        self.initialize_database()
+        self.create_tooltips()
+
+    def create_tooltips(self):
+        from tkinter import tix  # loaded with the extension, see load_tix()
+        load_tix(self)
         self.balloon = tix.Balloon(self.master)
 
+        self.balloon.bind_widget(self.combo_patient,
+                                 balloonmsg='Choose whose diary is filled and reported.')
+        self.balloon.bind_widget(self.button_new_patient,
+                                 balloonmsg='Add a patient, with an empty diary.')
         self.balloon.bind_widget(self.spin_digits_day,
                                  balloonmsg='Current selected day.')
         self.balloon.bind_widget(self.spin_digits_month,
@@ -510,24 +204,16 @@ class MainForm(tk.Frame):
                                             ' be able to check all previous dates and information.')
         self.balloon.bind_widget(self.button_save,
                                  balloonmsg='Save all the input information for the current selected date.')
-
-        self.bind_all('<Alt-Right>', self.next_day)
-        self.bind_all('<Alt-Left>', self.previous_day)
-
-        self.validate_date()
-        self.create_widgets()
-
-        if os.name == 'nt':
-            self.update_idletasks()
-            x = (self.master.winfo_screenwidth() - self.master.winfo_reqwidth()) / 2
-            y = (self.master.winfo_screenheight() - self.master.winfo_reqheight()) / 2
-            self.master.geometry('+%d+%d' % (x, y))
+        self.balloon.bind_widget(self.button_batch,
+                                 balloonmsg='Fill a range of dates at once, e.g. after some days away.')
 
     def create_widgets(self):
         top = self.winfo_toplevel()
         top.rowconfigure(0, weight=1)
         top.columnconfigure(0, weight=1)
 
+        self.frame_patient.columnconfigure(1, weight=1)
+
         self.frame_dates.rowconfigure(0, weight=1)
         self.frame_dates.columnconfigure(0, weight=0)
         self.frame_dates.columnconfigure(1, weight=0)
@@ -546,45 +232,52 @@ class MainForm(tk.Frame):
         self.rowconfigure(9, weight=0)
         self.rowconfigure(10, weight=0)
         self.rowconfigure(11, weight=0)
+        self.rowconfigure(12, weight=0)
 
         self.columnconfigure(0, weight=0)
         self.columnconfigure(1, weight=0)
         self.columnconfigure(2, weight=0)
         self.columnconfigure(3, weight=0)
 
-        self.label_top.grid(row=0, column=0, sticky=tk.W, padx=5, pady=5, columnspan=4)
+        self.frame_patient.grid(row=0, column=0, sticky=tk.W + tk.E, padx=5, pady=(5, 0), columnspan=4)
+        self.label_patient.grid(row=0, column=0, sticky=tk.W)
+        self.combo_patient.grid(row=0, column=1, sticky=tk.W + tk.E)
+        self.button_new_patient.grid(row=0, column=2, sticky=tk.W, padx=5)
 
-        self.frame_dates.grid(row=1, column=0, sticky=tk.W + tk.E, padx=5, columnspan=4)
+        self.label_top.grid(row=1, column=0, sticky=tk.W, padx=5, pady=5, columnspan=4)
+
+        self.frame_dates.grid(row=2, column=0, sticky=tk.W + tk.E, padx=5, columnspan=4)
         self.label_date.grid(row=0, column=0, sticky=tk.W)
         self.spin_digits_day.grid(row=0, column=1, sticky=tk.W + tk.E)
         self.spin_digits_month.grid(row=0, column=2, sticky=tk.W + tk.E)
         self.spin_digits_year.grid(row=0, column=3, sticky=tk.W + tk.E)
 
-        self.previousday.grid(row=2, column=0, sticky=tk.W, pady=5, padx=5)
-        self.yesterday.grid(row=2, column=1, sticky=tk.W + tk.E, pady=5, padx=2)
-        self.today.grid(row=2, column=2, sticky=tk.W + tk.E, pady=5, padx=2)
-        self.nextday.grid(row=2, column=3, sticky=tk.E, pady=5, padx=5)
+        self.previousday.grid(row=3, column=0, sticky=tk.W, pady=5, padx=5)
+        self.yesterday.grid(row=3, column=1, sticky=tk.W + tk.E, pady=5, padx=2)
+        self.today.grid(row=3, column=2, sticky=tk.W + tk.E, pady=5, padx=2)
+        self.nextday.grid(row=3, column=3, sticky=tk.E, pady=5, padx=5)
 
-        self.separator.grid(row=3, column=0, sticky=tk.E + tk.W, columnspan=4)
+        self.separator.grid(row=4, column=0, sticky=tk.E + tk.W, columnspan=4)
         
-        self.label_intensity.grid(row=4, column=0, sticky=tk.W, columnspan=2, padx=5)
-        self.combo_headache.grid(row=4, column=2, sticky=tk.E + tk.W, columnspan=2, padx=5)
+        self.label_intensity.grid(row=5, column=0, sticky=tk.W, columnspan=2, padx=5)
+        self.combo_headache.grid(row=5, column=2, sticky=tk.E + tk.W, columnspan=2, padx=5)
 
-        self.label_migraine.grid(row=5, column=0, sticky=tk.W, columnspan=2, padx=5)
-        self.check_migraine.grid(row=5, column=3, sticky=tk.E, padx=5)
+        self.label_migraine.grid(row=6, column=0, sticky=tk.W, columnspan=2, padx=5)
+        self.check_migraine.grid(row=6, column=3, sticky=tk.E, padx=5)
 
-        self.label_medicine.grid(row=6, column=0, sticky=tk.W, columnspan=2, padx=5)
-        self.check_medicine.grid(row=6, column=3, sticky=tk.E, padx=5)
+        self.label_medicine.grid(row=7, column=0, sticky=tk.W, columnspan=2, padx=5)
+        self.check_medicine.grid(row=7, column=3, sticky=tk.E, padx=5)
 
-        self.label_comment.grid(row=7, column=0, sticky=tk.W + tk.N, padx=5)
-        self.text_comment.grid(row=8, column=0, sticky=tk.W + tk.E, columnspan=4, padx=5)
+        self.label_comment.grid(row=8, column=0, sticky=tk.W + tk.N, padx=5)
+        self.text_comment.grid(row=9, column=0, sticky=tk.W + tk.E, columnspan=4, padx=5)
 
-        self.button_save.grid(row=9, column=3, sticky=tk.E + tk.W, pady=5, padx=5)
-        self.button_report.grid(row=9, column=0, sticky=tk.E + tk.W, pady=5, padx=5)
+        self.button_save.grid(row=10, column=3, sticky=tk.E + tk.W, pady=5, padx=5)
+        self.button_report.grid(row=10, column=0, sticky=tk.E + tk.W, pady=5, padx=5)
+        self.button_batch.grid(row=10, column=1, sticky=tk.E + tk.W, pady=5, padx=2, columnspan=2)
 
-        self.separator2.grid(row=10, column=0, sticky=tk.E + tk.W, columnspan=4)
+        self.separator2.grid(row=11, column=0, sticky=tk.E + tk.W, columnspan=4)
 
-        self.label_status.grid(row=11, column=0, sticky=tk.W, columnspan=4)
+        self.label_status.grid(row=12, column=0, sticky=tk.W, columnspan=4)
 
     def increment_month(self):
         if int(self.spin_value_month.get()) in [4, 6, 8, 9, 11]:
@@ -632,18 +325,22 @@ class MainForm(tk.Frame):
         comment = self.text_comment.get('1.0', tk.END)
         if comment == '\n':
             comment = None
-        self.connection.execute(
-            'insert into headache (date, intensity, migraine, medicine, comment) values (?, ?, ?, ?, ?)',
-            (full_date, intensity, migraine, medicine, comment))
-        self.connection.commit()
         self.button_save.configure(state=tk.DISABLED)
         self.button_save.configure(background=DISABLED_BUTTON_BKGRND)
+        self.label_status.configure(text='Saving...')
+        self.worker.submit(storage.Storage.insert, full_date, intensity, migraine, medicine, comment,
+                           callback=self.saved, errback=self.save_failed)
+
+    def saved(self, result):
         self.label_status.configure(text='( ! ) Date and intensity saved successfully!')
 
+    def save_failed(self, error):
+        self.validate_date()
+        self.label_status.configure(text='( X ) The date could not be saved: ' + str(error))
+
     @staticmethod
     def load_database():
-        database = sql.Connection('headache_diary.db')
-        return database
+        return DatabaseWorker()
 
     # TODO: create a new database table to keep preferences: -> issue #5
     #  Date format options;
@@ -654,31 +351,89 @@ class MainForm(tk.Frame):
     #  ASC or DESC Report display
 
     def initialize_database(self):
-        try:
-            self.connection.execute('CREATE TABLE "headache" ('
-                                    '"_id"	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, '
-                                    '"date"	TEXT NOT NULL UNIQUE, '
-                                    '"intensity" INTEGER NOT NULL DEFAULT 1 CHECK(intensity >= 0 and intensity <= 3),'
-                                    '"migraine" INTEGER NOT NULL DEFAULT 0,'
-                                    '"medicine" INTEGER NOT NULL DEFAULT 0,'
-                                    '"comment" TEXT DEFAULT NULL'
-                                    ');')
-            self.connection.commit()
-        except sql.OperationalError as e:
-            if str(e) == 'table "headache" already exists':
-                pass
-            else:
-                messagebox.showerror('Unexpected Error', e)
+        self.worker.submit(storage.Storage.initialize,
+                           lambda description, done, total: self.worker.post(self.migration_progress, description,
+                                                                             done, total),
+                           errback=self.database_error)
+        self.worker.submit(storage.Storage.patients, callback=self.patients_loaded, errback=self.database_error)
+        self.load_patient(storage.DEFAULT_PATIENT)
+
+    def migration_progress(self, description, done, total):
+        text = 'Upgrading the diary: ' + description
+        if total > 0:
+            text += ' ' + str(done * 100 // total) + '%'
+        self.label_status.configure(text=text + '...')
+
+    def patients_loaded(self, patients):
+        menu = self.combo_patient['menu']
+        menu.delete(0, tk.END)
+        for patient_id, name in patients:
+            menu.add_command(label=name, command=lambda name=name: self.choose_patient(name))
+
+    def load_patient(self, name):
+        """Scope the database by the patient, then load its filled dates."""
+        self.worker.submit(lambda database: (database.select_patient(name), database.filled_dates())[1],
+                           callback=lambda dates: self.dates_loaded(dates, name), errback=self.database_error)
+
+    def dates_loaded(self, dates, name):
+        if name == self.patient_value.get():  # not an older patient, loaded before another one was chosen
+            self.dates = dates
+            self.validate_date()
+        if not self.loaded:
+            self.loaded = True
+            startup_time('diary loaded')
+            if STARTUP == 'exit':
+                self.master.destroy()
+
+    def choose_patient(self, name):
+        if name == self.patient_value.get():
+            return
+        # the windows of the previous patient are closed, so that nothing is written to the wrong diary
+        for window in self.master.winfo_children():
+            if isinstance(window, tk.Toplevel):  # the report and the windows opened from it
+                window.destroy()
+        self.patient_value.set(name)
+        self.dates = None
+        self.validate_date()
+        self.load_patient(name)
+
+    def new_patient(self):
+        from tkinter import simpledialog  # name of a new patient
+        name = simpledialog.askstring('New patient', 'Name of the patient:', parent=self)
+        if name is None or not name.strip():
+            return
+        self.worker.submit(storage.Storage.add_patient, name,
+                           callback=lambda patient_id: self.patient_added(name.strip()),
+                           errback=self.patient_failed)
+
+    def patient_added(self, name):
+        self.worker.submit(storage.Storage.patients, callback=self.patients_loaded, errback=self.database_error)
+        self.choose_patient(name)
+
+    def patient_failed(self, error):
+        self.label_status.configure(text='( X ) The patient could not be added: ' + str(error))
+
+    @staticmethod
+    def database_error(error):
+        from tkinter import messagebox  # messagebox for displaying error messages
+        messagebox.showerror('Unexpected Error', error)
 
     def create_report(self):
-        report = Report(db=self.connection, master=self)
-        report.transient(self)
+        import report  # the report windows, only loaded when first opened
+        window = report.Report(worker=self.worker, master=self)
+        window.transient(self)
 
         if os.name == 'nt':
-            report.update_idletasks()
-            x = (report.winfo_screenwidth() - report.winfo_reqwidth()) / 2
-            y = (report.winfo_screenheight() - report.winfo_reqheight()) / 2
-            report.geometry('+%d+%d' % (x, y))
+            window.update_idletasks()
+            x = (window.winfo_screenwidth() - window.winfo_reqwidth()) / 2
+            y = (window.winfo_screenheight() - window.winfo_reqheight()) / 2
+            window.geometry('+%d+%d' % (x, y))
+
+    def create_batch_entry(self):
+        import batch  # the batch entry window, only loaded when first opened
+        window = batch.BatchEntry(worker=self.worker, master=self,
+                                  saved=lambda: self.load_patient(self.patient_value.get()))
+        window.transient(self)
 
     def validate_date(self):
 
@@ -691,11 +446,11 @@ class MainForm(tk.Frame):
         self.increment_month()
         self.increment_year()
 
-        quantity = self.connection.execute('select count(*) from headache where date = ?', (full_date,))
-        value = quantity.fetchall()
-        quantity = int(value[0][0])
-
-        if quantity > 0:
+        if self.dates is None:
+            self.button_save.configure(state=tk.DISABLED)
+            self.button_save.configure(background=DISABLED_BUTTON_BKGRND)
+            self.label_status.configure(text='Loading the diary...')
+        elif full_date in self.dates:
             self.button_save.configure(state=tk.DISABLED)
             self.button_save.configure(background=DISABLED_BUTTON_BKGRND)
             self.label_status.configure(text='( X ) This date is already fulfilled.')
@@ -759,6 +514,7 @@ class MainForm(tk.Frame):
 
 
 if __name__ == '__main__':
-    load_tix = tix.Tk(None, None, 'Headache Diary v' + __init__.version)
+    root = tk.Tk(None, None, 'Headache Diary v' + __init__.version)
     app = MainForm()
     app.mainloop()
+    app.worker.shutdown()
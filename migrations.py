@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# Schema of the database. Each migration brings the schema from a version to the next one, and the version is kept
+# in PRAGMA user_version, so that an up to date database costs a single PRAGMA on startup. The databases written
+# before the versions existed are at version 0 whatever their age, hence the migrations check what already exists.
+
+import sqlite3 as sql  # database operations
+
+DEFAULT_PATIENT_ID = 1  # owner of the rows written before the patients existed
+DEFAULT_PATIENT = 'default'
+BATCH_SIZE = 50000  # rows copied per transaction when a table is rebuilt
+
+# The headache table of the time of a single diary per database.
+CREATE_TABLE_HEADACHE_V1 = ('CREATE TABLE IF NOT EXISTS "headache" ('
+                            '"_id"	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, '
+                            '"date"	TEXT NOT NULL UNIQUE, '
+                            '"intensity" INTEGER NOT NULL DEFAULT 1 CHECK(intensity >= 0 and intensity <= 3),'
+                            '"migraine" INTEGER NOT NULL DEFAULT 0,'
+                            '"medicine" INTEGER NOT NULL DEFAULT 0,'
+                            '"comment" TEXT DEFAULT NULL'
+                            ');')
+
+CREATE_TABLE_PATIENT = ('CREATE TABLE IF NOT EXISTS "patient" ('
+                        '"_id"	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, '
+                        '"name"	TEXT NOT NULL UNIQUE'
+                        ');')
+
+# The patient comes last, so that the rows keep the columns they always had.
+CREATE_TABLE_HEADACHE = ('CREATE TABLE "{table}" ('
+                         '"_id"	INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, '
+                         '"date"	TEXT NOT NULL, '
+                         '"intensity" INTEGER NOT NULL DEFAULT 1 CHECK(intensity >= 0 and intensity <= 3),'
+                         '"migraine" INTEGER NOT NULL DEFAULT 0,'
+                         '"medicine" INTEGER NOT NULL DEFAULT 0,'
+                         '"comment" TEXT DEFAULT NULL,'
+                         '"patient_id" INTEGER NOT NULL DEFAULT 1 REFERENCES "patient" ("_id"),'
+                         'UNIQUE ("patient_id", "date")'
+                         ');')
+
+# Keep the partitioned copy of the headache table in sync with the writes made while it is filled.
+MIRROR_COLUMNS = '"_id", "date", "intensity", "migraine", "medicine", "comment", "patient_id"'
+MIRROR_VALUES = ('{row}._id, {row}.date, {row}.intensity, {row}.migraine, {row}.medicine, {row}.comment, ' +
+                 str(DEFAULT_PATIENT_ID))
+MIRROR_STATEMENTS = [
+    'CREATE TRIGGER "headache_partitioned_insert" AFTER INSERT ON "headache" BEGIN '
+    'INSERT OR REPLACE INTO "headache_partitioned" ({columns}) VALUES ({values}); END;'.
+    format(columns=MIRROR_COLUMNS, values=MIRROR_VALUES.format(row='new')),
+    'CREATE TRIGGER "headache_partitioned_update" AFTER UPDATE ON "headache" BEGIN '
+    'INSERT OR REPLACE INTO "headache_partitioned" ({columns}) VALUES ({values}); END;'.
+    format(columns=MIRROR_COLUMNS, values=MIRROR_VALUES.format(row='new')),
+    'CREATE TRIGGER "headache_partitioned_delete" AFTER DELETE ON "headache" BEGIN '
+    'DELETE FROM "headache_partitioned" WHERE "_id" = old._id; END;',
+]
+
+CREATE_INDEX_REPORT = ('CREATE INDEX IF NOT EXISTS "headache_report" '
+                       'ON "headache" ("patient_id", "date", "intensity", "migraine", "medicine");')
+
+# Full-text index of the comments. It is an external content table, reading the comments from the headache table
+# itself, so only the index is stored twice; triggers keep it in sync with every write.
+FULL_TEXT_STATEMENTS = [
+    'CREATE VIRTUAL TABLE "headache_fts" USING fts5("comment", content="headache", content_rowid="_id", '
+    'tokenize="porter unicode61");',
+    'INSERT INTO "headache_fts" ("headache_fts") VALUES (\'rebuild\');',
+    'CREATE TRIGGER "headache_fts_insert" AFTER INSERT ON "headache" BEGIN '
+    'INSERT INTO "headache_fts" ("rowid", "comment") VALUES (new._id, new.comment); END;',
+    'CREATE TRIGGER "headache_fts_delete" AFTER DELETE ON "headache" BEGIN '
+    'INSERT INTO "headache_fts" ("headache_fts", "rowid", "comment") VALUES (\'delete\', old._id, old.comment); END;',
+    'CREATE TRIGGER "headache_fts_update" AFTER UPDATE OF "comment" ON "headache" BEGIN '
+    'INSERT INTO "headache_fts" ("headache_fts", "rowid", "comment") VALUES (\'delete\', old._id, old.comment); '
+    'INSERT INTO "headache_fts" ("rowid", "comment") VALUES (new._id, new.comment); END;',
+]
+# Monthly and weekly totals of each patient, kept up to date by triggers on each write, so that
+# statistics over many years only read a few rows per period. A week is named by the date of its monday.
+PERIODS = {
+    'month': 'substr({row}.date, 1, 7)',
+    'week': "date({row}.date, '-6 days', 'weekday 1')",
+}
+
+
+def aggregate_statements(period):
+    """Return the statements creating, filling and maintaining the aggregate table of a period."""
+    key = PERIODS[period]
+    add = ('INSERT INTO "headache_{period}" VALUES ({row}.patient_id, {key}, 1, {row}.intensity > 0, '
+           '{row}.intensity, {row}.migraine != 0, {row}.medicine != 0) '
+           'ON CONFLICT ("patient_id", "period") DO UPDATE SET "days" = "days" + 1, '
+           '"headache_days" = "headache_days" + excluded."headache_days", '
+           '"intensity_sum" = "intensity_sum" + excluded."intensity_sum", '
+           '"migraine_days" = "migraine_days" + excluded."migraine_days", '
+           '"medicine_days" = "medicine_days" + excluded."medicine_days";')
+    remove = ('UPDATE "headache_{period}" SET "days" = "days" - 1, '
+              '"headache_days" = "headache_days" - ({row}.intensity > 0), '
+              '"intensity_sum" = "intensity_sum" - {row}.intensity, '
+              '"migraine_days" = "migraine_days" - ({row}.migraine != 0), '
+              '"medicine_days" = "medicine_days" - ({row}.medicine != 0) '
+              'WHERE "patient_id" = {row}.patient_id AND "period" = {key};')
+    new = {'period': period, 'key': key.format(row='new'), 'row': 'new'}
+    old = {'period': period, 'key': key.format(row='old'), 'row': 'old'}
+    return [
+        'CREATE TABLE "headache_{period}" ('
+        '"patient_id" INTEGER NOT NULL, '
+        '"period" TEXT NOT NULL, '
+        '"days" INTEGER NOT NULL, '
+        '"headache_days" INTEGER NOT NULL, '
+        '"intensity_sum" INTEGER NOT NULL, '
+        '"migraine_days" INTEGER NOT NULL, '
+        '"medicine_days" INTEGER NOT NULL, '
+        'PRIMARY KEY ("patient_id", "period")'
+        ') WITHOUT ROWID;'.format(period=period),
+        'INSERT INTO "headache_{period}" SELECT patient_id, {key}, count(*), sum(intensity > 0), sum(intensity), '
+        'sum(migraine != 0), sum(medicine != 0) FROM "headache" GROUP BY 1, 2;'.
+        format(period=period, key=key.format(row='headache')),
+        'CREATE TRIGGER "headache_{period}_insert" AFTER INSERT ON "headache" BEGIN {add} END;'.
+        format(period=period, add=add.format(**new)),
+        'CREATE TRIGGER "headache_{period}_delete" AFTER DELETE ON "headache" BEGIN {remove} END;'.
+        format(period=period, remove=remove.format(**old)),
+        'CREATE TRIGGER "headache_{period}_update" AFTER UPDATE ON "headache" BEGIN {remove} {add} END;'.
+        format(period=period, remove=remove.format(**old), add=add.format(**new)),
+    ]
+
+
+# Version of the diary of each patient: the amount of writes it had, and the time (in seconds since the epoch) of
+# the last one, kept by triggers on each write, so that readers such as server.py tell cheaply whether what they
+# sent before is still valid, whichever connection or process wrote.
+VERSION_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+VERSION_CHANGE = ('INSERT INTO "headache_version" VALUES ({row}.patient_id, 1, {now}) '
+                  'ON CONFLICT ("patient_id") DO UPDATE SET "changes" = "changes" + 1, '
+                  '"modified" = excluded."modified";')
+VERSION_STATEMENTS = [
+    'CREATE TABLE "headache_version" ('
+    '"patient_id" INTEGER NOT NULL PRIMARY KEY, '
+    '"changes" INTEGER NOT NULL, '
+    '"modified" INTEGER NOT NULL'
+    ');',
+    'INSERT INTO "headache_version" SELECT "_id", 0, {now} FROM "patient";'.format(now=VERSION_NOW),
+    'CREATE TRIGGER "headache_version_insert" AFTER INSERT ON "headache" BEGIN {change} END;'.
+    format(change=VERSION_CHANGE.format(row='new', now=VERSION_NOW)),
+    'CREATE TRIGGER "headache_version_update" AFTER UPDATE ON "headache" BEGIN {change} END;'.
+    format(change=VERSION_CHANGE.format(row='new', now=VERSION_NOW)),
+    'CREATE TRIGGER "headache_version_delete" AFTER DELETE ON "headache" BEGIN {change} END;'.
+    format(change=VERSION_CHANGE.format(row='old', now=VERSION_NOW)),
+]
+
+
+class MigrationError(ValueError):
+    """The database cannot be migrated, e.g. its schema is newer than the application."""
+
+
+def exists(connection, name):
+    return connection.execute('select 1 from sqlite_master where name = ?', (name,)).fetchone() is not None
+
+
+def columns(connection, table):
+    return [row[1] for row in connection.execute('PRAGMA table_info("{table}")'.format(table=table))]
+
+
+def create_headache(database):
+    database.connection.execute(CREATE_TABLE_HEADACHE_V1)
+
+
+def copy_to_partitioned(database, progress):
+    """
+    Copy the rows of the headache table into the one partitioned by patient, a batch per transaction, so that the
+    database is never locked for long; the writes made meanwhile are mirrored by triggers. An interrupted copy is
+    resumed on the next start.
+    """
+    connection = database.connection
+    if 'patient_id' in columns(connection, 'headache'):
+        return
+    with database.transaction():
+        if not exists(connection, 'headache_partitioned'):
+            connection.execute(CREATE_TABLE_HEADACHE.format(table='headache_partitioned'))
+            for statement in MIRROR_STATEMENTS:
+                connection.execute(statement)
+    total = connection.execute('select count(*) from "headache"').fetchone()[0]
+    done = 0
+    last = 0
+    while True:
+        with database.transaction():
+            batch_end, count = connection.execute('select max("_id"), count(*) from (select "_id" from "headache" '
+                                                  'where "_id" > ? order by "_id" limit ?)',
+                                                  (last, BATCH_SIZE)).fetchone()
+            if batch_end is None:
+                break
+            # the rows already mirrored are more recent than the ones of the batch
+            connection.execute('INSERT OR IGNORE INTO "headache_partitioned" ({columns}) '
+                               'SELECT {values} FROM "headache" WHERE "_id" > ? AND "_id" <= ?'.
+                               format(columns=MIRROR_COLUMNS, values=MIRROR_VALUES.format(row='headache')),
+                               (last, batch_end))
+            done += count
+            last = batch_end
+        if progress is not None:
+            progress(min(done, total), total)
+
+
+def add_patients(database):
+    """Swap the headache table for its copy partitioned by patient, where each date is unique per patient."""
+    connection = database.connection
+    connection.execute(CREATE_TABLE_PATIENT)
+    connection.execute('INSERT OR IGNORE INTO "patient" ("_id", "name") VALUES (?, ?)',
+                       (DEFAULT_PATIENT_ID, DEFAULT_PATIENT))
+    if 'patient_id' in columns(connection, 'headache'):
+        return
+    for period in PERIODS:  # rebuilt per patient by a later migration
+        connection.execute('DROP TABLE IF EXISTS "headache_{period}"'.format(period=period))
+    connection.execute('DROP TABLE "headache"')  # with its indexes and triggers
+    connection.execute('ALTER TABLE "headache_partitioned" RENAME TO "headache"')
+    if exists(connection, 'headache_fts'):
+        for statement in FULL_TEXT_STATEMENTS[2:]:  # the index itself still matches the rows
+            connection.execute(statement)
+
+
+def add_report_index(database):
+    database.connection.execute(CREATE_INDEX_REPORT)
+
+
+def add_aggregates(database):
+    if exists(database.connection, 'headache_month'):
+        return
+    for period in PERIODS:
+        for statement in aggregate_statements(period):
+            database.connection.execute(statement)
+
+
+def add_full_text(database):
+    """Create the full-text index of the comments, unless sqlite was built without FTS5."""
+    if exists(database.connection, 'headache_fts'):
+        return
+    try:
+        database.connection.execute(FULL_TEXT_STATEMENTS[0])
+    except sql.OperationalError as e:
+        if not str(e).startswith('no such module'):
+            raise
+        return
+    for statement in FULL_TEXT_STATEMENTS[1:]:
+        database.connection.execute(statement)
+
+
+def add_versions(database):
+    if exists(database.connection, 'headache_version'):
+        return
+    for statement in VERSION_STATEMENTS:
+        database.connection.execute(statement)
+
+
+# (description, prepare, apply) of each version, in order. prepare, when given, runs first in transactions of its
+# own, e.g. to copy a big table in batches; apply then runs in the same transaction as the change of version.
+MIGRATIONS = [
+    ('create the headache table', None, create_headache),
+    ('add the patients', copy_to_partitioned, add_patients),
+    ('add the report index', None, add_report_index),
+    ('add the monthly and weekly aggregates', None, add_aggregates),
+    ('add the full-text index of the comments', None, add_full_text),
+    ('add the version of the diaries', None, add_versions),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(database, progress=None, target=SCHEMA_VERSION):
+    """
+    Apply the migrations that the database (a Storage) lacks, in order, up to the version target, and return how
+    many were applied. progress, when given, is called with the description of each migration when it starts,
+    and then with the amounts of rows done and to do of its batches.
+    """
+    current = version(database.connection)
+    if current > SCHEMA_VERSION:
+        raise MigrationError('the schema of the database (version {current}) is newer than the one of the '
+                             'application (version {latest}).'.format(current=current, latest=SCHEMA_VERSION))
+    for number in range(current + 1, target + 1):
+        description, prepare, apply = MIGRATIONS[number - 1]
+        if progress is not None:
+            progress(description, 0, 0)
+        if prepare is not None:
+            prepare(database, None if progress is None else
+                    lambda done, total, description=description: progress(description, done, total))
+        with database.transaction():
+            apply(database)
+            database.connection.execute('PRAGMA user_version = {number}'.format(number=number))
+    return max(0, target - current)
@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# The report, statistics and maintenance windows, only imported when the report is first opened, so that they do
+# not slow down the start of the main window.
+
+import tkinter as tk  # GUI toolkit
+from tkinter import ttk  # widget for the separator
+from tkinter import filedialog  # file dialog for the report export
+from tkinter import tix
+import os
+import storage  # database queries
+import analytics  # trends of the statistics window
+import export  # report exporters
+from widgets import DISABLED_BUTTON_BKGRND, ENABLED_BUTTON_BKGRND, load_tix
+from instrumentation import timed  # opt-in timing of the population of the windows
+
+CHART_HEIGHT = 150  # pixels of the chart of the report
+CHART_MARGINS = (30, 10, 10, 20)  # left, top, right and bottom pixels around the plot, for the labels
+CHART_RANGE_COLOR = 'LightSteelBlue'  # lowest to highest intensity of each column of pixels
+CHART_AVERAGE_COLOR = 'SteelBlue'
+CHART_GRID_COLOR = 'Gainsboro'
+
+
+class Maintenance(tk.Toplevel):
+
+    def __init__(self, worker, master=None, row=None):
+        tk.Toplevel.__init__(self)
+
+        # Properties:
+        self.worker = worker
+        self.master = master
+        self.row = row
+        self.date = row.date
+        self.intensity = row.intensity
+        self.migraine = row.migraine
+        self.medicine = row.medicine
+        self.comment = row.comment
+        self.result = None  # the updated storage.Row, once saved
+        self.title('Maintenance for {date}'.format(date=self.date))
+        self.resizable(True, True)
+
+        # data
+        self.list_values_headache = ('0 - none', '1 - weak', '2 - medium', '3 - strong')
+        self.list_value_headache = tk.StringVar()
+        self.list_value_headache.set(str(self.list_values_headache[self.intensity]))
+        self.check_migraine_value = tk.IntVar()
+        self.check_migraine_value.set(self.migraine)
+        self.check_medicine_value = tk.IntVar()
+        self.check_medicine_value.set(self.medicine)
+
+        # widget creation
+        self.label_date = tk.Label(self, text='Date under maintenance:')
+        self.label_date_value = tk.Label(self, text=self.date)
+        self.label_intensity = tk.Label(self, text='Headache intensity:')
+        self.combo_headache = tk.OptionMenu(self, self.list_value_headache, *self.list_values_headache)
+        self.label_migraine = tk.Label(self, text='Migraine:')
+        self.check_migraine = tk.Checkbutton(self, variable=self.check_migraine_value)
+        self.label_medicine = tk.Label(self, text='Medicine:')
+        self.check_medicine = tk.Checkbutton(self, variable=self.check_medicine_value)
+        self.label_comment = tk.Label(self, text='Comment:')
+        self.text_comment = tk.Text(self, wrap=tk.WORD, height=3, width=1)
+        self.button_save = tk.Button(self, text='Save', command=self.save_data)
+        self.button_cancel = tk.Button(self, text='Cancel', command=self.cancel)
+        self.separator = ttk.Separator(self, orient=tk.HORIZONTAL)
+        self.label_status = tk.Label(self, text='Maintenance ready.')
+
+        self.balloon = tix.Balloon(self.master)
+
+        self.balloon.bind_widget(self.combo_headache,
+                                 balloonmsg='Click to select the intensity of your headache.')
+        self.balloon.bind_widget(self.check_migraine,
+                                 balloonmsg='Mark this box if you feel like the headache is connected to migraine.')
+        self.balloon.bind_widget(self.check_medicine,
+                                 balloonmsg='Mark this box if you took some medicine to alleviate the headache.')
+        self.balloon.bind_widget(self.text_comment,
+                                 balloonmsg='Add any comment you think is relevant for the selected date.')
+        self.balloon.bind_widget(self.button_cancel,
+                                 balloonmsg='Dismiss this window without changing any value.')
+        self.balloon.bind_widget(self.button_save,
+                                 balloonmsg='Update all the input information for the current selected date.')
+
+        # widgets manipulation on window startup
+        self.text_comment.delete(tk.INSERT, tk.END)
+        if self.comment is not None:
+            self.text_comment.insert(tk.INSERT, self.comment)
+        self.button_save.configure(background=ENABLED_BUTTON_BKGRND)
+
+        # row and column configuration
+        self.rowconfigure(0, weight=0)
+        self.rowconfigure(1, weight=0)
+        self.rowconfigure(2, weight=0)
+        self.rowconfigure(3, weight=0)
+        self.rowconfigure(4, weight=0)
+        self.rowconfigure(5, weight=1)
+        self.rowconfigure(6, weight=0)
+        self.rowconfigure(7, weight=0)
+        self.rowconfigure(8, weight=0)
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(1, weight=1)
+
+        # widget deployment
+        self.label_date.grid(row=0, column=0, sticky=tk.W, padx=5)
+        self.label_date_value.grid(row=0, column=1, sticky=tk.E, padx=5)
+        self.label_intensity.grid(row=1, column=0, sticky=tk.W, padx=5)
+        self.combo_headache.grid(row=1, column=1, sticky=tk.W + tk.E, padx=5)
+        self.label_migraine.grid(row=2, column=0, sticky=tk.W, padx=5)
+        self.check_migraine.grid(row=2, column=1, sticky=tk.E, padx=5)
+        self.label_medicine.grid(row=3, column=0, sticky=tk.W, padx=5)
+        self.check_medicine.grid(row=3, column=1, sticky=tk.E, padx=5)
+        self.label_comment.grid(row=4, column=0, sticky=tk.W, padx=5)
+        self.text_comment.grid(row=5, column=0, sticky=tk.W + tk.E + tk.N + tk.S, padx=5, columnspan=2)
+        self.button_save.grid(row=6, column=1, sticky=tk.E, pady=5, padx=5)
+        self.button_cancel.grid(row=6, column=0, sticky=tk.W, pady=5, padx=5)
+        self.separator.grid(row=7, column=0, sticky=tk.W + tk.E, columnspan=2)
+        self.label_status.grid(row=8, column=0, sticky=tk.W, columnspan=2)
+
+    def save_data(self):
+        self.intensity = int(self.list_value_headache.get()[0])
+        self.migraine = self.check_migraine_value.get()
+        self.medicine = self.check_medicine_value.get()
+        self.comment = self.text_comment.get('1.0', tk.END)
+        if self.comment == '\n':
+            self.comment = None
+        if self.comment is not None and self.comment[-1] == '\n':
+            self.comment = self.comment[0:-1]
+        self.button_save.configure(state=tk.DISABLED)
+        self.button_save.configure(background=DISABLED_BUTTON_BKGRND)
+        self.label_status.configure(text='Saving...')
+        self.worker.submit(storage.Storage.update, self.date, self.intensity, self.migraine, self.medicine,
+                           self.comment, callback=self.saved, errback=self.save_failed)
+
+    def saved(self, result):
+        if self.winfo_exists():
+            self.result = self.row.replaced((self.date, self.intensity, self.migraine, self.medicine, self.comment))
+            self.destroy()
+
+    def save_failed(self, error):
+        if self.winfo_exists():
+            self.button_save.configure(state=tk.NORMAL)
+            self.button_save.configure(background=ENABLED_BUTTON_BKGRND)
+            self.label_status.configure(text='( X ) The changes could not be saved: ' + str(error))
+
+    def cancel(self):
+        self.destroy()
+
+
+class Statistics(tk.Toplevel):
+
+    def __init__(self, worker, master=None):
+        tk.Toplevel.__init__(self)
+
+        # Properties:
+        self.worker = worker
+        self.master = master
+        self.title('Statistics')
+        self.resizable(True, True)
+
+        # data
+        self.period_values = ('month', 'week')
+        self.period_value = tk.StringVar()
+        self.period_value.set(self.period_values[0])
+
+        # widget creation
+        self.label_period = tk.Label(self, text='Summarize by:')
+        self.combo_period = tk.OptionMenu(self, self.period_value, *self.period_values, command=self.show_statistics)
+        self.frame_hlist = tk.Frame(self)
+        self.vscroll_list = tk.Scrollbar(self.frame_hlist, orient=tk.VERTICAL)
+        self.hlist = tix.HList(self.frame_hlist, yscrollcommand=self.vscroll_list.set, columns=6, header=True,
+                               height=20, width=90, selectmode='browse')
+        self.vscroll_list.configure(command=self.hlist.yview)
+        self.text_trends = tk.Text(self, wrap=tk.WORD, height=18, width=90, font='TkFixedFont')
+        self.button_close = tk.Button(self, text='Close', command=self.close)
+        self.separator = ttk.Separator(self, orient=tk.HORIZONTAL)
+        self.label_status = tk.Label(self, text='')
+
+        self.balloon = tix.Balloon(self.master)
+
+        self.balloon.bind_widget(self.combo_period,
+                                 balloonmsg='Select the period of each line of the statistics.')
+        self.balloon.bind_widget(self.text_trends,
+                                 balloonmsg='Trends of the whole diary: rolling averages, streaks, medication overuse\n'
+                                            'and the headaches of each day of the week.')
+        self.balloon.bind_widget(self.button_close,
+                                 balloonmsg='Close this statistics window.')
+
+        # widgets manipulation on window startup
+        self.hlist.header_create(0, text='Period')
+        self.hlist.header_create(1, text='Filled days')
+        self.hlist.header_create(2, text='Headache days')
+        self.hlist.header_create(3, text='Average intensity')
+        self.hlist.header_create(4, text='Migraine days')
+        self.hlist.header_create(5, text='Medicine days')
+
+        # row and column configuration
+        self.rowconfigure(0, weight=0)
+        self.rowconfigure(1, weight=1)
+        self.rowconfigure(2, weight=0)
+        self.rowconfigure(3, weight=0)
+        self.rowconfigure(4, weight=0)
+        self.rowconfigure(5, weight=0)
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(1, weight=0)
+
+        self.frame_hlist.rowconfigure(0, weight=1)
+        self.frame_hlist.columnconfigure(0, weight=1)
+        self.frame_hlist.columnconfigure(1, weight=0)
+
+        # widget deployment
+        self.label_period.grid(row=0, column=0, sticky=tk.W, padx=5)
+        self.combo_period.grid(row=0, column=1, sticky=tk.W + tk.E, padx=5, pady=5)
+        self.frame_hlist.grid(row=1, column=0, sticky=tk.W + tk.E + tk.N + tk.S, padx=5, columnspan=2)
+        self.hlist.grid(row=0, column=0, sticky=tk.W + tk.E + tk.N + tk.S)
+        self.vscroll_list.grid(row=0, column=1, sticky=tk.N + tk.S)
+        self.text_trends.grid(row=2, column=0, sticky=tk.W + tk.E, padx=5, pady=(5, 0), columnspan=2)
+        self.button_close.grid(row=3, column=1, sticky=tk.E, padx=5, pady=5)
+        self.separator.grid(row=4, column=0, sticky=tk.W + tk.E, columnspan=2)
+        self.label_status.grid(row=5, column=0, sticky=tk.W, columnspan=2)
+
+        self.show_statistics()
+        self.show_trends()
+
+    def show_statistics(self, period=None):
+        self.label_status.configure(text='Reading the statistics...')
+        self.worker.submit(storage.Storage.statistics, self.period_value.get(), callback=self.display_statistics,
+                           errback=self.statistics_failed)
+
+    @timed('statistics.display_statistics')
+    def display_statistics(self, statistics):
+        if not self.winfo_exists():
+            return
+        self.hlist.delete_all()
+        current_row = 0
+        for i in statistics:
+            # i[0] = period; i[1] = days; i[2] = headache days; i[3] = average; i[4] = migraine; i[5] = medicine
+            self.hlist.add(current_row)
+            self.hlist.item_create(current_row, 0, text=i[0])
+            self.hlist.item_create(current_row, 1, text=str(i[1]))
+            self.hlist.item_create(current_row, 2, text=str(i[2]))
+            self.hlist.item_create(current_row, 3, text='{:.2f}'.format(i[3]))
+            self.hlist.item_create(current_row, 4, text=str(i[4]))
+            self.hlist.item_create(current_row, 5, text=str(i[5]))
+            current_row += 1
+        self.label_status.configure(text='Statistics of ' + str(current_row) + ' ' + self.period_value.get() +
+                                         ('s.' if current_row != 1 else '.'))
+
+    def show_trends(self):
+        self.text_trends.insert(tk.END, 'Computing the trends...')
+        self.text_trends.configure(state=tk.DISABLED)
+        self.worker.submit(lambda database: analytics.describe(analytics.Series.load(database)),
+                           callback=self.display_trends, errback=self.statistics_failed)
+
+    @timed('statistics.display_trends')
+    def display_trends(self, lines):
+        if not self.winfo_exists():
+            return
+        self.text_trends.configure(state=tk.NORMAL)
+        self.text_trends.delete('1.0', tk.END)
+        self.text_trends.insert(tk.END, '\n'.join(lines))
+        self.text_trends.configure(state=tk.DISABLED)
+
+    def statistics_failed(self, error):
+        if self.winfo_exists():
+            self.label_status.configure(text='( X ) The statistics could not be read: ' + str(error))
+
+    def close(self):
+        self.destroy()
+
+
+class Report(tk.Toplevel):
+
+    def __init__(self, worker, master=None):
+        tk.Toplevel.__init__(self)
+
+        # Properties:
+        self.worker = worker
+        self.master = master
+        self.title('Report')
+        self.resizable(True, True)
+        load_tix(self)
+        self.report_data = list()  # rows currently displayed in the list
+        self.column_size = export.COLUMN_SIZE
+        self.visible_rows = 25  # the list only holds the rows that fit in it
+        self.first_row = 0
+        self.requested_row = 0  # first row asked by the scrollbar, displayed once fetched
+        self.fetching = False  # whether some rows are being read by the database thread
+        self.displayed_rows = 0  # amount of entries created in the list
+        self.pager = None
+        self.chart = None  # storage.Chart of the displayed filter
+
+        # data
+        self.filter_values = storage.REPORT_FILTERS
+        self.filter_value = tk.StringVar()
+        self.filter_value.set(self.filter_values[0])
+        self.list_value = tk.StringVar()
+        self.check_reverse_dates = tk.IntVar()
+        self.check_reverse_dates.set(0)
+        self.ord = 'ASC'
+        self.start_value = tk.StringVar()
+        self.end_value = tk.StringVar()
+        self.intensity_values = ('0 - any', '1 - weak', '2 - medium', '3 - strong')
+        self.intensity_value = tk.StringVar()
+        self.intensity_value.set(self.intensity_values[0])
+        self.check_migraine_value = tk.IntVar()
+        self.check_migraine_value.set(0)
+        self.check_medicine_value = tk.IntVar()
+        self.check_medicine_value.set(0)
+        self.comment_value = tk.StringVar()
+        self.search_value = tk.StringVar()
+
+        # widget creation
+        self.label_filter = tk.Label(self, text='Choose a filter:')
+        self.label_reverse = tk.Label(self, text='Most recent on top:')
+        self.check_reverse = tk.Checkbutton(self, variable=self.check_reverse_dates)
+        self.combo_filter = tk.OptionMenu(self, self.filter_value, *self.filter_values,
+                                          command=self.choose_filter)  # official
+        # self.combo_filter = ttk.Combobox(self, textvariable=self.filter_value, values=self.filter_values) # experiment
+        self.button_filter = tk.Button(self, text='Filter', command=self.search_data)
+
+        self.frame_conditions = tk.Frame(self)
+        self.label_start = tk.Label(self.frame_conditions, text='From:')
+        self.entry_start = tk.Entry(self.frame_conditions, textvariable=self.start_value, width=11)
+        self.label_end = tk.Label(self.frame_conditions, text='To:')
+        self.entry_end = tk.Entry(self.frame_conditions, textvariable=self.end_value, width=11)
+        self.label_intensity = tk.Label(self.frame_conditions, text='Minimum intensity:')
+        self.combo_intensity = tk.OptionMenu(self.frame_conditions, self.intensity_value, *self.intensity_values)
+        self.label_migraine = tk.Label(self.frame_conditions, text='Migraine only:')
+        self.check_migraine = tk.Checkbutton(self.frame_conditions, variable=self.check_migraine_value)
+        self.label_medicine = tk.Label(self.frame_conditions, text='Medicine only:')
+        self.check_medicine = tk.Checkbutton(self.frame_conditions, variable=self.check_medicine_value)
+        self.label_comment = tk.Label(self.frame_conditions, text='Comment contains:')
+        self.entry_comment = tk.Entry(self.frame_conditions, textvariable=self.comment_value, width=20)
+        self.label_search = tk.Label(self.frame_conditions, text='Search the comments:')
+        self.entry_search = tk.Entry(self.frame_conditions, textvariable=self.search_value)
+        self.button_search = tk.Button(self.frame_conditions, text='Search', command=self.search_comments)
+
+        self.frame_hlist = tk.Frame(self)
+        self.vscroll_list = tk.Scrollbar(self.frame_hlist, orient=tk.VERTICAL)
+        self.hscroll_list = tk.Scrollbar(self.frame_hlist, orient=tk.HORIZONTAL)
+        self.hlist = tix.HList(self.frame_hlist, xscrollcommand=self.hscroll_list.set, columns=5, header=True,
+                               height=self.visible_rows, width=100, indicator=True, selectmode='browse',
+                               command=self.double_click)
+        self.vscroll_list.configure(command=self.scroll_list)
+        self.hscroll_list.configure(command=self.hlist.xview)
+
+        self.canvas_chart = tk.Canvas(self, height=CHART_HEIGHT, background='white', highlightthickness=0)
+
+        self.button_export_txt = tk.Button(self, text='Export to txt', command=self.export_to_txt)
+        self.button_statistics = tk.Button(self, text='Statistics', command=self.show_statistics)
+        self.button_close = tk.Button(self, text='Close', command=self.close)
+        self.separator = ttk.Separator(self, orient=tk.HORIZONTAL)
+        self.label_status = tk.Label(self, text='')
+        self.balloon = tix.Balloon(self.master)
+
+        self.balloon.bind_widget(self.check_reverse,
+                                 balloonmsg='Mark this option to display the most recent dates on top of the list.')
+        self.balloon.bind_widget(self.combo_filter,
+                                 balloonmsg='Select the range of your search.')
+        self.balloon.bind_widget(self.entry_start,
+                                 balloonmsg='First date of the search, as YYYY-MM-DD. Leave it empty to start at '
+                                            'the first entry.')
+        self.balloon.bind_widget(self.entry_end,
+                                 balloonmsg='Last date of the search, as YYYY-MM-DD. Leave it empty to end at the '
+                                            'last entry.')
+        self.balloon.bind_widget(self.combo_intensity,
+                                 balloonmsg='Only display the dates with at least this headache intensity.')
+        self.balloon.bind_widget(self.check_migraine,
+                                 balloonmsg='Mark this option to only display the dates connected to migraine.')
+        self.balloon.bind_widget(self.check_medicine,
+                                 balloonmsg='Mark this option to only display the dates when some medicine was taken.')
+        self.balloon.bind_widget(self.entry_comment,
+                                 balloonmsg='Only display the dates whose comment contains this text.')
+        self.balloon.bind_widget(self.entry_search,
+                                 balloonmsg='Words to find in the comments, e.g. a trigger or the name of a medicine.')
+        self.balloon.bind_widget(self.button_search,
+                                 balloonmsg='Display the dates whose comment has all the words, best matches first, '
+                                            'among the dates of the filter.')
+        self.balloon.bind_widget(self.button_filter,
+                                 balloonmsg='Apply the filter based on your search.')
+        self.balloon.bind_widget(self.hlist,
+                                 balloonmsg='Double click to edit an entry.')
+        self.balloon.bind_widget(self.canvas_chart,
+                                 balloonmsg='Headache intensity of the filtered dates over time: the range of each\n'
+                                            'column, from the lowest to the highest, and its average.')
+        self.balloon.bind_widget(self.button_export_txt,
+                                 balloonmsg='Export the table values to a text file.')
+        self.balloon.bind_widget(self.button_statistics,
+                                 balloonmsg='Open the monthly and weekly statistics of all the available data.')
+        self.balloon.bind_widget(self.button_close,
+                                 balloonmsg='Close this report window.')
+
+        # widgets manipulation on window startup
+        self.button_export_txt.configure(state=tk.DISABLED)
+        self.button_export_txt.configure(background=DISABLED_BUTTON_BKGRND)
+        # self.combo_filter.state(statespec=('!disabled', 'readonly'))  # experimental
+        self.hlist.header_create(0, text='Date                          ')
+        self.hlist.header_create(1, text='Intensity')
+        self.hlist.header_create(2, text='Migraine')
+        self.hlist.header_create(3, text='Medicine')
+        self.hlist.header_create(4, text='Comment')
+        self.hlist.bind('<MouseWheel>', self.mouse_wheel)
+        self.hlist.bind('<Button-4>', self.mouse_wheel)
+        self.hlist.bind('<Button-5>', self.mouse_wheel)
+        for entry in (self.entry_start, self.entry_end, self.entry_comment):
+            entry.bind('<Return>', lambda event: self.search_data())
+        self.entry_search.bind('<Return>', lambda event: self.search_comments())
+        self.canvas_chart.bind('<Configure>', lambda event: self.draw_chart())
+        self.choose_filter(self.filter_value.get())
+
+        # row and column configuration
+        self.rowconfigure(0, weight=0)
+        self.rowconfigure(1, weight=0)
+        self.rowconfigure(2, weight=1)
+        self.rowconfigure(3, weight=0)
+        self.rowconfigure(4, weight=0)
+        self.rowconfigure(5, weight=0)
+        self.rowconfigure(6, weight=0)
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(1, weight=0)
+        self.columnconfigure(2, weight=0)
+        self.columnconfigure(3, weight=0)
+        self.columnconfigure(4, weight=0)
+
+        self.frame_conditions.columnconfigure(11, weight=1)
+
+        self.frame_hlist.rowconfigure(0, weight=1)
+        self.frame_hlist.rowconfigure(1, weight=0)
+        self.frame_hlist.columnconfigure(0, weight=1)
+        self.frame_hlist.columnconfigure(1, weight=0)
+
+        # widget deployment
+        self.label_filter.grid(row=0, column=0, sticky=tk.W, padx=5)
+        self.label_reverse.grid(row=0, column=1, sticky=tk.W)
+        self.check_reverse.grid(row=0, column=2, sticky=tk.W)
+        self.combo_filter.grid(row=0, column=3, sticky=tk.W + tk.E, pady=5)
+        self.button_filter.grid(row=0, column=4, sticky=tk.W + tk.E, padx=5)
+
+        self.frame_conditions.grid(row=1, column=0, sticky=tk.W + tk.E, padx=5, columnspan=5)
+        self.label_start.grid(row=0, column=0, sticky=tk.W)
+        self.entry_start.grid(row=0, column=1, sticky=tk.W)
+        self.label_end.grid(row=0, column=2, sticky=tk.W, padx=(5, 0))
+        self.entry_end.grid(row=0, column=3, sticky=tk.W)
+        self.label_intensity.grid(row=0, column=4, sticky=tk.W, padx=(5, 0))
+        self.combo_intensity.grid(row=0, column=5, sticky=tk.W)
+        self.label_migraine.grid(row=0, column=6, sticky=tk.W, padx=(5, 0))
+        self.check_migraine.grid(row=0, column=7, sticky=tk.W)
+        self.label_medicine.grid(row=0, column=8, sticky=tk.W)
+        self.check_medicine.grid(row=0, column=9, sticky=tk.W)
+        self.label_comment.grid(row=0, column=10, sticky=tk.W)
+        self.entry_comment.grid(row=0, column=11, sticky=tk.W + tk.E, pady=5)
+        self.label_search.grid(row=1, column=0, sticky=tk.W, columnspan=4)
+        self.entry_search.grid(row=1, column=4, sticky=tk.W + tk.E, columnspan=8, pady=(0, 5))
+        self.button_search.grid(row=1, column=12, sticky=tk.W + tk.E, padx=(5, 0), pady=(0, 5))
+
+        self.frame_hlist.grid(row=2, column=0, sticky=tk.W + tk.E + tk.N + tk.S, padx=5, columnspan=5)
+        self.hlist.grid(row=0, column=0, sticky=tk.W + tk.E + tk.N + tk.S)
+        self.vscroll_list.grid(row=0, column=1, sticky=tk.N + tk.S)
+        self.hscroll_list.grid(row=1, column=0, sticky=tk.W + tk.E)
+
+        self.canvas_chart.grid(row=3, column=0, sticky=tk.W + tk.E, padx=5, pady=(5, 0), columnspan=5)
+
+        self.button_export_txt.grid(row=4, column=0, sticky=tk.W, padx=5, pady=5)
+        self.button_statistics.grid(row=4, column=3, sticky=tk.W + tk.E, pady=5)
+        self.button_close.grid(row=4, column=4, sticky=tk.W, padx=5, pady=5)
+        self.separator.grid(row=5, column=0, sticky=tk.W + tk.E, columnspan=5)
+        self.label_status.grid(row=6, column=0, sticky=tk.W, columnspan=5)
+
+    def double_click(self, entry):
+        entry_number = int(entry)
+        maintenance = Maintenance(worker=self.worker, master=self, row=self.report_data[entry_number])
+        maintenance.transient(self)
+        maintenance.geometry('600x300')
+
+        if os.name == 'nt':
+            maintenance.update_idletasks()
+            x = (maintenance.winfo_screenwidth() - maintenance.winfo_reqwidth()) / 2
+            y = (maintenance.winfo_screenheight() - maintenance.winfo_reqheight()) / 2
+            maintenance.geometry('+%d+%d' % (x, y))
+
+        self.wait_window(maintenance)
+        if maintenance.result is not None:
+            self.update_row(entry_number, maintenance.result)
+
+    def update_row(self, entry_number, row):
+        """Patch a single displayed row after it was changed in the database."""
+        pager = self.pager
+        offset = self.first_row + entry_number
+        self.report_data[entry_number] = row
+        self.worker.submit(lambda database: pager.update(offset, row))
+        self.display_row(entry_number, row)
+        self.show_chart(pager.report_filter)  # read again, as the cached one is outdated by the change
+
+    def choose_filter(self, value):
+        """Fill the date range with the one of the chosen filter, which can then be refined."""
+        report_filter = storage.ReportFilter.preset(value)
+        self.start_value.set(report_filter.start or '')
+        self.end_value.set(report_filter.end or '')
+
+    def read_filter(self):
+        """Return the ReportFilter of the conditions, or None after telling why they are invalid."""
+        try:
+            return storage.ReportFilter(self.start_value.get().strip() or None,
+                                        self.end_value.get().strip() or None,
+                                        int(self.intensity_value.get()[0]),
+                                        self.check_migraine_value.get(), self.check_medicine_value.get(),
+                                        self.comment_value.get().strip() or None)
+        except ValueError as e:
+            self.label_status.configure(text='( X ) Invalid filter: ' + str(e))
+            return None
+
+    def search_data(self):
+        report_filter = self.read_filter()
+        if report_filter is None:
+            return
+
+        if self.check_reverse_dates.get() == 1:
+            self.ord = 'DESC'
+        else:
+            self.ord = 'ASC'
+
+        self.run_query(storage.Storage.pager, report_filter, self.ord)
+
+    def search_comments(self):
+        text = self.search_value.get().strip()
+        if not text:
+            self.label_status.configure(text='Type the words to search in the comments.')
+            return
+        report_filter = self.read_filter()
+        if report_filter is None:
+            return
+        self.run_query(storage.Storage.search_pager, text, report_filter)
+
+    def run_query(self, function, *args):
+        self.button_export_txt.configure(state=tk.DISABLED)
+        self.button_export_txt.configure(background=DISABLED_BUTTON_BKGRND)
+        self.button_filter.configure(state=tk.DISABLED)
+        self.button_search.configure(state=tk.DISABLED)
+
+        self.label_status.configure(text='Running the query...')
+        self.worker.submit(function, *args, callback=self.display_report, errback=self.query_failed)
+
+    @timed('report.display_report')
+    def display_report(self, pager):
+        if not self.winfo_exists():
+            return
+        self.report_data.clear()
+        self.hlist.delete_all()
+        self.displayed_rows = 0
+        self.button_filter.configure(state=tk.NORMAL)
+        self.button_search.configure(state=tk.NORMAL)
+
+        self.pager = pager
+        quantity = self.pager.total
+        if isinstance(self.pager, storage.SearchPager):
+            self.label_status.configure(text='Search results for ' + str(self.pager.report_filter) +
+                                        ', best matches first. Returned items: ' + str(quantity))
+        else:
+            self.label_status.configure(text='Report generated for ' + str(self.pager.report_filter) +
+                                        '. Returned items: ' + str(quantity))
+            self.worker.submit(storage.Storage.pager_cache, callback=lambda stats: self.display_cache(pager, stats))
+
+        self.show_rows(0)
+        self.show_chart(self.pager.report_filter)
+
+        if quantity > 0:
+            self.button_export_txt.configure(state=tk.NORMAL)
+            self.button_export_txt.configure(background=ENABLED_BUTTON_BKGRND)
+            self.button_export_txt.flash()
+
+    def display_cache(self, pager, stats):
+        """Tell how often the reports were read from the cache, and how much memory it holds."""
+        hits, misses, size = stats
+        if self.winfo_exists() and pager is self.pager and hits + misses > 0:
+            self.label_status.configure(text=self.label_status.cget('text') + '. Cache: {:.0%} hits, {:.0f} KiB'
+                                        .format(hits / (hits + misses), size / 1024))
+
+    def show_chart(self, report_filter):
+        self.worker.submit(storage.Storage.chart, report_filter, callback=self.display_chart,
+                           errback=self.query_failed)
+
+    def display_chart(self, chart):
+        if self.winfo_exists() and chart is not self.chart:  # the same one when only the order changed
+            self.chart = chart
+            self.draw_chart()
+
+    @timed('report.draw_chart')
+    def draw_chart(self):
+        """
+        Draw the chart on the canvas: its columns of days are merged into columns of pixels, so that drawing it
+        only depends on the width of the canvas.
+        """
+        canvas = self.canvas_chart
+        canvas.delete(tk.ALL)
+        left, top, right, bottom = CHART_MARGINS
+        width = canvas.winfo_width() - left - right
+        height = canvas.winfo_height() - top - bottom
+        if width <= 0 or height <= 0:
+            return
+        for intensity in range(4):
+            y = top + (3 - intensity) * height / 3
+            canvas.create_line(left, y, left + width, y, fill=CHART_GRID_COLOR)
+            canvas.create_text(left - 5, y, text=str(intensity), anchor=tk.E)
+        chart = self.chart
+        if chart is None or not chart.columns:
+            canvas.create_text(left + width / 2, top + height / 2, text='No data to chart.')
+            return
+        pixels = dict()  # x -> [lowest, highest, intensity sum, filled days]
+        for column, lowest, highest, average, days in chart.columns:
+            x = left + int((column + 0.5) * width / chart.width)
+            pixel = pixels.get(x)
+            if pixel is None:
+                pixels[x] = [lowest, highest, average * days, days]
+            else:
+                pixel[0] = min(pixel[0], lowest)
+                pixel[1] = max(pixel[1], highest)
+                pixel[2] += average * days
+                pixel[3] += days
+        averages = list()
+        for x in sorted(pixels):
+            lowest, highest, total, days = pixels[x]
+            canvas.create_line(x, top + (3 - lowest) * height / 3 + 1, x, top + (3 - highest) * height / 3 - 1,
+                               fill=CHART_RANGE_COLOR)
+            averages.extend((x, top + (3 - total / days) * height / 3))
+        if len(averages) > 2:
+            canvas.create_line(*averages, fill=CHART_AVERAGE_COLOR, width=2)
+        else:
+            canvas.create_oval(averages[0] - 2, averages[1] - 2, averages[0] + 2, averages[1] + 2,
+                               fill=CHART_AVERAGE_COLOR, outline='')
+        y = top + height + 3
+        canvas.create_text(left, y, text=chart.date(0), anchor=tk.NW)
+        canvas.create_text(left + width / 2, y, text=chart.date(chart.width / 2), anchor=tk.N)
+        canvas.create_text(left + width, y, text=chart.last_date(), anchor=tk.NE)
+
+    def query_failed(self, error):
+        if self.winfo_exists():
+            self.button_filter.configure(state=tk.NORMAL)
+            self.button_search.configure(state=tk.NORMAL)
+            self.label_status.configure(text='( X ) The report could not be generated: ' + str(error))
+
+    def show_rows(self, first_row):
+        """Ask for the rows of the report starting at first_row; only one read is in progress at a time."""
+        if self.pager is None:
+            return
+        self.requested_row = max(0, min(first_row, self.pager.total - self.visible_rows))
+        if not self.fetching:
+            self.fetch_rows()
+
+    def fetch_rows(self):
+        pager = self.pager
+        first_row = self.requested_row
+        self.fetching = True
+        self.worker.submit(lambda database: pager.rows(first_row, self.visible_rows),
+                           callback=lambda rows: self.display_rows(pager, first_row, rows),
+                           errback=self.query_failed)
+
+    @timed('report.display_rows')
+    def display_rows(self, pager, first_row, rows):
+        """Display the rows read from first_row, reusing the items already in the list."""
+        self.fetching = False
+        if not self.winfo_exists():
+            return
+        if pager is not self.pager or first_row != self.requested_row:  # the list was scrolled meanwhile
+            self.fetch_rows()
+            return
+        self.first_row = first_row
+        self.report_data.clear()
+
+        current_row = 0
+
+        for row in rows:
+            self.report_data.append(row)
+            self.display_row(current_row, row)
+            current_row += 1
+
+        for entry in range(current_row, self.displayed_rows):
+            self.hlist.delete_entry(entry)
+        self.displayed_rows = current_row
+
+        if self.pager.total > 0:
+            self.vscroll_list.set(self.first_row / self.pager.total,
+                                  (self.first_row + len(rows)) / self.pager.total)
+        else:
+            self.vscroll_list.set(0, 1)
+
+    def display_row(self, entry, row):
+        strings = row.display()  # date, intensity, migraine, medicine and comment, made once per row
+        if entry < self.displayed_rows:
+            for column, text in enumerate(strings):
+                self.hlist.item_configure(entry, column, text=text)
+        else:
+            self.hlist.add(entry)
+            for column, text in enumerate(strings):
+                self.hlist.item_create(entry, column, text=text)
+
+    def scroll_list(self, action, amount, unit=None):
+        if action == tk.MOVETO:
+            self.show_rows(int(float(amount) * self.pager.total) if self.pager is not None else 0)
+        elif unit == tk.PAGES:
+            self.show_rows(self.requested_row + int(amount) * self.visible_rows)
+        else:
+            self.show_rows(self.requested_row + int(amount))
+
+    def mouse_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.show_rows(self.requested_row - 3)
+        else:
+            self.show_rows(self.requested_row + 3)
+
+    def show_statistics(self):
+        statistics = Statistics(worker=self.worker, master=self)
+        statistics.transient(self)
+
+        if os.name == 'nt':
+            statistics.update_idletasks()
+            x = (statistics.winfo_screenwidth() - statistics.winfo_reqwidth()) / 2
+            y = (statistics.winfo_screenheight() - statistics.winfo_reqheight()) / 2
+            statistics.geometry('+%d+%d' % (x, y))
+
+    def export_to_txt(self):
+        path = filedialog.asksaveasfilename(defaultextension='.txt', filetypes=[('TXT', '.txt')],
+                                            initialfile='my_headache_diary_report', parent=self)
+
+        if path == () or path == '':
+            self.label_status.configure(text='Export to txt cancelled by the user.')
+        else:
+            self.button_export_txt.configure(state=tk.DISABLED)
+            self.button_export_txt.configure(background=DISABLED_BUTTON_BKGRND)
+            self.label_status.configure(text='Exporting to txt...')
+            total = self.pager.total
+            self.worker.submit(export.export_txt, path, self.pager.report_filter, self.pager.ord, self.column_size,
+                               lambda count: self.worker.post(self.export_progress, count, total),
+                               callback=lambda count: self.exported(path),
+                               errback=self.export_failed)
+
+    def export_progress(self, count, total):
+        if self.winfo_exists():
+            self.label_status.configure(text='Exporting to txt... ' + str(count) + ' of ' + str(total) +
+                                             ' items written.')
+
+    def exported(self, path):
+        if self.winfo_exists():
+            self.button_export_txt.configure(state=tk.NORMAL)
+            self.button_export_txt.configure(background=ENABLED_BUTTON_BKGRND)
+            self.label_status.configure(text='Report exported to "' + path + '".')
+
+    def export_failed(self, error):
+        if self.winfo_exists():
+            self.button_export_txt.configure(state=tk.NORMAL)
+            self.button_export_txt.configure(background=ENABLED_BUTTON_BKGRND)
+            self.label_status.configure(text='( X ) The report could not be exported: ' + str(error))
+
+    def close(self):
+        self.destroy()
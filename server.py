@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# A read-only HTTP/JSON API over the diaries of a database, to view them from a browser without the Tk application:
+#   GET /                        page linking to the diary of every patient
+#   GET /api/patients            [{"id": 1, "name": "default"}, ...]
+#   GET /api/entries             entries of a filter, as a JSON array
+#   GET /api/statistics          statistics of each month or week (period=month|week, from, to)
+#   GET /api/export.<format>     export of a filter: txt, csv, jsonl or columnar (see export.py)
+# Every path takes patient=<name> (default: the default patient); entries and exports take the filters of cli.py:
+# from, to, min_intensity, migraine, medicine, comment, search, and order=asc|desc.
+#
+# The event loop only parses the requests and writes the responses: the queries run in a pool of threads, each
+# request on one of a pool of read-only connections, lent for the time of the queries only. A response is written
+# by them to a temporary file (kept in memory unless it is large), then sent from it, so that slow clients never
+# hold a connection, and a single process serves hundreds of concurrent requests in little memory. Responses carry
+# an ETag and a Last-Modified taken from the version of the diary (see migrations.VERSION_STATEMENTS), read by a
+# connection of its own, and from the path and query of the request, so that revalidating an unchanged diary costs
+# a single query and a 304 even when the pool is busy; the small responses are also kept by the server for that
+# version, so that the same request from another client costs that query only (but for the txt report, which tells
+# when it was generated).
+
+import argparse
+import asyncio
+import hashlib  # ETags of the requests
+import html
+import json
+import sqlite3 as sql  # database errors
+import sys
+import tempfile  # bodies of the responses, spooled to the disk when large
+import time
+from collections import OrderedDict  # cache of the responses
+from concurrent.futures import ThreadPoolExecutor  # the queries run out of the event loop
+from contextlib import asynccontextmanager  # connections borrowed from the pool
+from email.utils import formatdate  # dates of the HTTP headers
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+import __init__  # to get the application version
+import storage  # database queries
+import export  # encoding of the exports
+import instrumentation  # opt-in timing of the requests
+
+HOST = '127.0.0.1'  # only reachable from this computer, unless --host says otherwise
+PORT = 8080
+POOL_SIZE = 4  # read-only connections, and threads running the queries
+MAX_HEAD = 16384  # bytes of the request line and headers
+KEEP_ALIVE = 15  # seconds an idle connection is kept open
+ENTRIES_CHUNK = 1000  # entries per chunk of /api/entries
+SEND_SIZE = 256 * 1024  # bytes of a large body written to a client at once
+RESPONSE_CACHE_SIZE = 32 * 1024 * 1024  # bytes of the responses kept by DiaryServer, the least recently used first out
+RESPONSE_CACHE_LIMIT = RESPONSE_CACHE_SIZE // 8  # bytes of the largest response kept
+TRUE_VALUES = ('1', 'yes', 'true', 'on')
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+MEDIA_TYPES = {
+    'json': 'application/json; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/jsonl; charset=utf-8',
+    'columnar': 'application/octet-stream',
+}
+ROUTES = ('index', 'patients', 'entries', 'statistics')  # besides export.<format>
+UNCACHED_ROUTES = ('export.txt',)  # responses not kept by DiaryServer: the footer of the report tells when it was made
+ENTRY = '{{"date": "{}", "intensity": {}, "migraine": {}, "medicine": {}, "comment": {}}}'.format
+
+
+class HttpError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class ConnectionPool:
+    """
+    Read-only Storages shared by the requests, each one lent to a single request at a time, and the threads
+    running their queries.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, profile=storage.DEFAULT_PROFILE):
+        self.connections = [storage.Storage(path, profile, read_only=True) for _ in range(size)]
+        self.free = asyncio.Queue()
+        for database in self.connections:
+            self.free.put_nowait(database)
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='server')
+
+    @asynccontextmanager
+    async def acquire(self):
+        database = await self.free.get()
+        try:
+            yield database
+        finally:
+            if database.connection.in_transaction:  # the snapshot of the request
+                database.connection.rollback()
+            self.free.put_nowait(database)
+
+    async def run(self, function, *args):
+        """Return function(*args), run in a thread of the pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for database in self.connections:
+            database.close()
+
+
+def flag(query, name):
+    return query.get(name, '').strip().lower() in TRUE_VALUES
+
+
+def filter_of(query):
+    """Return the ReportFilter of the parameters of a query; ValueError when one of them is invalid."""
+    return storage.ReportFilter(query.get('from'), query.get('to'), query.get('min_intensity', 0),
+                                flag(query, 'migraine'), flag(query, 'medicine'), query.get('comment'),
+                                query.get('search'))
+
+
+def order(query):
+    value = query.get('order', 'asc').upper()
+    if value not in ('ASC', 'DESC'):
+        raise ValueError('invalid order: {} (expected asc or desc)'.format(query['order']))
+    return value
+
+
+def snapshot(database, patient):
+    """
+    Start a read transaction on database, so that the version and the rows of the response are consistent, and
+    scope it by the patient. Return the (patient _id, changes, modified) of the diary.
+    """
+    database.connection.execute('BEGIN')
+    patient_id = database.select_patient(patient)
+    return (patient_id, *database.version())
+
+
+def in_snapshot(database, patient, function, *args):
+    """Return the version of the diary of patient (see snapshot) and function(database, *args), read in the same
+    transaction."""
+    version = snapshot(database, patient)
+    return version, function(database, *args)
+
+
+def spooled(chunks):
+    """Return the chunks (str or bytes) of a body joined: as bytes when it is small enough to be cached, in a
+    temporary file rewound to its start otherwise."""
+    file = tempfile.SpooledTemporaryFile(max_size=RESPONSE_CACHE_LIMIT)
+    for data in chunks:
+        file.write(data.encode('utf-8') if isinstance(data, str) else data)
+    if file.tell() > RESPONSE_CACHE_LIMIT:
+        file.seek(0)
+        return file
+    file.seek(0)
+    body = file.read()
+    file.close()
+    return body
+
+
+def report_body(database, route, report_filter, ord):
+    """Return the body of /api/entries or /api/export.<format> (see spooled)."""
+    cursor = database.report(report_filter, ord)
+    if route == 'entries':
+        return spooled(entry_chunks(cursor))
+    return spooled(data for data, rows in export.CHUNKS[route[len('export.'):]](cursor))
+
+
+def entry_chunks(cursor):
+    """Yield the rows of cursor as the text of a JSON array of entries, in chunks of ENTRIES_CHUNK rows."""
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    flags = ('false', 'true')
+    strip_line_break = storage.strip_line_break
+    separator = '[\n'
+    for rows in export.batches(cursor, ENTRIES_CHUNK):
+        # i[1] = date; i[2] = intensity; i[3] = migraine; i[4] = medicine; i[5] = comments
+        yield separator + ',\n'.join(ENTRY(i[1], i[2], flags[i[3] != 0], flags[i[4] != 0],
+                                           'null' if i[5] is None else dumps(strip_line_break(i[5]))) for i in rows)
+        separator = ',\n'
+    yield '[]\n' if separator == '[\n' else '\n]\n'
+
+
+def statistics_json(database, query):
+    rows = database.statistics(query.get('period', 'month'), query.get('from'), query.get('to'))
+    return json.dumps([dict(period=i[0], days=i[1], headache_days=i[2], average_intensity=i[3], migraine_days=i[4],
+                            medicine_days=i[5]) for i in rows], ensure_ascii=False).encode('utf-8')
+
+
+class DiaryServer:
+    """The HTTP server of a database file; start() it in a running event loop."""
+
+    def __init__(self, path=storage.DEFAULT_DATABASE, pool_size=POOL_SIZE, profile=storage.DEFAULT_PROFILE):
+        self.path = path
+        self.pool_size = pool_size
+        self.profile = profile
+        self.pool = None
+        self.versions = None  # the connection reading the versions of the diaries, never held by a response
+        self.server = None
+        self.responses = OrderedDict()  # (patient _id, changes, route?query) -> (media type, headers, body)
+        self.cached = 0  # bytes of the bodies of the responses
+        self.pending = dict()  # key of a response -> Future of its body, computed once for the concurrent requests
+
+    async def start(self, host=HOST, port=PORT):
+        """Listen on host and port (0: any free port, see port), and return the asyncio server."""
+        self.pool = ConnectionPool(self.path, self.pool_size, self.profile)
+        self.versions = ConnectionPool(self.path, 1, self.profile)
+        self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.pool.close()
+        self.versions.close()
+
+    async def handle(self, reader, writer):
+        """Serve the requests of a connection, kept open between them unless the client closes it."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE)
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 431, MEDIA_TYPES['json'], b'{"error": "request too large"}', False)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                try:
+                    method, target, keep_alive, headers = self.parse(head)
+                except ValueError:
+                    await self.send(writer, 400, MEDIA_TYPES['json'], b'{"error": "malformed request"}', False)
+                    break
+                start = time.perf_counter()
+                route = await self.respond(writer, method, target, headers, keep_alive)
+                if instrumentation.ENABLED:
+                    instrumentation.record('server.' + route, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except ConnectionError:  # the client went away
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):  # the server is closed
+                pass
+
+    @staticmethod
+    def parse(head):
+        """Return the method, target, whether to keep the connection open and the headers of a request."""
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, version = lines[0].split(' ')
+        if not version.startswith('HTTP/1.'):
+            raise ValueError('unsupported version: ' + version)
+        headers = dict()
+        for line in lines[1:]:
+            if line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        # the API has no request body: a request announcing one is answered, then its connection closed
+        if headers.get('content-length', '0') != '0' or 'transfer-encoding' in headers:
+            keep_alive = False
+        return method, target, keep_alive, headers
+
+    async def respond(self, writer, method, target, headers, keep_alive):
+        """Write the response of a request, and return the name of its route."""
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        route = url.path.strip('/').replace('api/', '', 1) or 'index'
+        if route not in ROUTES and not route.startswith('export.'):
+            route = 'unknown'
+        try:
+            if method not in ('GET', 'HEAD'):
+                raise HttpError(405, 'only GET and HEAD are supported')
+            head_only = method == 'HEAD'
+            if route == 'index':
+                await self.index(writer, head_only, keep_alive)
+            elif route == 'patients':
+                async with self.pool.acquire() as database:
+                    patients = await self.pool.run(database.patients)
+                body = json.dumps([dict(id=i[0], name=i[1]) for i in patients], ensure_ascii=False)
+                await self.send(writer, 200, MEDIA_TYPES['json'], body.encode('utf-8'), keep_alive, head_only)
+            elif route in ('entries', 'statistics') or route.startswith('export.'):
+                await self.diary(writer, route, query, headers, keep_alive, head_only)
+            else:
+                raise HttpError(404, 'unknown path: ' + url.path)
+        except HttpError as e:
+            await self.send_error(writer, e.status, str(e), keep_alive)
+        except LookupError as e:  # unknown patient
+            await self.send_error(writer, 404, str(e), keep_alive)
+        except ValueError as e:  # invalid parameter
+            await self.send_error(writer, 400, str(e), keep_alive)
+        except sql.Error as e:
+            await self.send_error(writer, 500, str(e), keep_alive)
+        return route
+
+    async def diary(self, writer, route, query, headers, keep_alive, head_only):
+        """Answer a request on the diary of a patient, or a 304 when the client already has its current version."""
+        if route.startswith('export.'):
+            format = route[len('export.'):]
+            if format not in export.CHUNKS:
+                raise HttpError(404, 'unknown export format: ' + format)
+        patient = query.get('patient', storage.DEFAULT_PATIENT)
+        async with self.versions.acquire() as database:
+            version = await self.versions.run(snapshot, database, patient)
+        # the request, whatever the order of its parameters, as part of the ETag and of the key of the kept response
+        resource = route + '?' + urlencode(sorted(query.items()))
+        cache = self.cache_headers(*version, resource)
+        if self.not_modified(headers, cache['ETag'], version[2]):
+            await self.send(writer, 304, None, b'', keep_alive, extra=cache)
+            return
+        key = (version[0], version[1], resource)
+        response = self.responses.get(key)
+        if response is not None:
+            self.responses.move_to_end(key)
+            media_type, extra, body = response
+            await self.send(writer, 200, media_type, body, keep_alive, head_only, dict(cache, **extra))
+            return
+        extra = dict()
+        if route == 'statistics':
+            media_type = MEDIA_TYPES['json']
+            function, args = statistics_json, (query,)
+        else:
+            args = (route, filter_of(query), order(query))
+            function = report_body
+            if route == 'entries':
+                media_type = MEDIA_TYPES['json']
+            else:
+                media_type = MEDIA_TYPES[format]
+                extra['Content-Disposition'] = 'attachment; filename="headache_diary{}"'.format(
+                    export.FORMATS[format][1])
+        if head_only:  # the body is not read, so its length is unknown
+            await self.send(writer, 200, media_type, None, keep_alive, True, dict(cache, **extra))
+            return
+        # the version of the snapshot the body was read in, which may be newer than the one checked above
+        (version, body), first = await self.computed(key, self.read, patient, function, *args)
+        if not first and not isinstance(body, bytes):  # a large body is a file, sent to a single client
+            version, body = await self.read(patient, function, *args)
+        cache = dict(self.cache_headers(*version, resource), **extra)
+        if isinstance(body, bytes):
+            if route not in UNCACHED_ROUTES:
+                self.keep((version[0], version[1], resource), (media_type, extra, body))
+            await self.send(writer, 200, media_type, body, keep_alive, False, cache)
+        else:
+            await self.send_file(writer, body, media_type, keep_alive, cache)
+
+    async def read(self, patient, function, *args):
+        """Return in_snapshot(database, patient, function, *args), with a connection of the pool lent for that
+        time only."""
+        async with self.pool.acquire() as database:
+            return await self.pool.run(in_snapshot, database, patient, function, *args)
+
+    @staticmethod
+    def cache_headers(patient_id, changes, modified, resource):
+        tag = hashlib.blake2b(resource.encode('utf-8'), digest_size=8).hexdigest()
+        cache = {'ETag': '"{}-{}-{}"'.format(patient_id, changes, tag), 'Cache-Control': 'no-cache'}
+        if modified is not None:
+            cache['Last-Modified'] = formatdate(modified, usegmt=True)
+        return cache
+
+    async def computed(self, key, function, *args):
+        """
+        Return the result of the coroutine function(*args), awaited once for the concurrent requests of the same
+        key, and whether it was awaited for this request.
+        """
+        pending = self.pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending), False
+        pending = self.pending[key] = asyncio.ensure_future(function(*args))
+        try:
+            return await asyncio.shield(pending), True
+        finally:
+            del self.pending[key]
+
+    def keep(self, key, response):
+        if len(response[2]) > RESPONSE_CACHE_LIMIT or key in self.responses:
+            return
+        self.responses[key] = response
+        self.cached += len(response[2])
+        while self.cached > RESPONSE_CACHE_SIZE:
+            self.cached -= len(self.responses.popitem(last=False)[1][2])
+
+    @staticmethod
+    def not_modified(headers, etag, modified):
+        if 'if-none-match' in headers:
+            return etag in (tag.strip() for tag in headers['if-none-match'].split(',')) or \
+                headers['if-none-match'].strip() == '*'
+        if 'if-modified-since' in headers and modified is not None:
+            try:
+                return modified <= parsedate_to_datetime(headers['if-modified-since']).timestamp()
+            except (TypeError, ValueError):  # an invalid date is ignored
+                return False
+        return False
+
+    async def index(self, writer, head_only, keep_alive):
+        async with self.pool.acquire() as database:
+            patients = await self.pool.run(database.patients)
+        links = list()
+        for patient_id, name in patients:
+            patient = quote(name)
+            links.append('<li>{name}: <a href="/api/entries?patient={patient}">entries</a>, '
+                         '<a href="/api/statistics?patient={patient}">statistics</a>, '
+                         '<a href="/api/export.txt?patient={patient}">report</a>, '
+                         '<a href="/api/export.csv?patient={patient}">CSV</a></li>'.
+                         format(name=html.escape(name), patient=patient))
+        body = ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Headache Diary v{version}</title></head>'
+                '<body><h1>Headache Diary v{version}</h1><ul>{links}</ul></body></html>\n'.
+                format(version=__init__.version, links=''.join(links)))
+        await self.send(writer, 200, MEDIA_TYPES['html'], body.encode('utf-8'), keep_alive, head_only)
+
+    @staticmethod
+    def head(status, media_type, keep_alive, extra=None):
+        lines = ['HTTP/1.1 {} {}'.format(status, REASONS[status]),
+                 'Server: HeadacheDiary/' + __init__.version,
+                 'Date: ' + formatdate(usegmt=True),
+                 'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+        if media_type is not None:
+            lines.append('Content-Type: ' + media_type)
+        if extra:
+            lines.extend('{}: {}'.format(name, value) for name, value in extra.items())
+        return ('\r\n'.join(lines) + '\r\n').encode('latin-1')
+
+    async def send(self, writer, status, media_type, body, keep_alive, head_only=False, extra=None):
+        response = self.head(status, media_type, keep_alive, extra)
+        if status != 304 and body is not None:
+            response += 'Content-Length: {}\r\n'.format(len(body)).encode('latin-1')
+        writer.write(response + b'\r\n' + (b'' if head_only else body))
+        await writer.drain()
+
+    async def send_error(self, writer, status, message, keep_alive):
+        await self.send(writer, status, MEDIA_TYPES['json'], json.dumps({'error': message}).encode('utf-8'),
+                        keep_alive)
+
+    async def send_file(self, writer, file, media_type, keep_alive, extra):
+        """Send a large body from its temporary file, SEND_SIZE bytes at a time, then close the file."""
+        try:
+            size = file.seek(0, 2)
+            file.seek(0)
+            writer.write(self.head(200, media_type, keep_alive, extra) +
+                         'Content-Length: {}\r\n\r\n'.format(size).encode('latin-1'))
+            while True:
+                data = file.read(SEND_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        finally:
+            file.close()
+
+
+async def serve(path=storage.DEFAULT_DATABASE, host=HOST, port=PORT, pool_size=POOL_SIZE,
+                profile=storage.DEFAULT_PROFILE):
+    """Serve the database at path until cancelled."""
+    server = DiaryServer(path, pool_size, profile)
+    await server.start(host, port)
+    print('Serving {} on http://{}:{}/'.format(path, host, server.port), file=sys.stderr)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headache Diary v' + __init__.version + ' - read-only HTTP/JSON '
+                                                 'API over the diaries of a database.')
+    parser.add_argument('--database', default=storage.DEFAULT_DATABASE, help='database file (default: %(default)s)')
+    parser.add_argument('--profile', choices=sorted(storage.PROFILES), default=storage.DEFAULT_PROFILE,
+                        help='connection settings (default: %(default)s)')
+    parser.add_argument('--host', default=HOST, help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=PORT, help='(default: %(default)s)')
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE,
+                        help='read-only connections running the queries (default: %(default)s)')
+    args = parser.parse_args(argv)
+    database = storage.Storage(args.database, args.profile)
+    try:
+        database.initialize()  # the connections of the pool cannot upgrade the schema
+    except (sql.Error, ValueError) as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    finally:
+        database.close()
+    try:
+        asyncio.run(serve(args.database, args.host, args.port, args.pool_size, args.profile))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:  # e.g. the port is already used
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
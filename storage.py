@@ -0,0 +1,1062 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+import json  # lists of dates are bound as a single JSON parameter
+import os
+import sys  # sizes of the cached rows
+import sqlite3 as sql  # database operations
+from array import array  # columns of the rows of large reports
+from collections import OrderedDict  # caches of the charts and of the report pagers
+from contextlib import contextmanager  # transactions
+from copy import copy  # filters of the databases without full-text index
+from functools import lru_cache  # compiled report queries
+from itertools import starmap  # rows of the cursors
+from datetime import date  # the filters are relative to the current date
+from datetime import timedelta  # some date calculations
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+import migrations  # schema of the database
+from instrumentation import timed  # opt-in timing of the queries
+
+REPORT_FILTERS = ('1 - last 31 days', '2 - this month', '3 - everything')
+ORDERS = ('ASC', 'DESC')
+
+# Conditions of a ReportFilter, which follow the one on the patient; the date, intensity, migraine and medicine
+# ones are checked on the report index.
+CONDITIONS = {
+    'start': 'date >= ?',
+    'end': 'date <= ?',
+    'min_intensity': 'intensity >= ?',
+    'migraine': 'migraine != 0',
+    'medicine': 'medicine != 0',
+    'comment': "comment like ? escape '\\'",
+    'search': '_id in (select rowid from headache_fts where headache_fts match ?)',
+    'search_like': "comment like ? escape '\\'",  # the search of a database without full-text index
+}
+QUERY_KINDS = ('select', 'count', 'after', 'before', 'from', 'key', 'rank', 'bounds', 'chart')
+KEYSET = {  # kind: (condition in ascending order, condition in descending order, whether the order is reversed)
+    'after': ('date > ?', 'date < ?', False),
+    'before': ('date < ?', 'date > ?', True),
+    'from': ('date >= ?', 'date <= ?', False),
+}
+
+# A single database holds the diaries of many patients: every row of the headache table belongs to a patient,
+# and every query is scoped by one, on indexes leading with the patient. The schema itself is in migrations.
+DEFAULT_PATIENT_ID = migrations.DEFAULT_PATIENT_ID
+DEFAULT_PATIENT = migrations.DEFAULT_PATIENT
+DEFAULT_DATABASE = os.environ.get('HEADACHE_DIARY_DATABASE', 'headache_diary.db')
+PERIODS = migrations.PERIODS  # of the statistics
+
+ROW_COLUMNS = ('_id', 'date', 'intensity', 'migraine', 'medicine', 'comment')  # the columns of a Row
+FETCH_SIZE = 10000  # rows read from a cursor at once into Rows
+YES_NO = ('no', 'yes')  # how the report displays the flags
+MIGRAINE_FLAG = 1  # flags of the columns of Rows
+MEDICINE_FLAG = 2
+COMMENT_FLAG = 4
+LINE_BREAK_FLAG = 8  # the comment ends with a line break, which is not packed
+SEARCH_LIMIT = 1000  # best matches of a search displayed by the report
+CHART_COLUMNS = 1000  # most columns of days of a chart, each one summarized by the database
+CHART_CACHE_SIZE = 32  # charts kept by Storage.chart(), the least recently used ones are dropped
+PAGER_CACHE_SIZE = 16  # report pagers kept by Storage.pager(), the least recently used ones are dropped
+
+# PRAGMA settings applied to every connection; 'default' keeps the ones of SQLite.
+PROFILES = {
+    'default': {},
+    'tuned': {
+        'journal_mode': 'WAL',  # readers do not block the writer, and a commit is a single append
+        'synchronous': 'NORMAL',  # with WAL, a power loss can only lose the last commits, never corrupt
+        'cache_size': -16384,  # 16 MiB of page cache
+        'mmap_size': 268435456,  # up to 256 MiB of the file read through memory mapping
+        'temp_store': 'MEMORY',  # sorts and temporary indexes never touch the disk
+    },
+}
+DEFAULT_PROFILE = os.environ.get('HEADACHE_DIARY_PROFILE', 'tuned')
+READ_WRITE_PRAGMAS = ('journal_mode', 'synchronous')  # left to the connections that write
+
+# Every statement is a constant string, so that sqlite3 prepares it once and then reuses it from its cache.
+# Each one is scoped by the patient.
+INSERT = ('insert into headache (patient_id, date, intensity, migraine, medicine, comment) '
+          'values (?, ?, ?, ?, ?, ?)')
+UPDATE = ('update headache set intensity = ?, migraine = ?, medicine = ?, comment = ? '
+          'where patient_id = ? and date = ?')
+SELECT_DATE = 'select date, intensity, migraine, medicine, comment from headache where patient_id = ? and date = ?'
+# date.toordinal() of each date
+SELECT_DAYS = 'select cast(julianday(date) - 1721424.5 as integer) from headache where patient_id = ?'
+SERIES_COLUMNS = 'cast(julianday(date) - 1721424.5 as integer), intensity, migraine != 0, medicine != 0'
+SELECT_SERIES = 'select ' + SERIES_COLUMNS + ' from headache where {where} order by date'
+SELECT_EVERY_SERIES = 'select patient_id, ' + SERIES_COLUMNS + ' from headache order by patient_id, date'
+UPSERT = INSERT + (' on conflict (patient_id, date) do update set intensity = excluded.intensity, '
+                   'migraine = excluded.migraine, medicine = excluded.medicine, comment = excluded.comment')
+EXISTING_DATES = 'select date from headache where patient_id = ? and date in (select value from json_each(?))'
+
+Entry = Tuple[str, int, int, int, Optional[str]]  # date, intensity, migraine, medicine, comment
+# period, filled days, days with headache, average intensity, days with migraine, days with medicine
+Statistics = Tuple[str, int, int, float, int, int]
+
+
+def strip_line_break(comment: Optional[str]) -> Optional[str]:
+    """Return a comment without its final line break, the one of the typed comments, as it is displayed and exported."""
+    if comment is not None and comment.endswith('\n'):
+        return comment[:-1]
+    return comment
+
+
+class Row:
+    """
+    A row of a report: the _id and the entry of a date, in attributes without a __dict__, so that a Row takes less
+    memory than the tuple read from the database.
+    """
+
+    __slots__ = ('id', 'date', 'intensity', 'migraine', 'medicine', 'comment')
+
+    def __init__(self, id: int, date: str, intensity: int, migraine: int, medicine: int, comment: Optional[str]):
+        self.id = id
+        self.date = date
+        self.intensity = intensity
+        self.migraine = migraine
+        self.medicine = medicine
+        self.comment = comment
+
+    @property
+    def text(self) -> Optional[str]:
+        """The comment without its final line break, as it is displayed and exported."""
+        return strip_line_break(self.comment)
+
+    @property
+    def entry(self) -> Entry:
+        return self.date, self.intensity, self.migraine, self.medicine, self.comment
+
+    def replaced(self, entry: Entry) -> 'Row':
+        """Return the row of the same _id holding entry, e.g. once it was changed."""
+        return Row(self.id, *entry)
+
+    def display(self) -> Tuple[str, str, str, str, str]:
+        """Return the date, intensity, migraine, medicine and comment, as the report displays them."""
+        return (self.date, str(self.intensity), YES_NO[self.migraine != 0], YES_NO[self.medicine != 0],
+                self.text or '')
+
+    def __eq__(self, other):
+        if not isinstance(other, Row):
+            return NotImplemented
+        return (self.id, *self.entry) == (other.id, *other.entry)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({!r}, {!r}, {!r}, {!r}, {!r}, {!r})'.format(type(self).__name__, self.id, *self.entry)
+
+
+class Match(Row):
+    """A row found by a full-text search, which also holds its comment with the matched words in brackets."""
+
+    __slots__ = ('highlighted',)
+
+    def __init__(self, id: int, date: str, intensity: int, migraine: int, medicine: int, comment: Optional[str],
+                 highlighted: Optional[str]):
+        Row.__init__(self, id, date, intensity, migraine, medicine, comment)
+        self.highlighted = highlighted
+
+    def display(self) -> Tuple[str, str, str, str, str]:
+        strings = Row.display(self)
+        if self.highlighted is None:
+            return strings
+        return strings[:4] + (strip_line_break(self.highlighted),)
+
+
+class Rows:
+    """
+    The rows of a large report, held in columns: arrays of the _ids, day ordinals, intensities and flags, and the
+    comments packed one after the other in a single UTF-8 buffer. They take a fraction of the memory of as many
+    tuples of python objects; indexing and iterating make the Row objects on demand.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.days = array('i')
+        self.intensities = array('B')
+        self.flags = array('B')
+        self.comment_ends = array('Q')  # offset of the end of each comment in comments
+        self.comments = bytearray()
+
+    @classmethod
+    def of(cls, cursor: sql.Cursor) -> 'Rows':
+        """Return the rows (_id, date, intensity, migraine, medicine, comment) of a cursor."""
+        rows = cls()
+        while True:
+            batch = cursor.fetchmany(FETCH_SIZE)
+            if not batch:
+                return rows
+            rows.extend(batch)
+
+    def extend(self, rows: List[Tuple]) -> None:
+        """Append a list of rows (_id, date, intensity, migraine, medicine, comment)."""
+        if not rows:
+            return
+        ids, dates, intensities, migraines, medicines, comments = zip(*rows)
+        self.ids.extend(ids)
+        self.days.extend(map(date.toordinal, map(date.fromisoformat, dates)))
+        self.intensities.extend(intensities)
+        flags, ends, packed = self.flags, self.comment_ends, self.comments
+        for migraine, medicine, comment in zip(migraines, medicines, comments):
+            flag = (migraine != 0) * MIGRAINE_FLAG | (medicine != 0) * MEDICINE_FLAG
+            if comment is not None:
+                flag |= COMMENT_FLAG
+                if comment.endswith('\n'):
+                    flag |= LINE_BREAK_FLAG
+                    comment = comment[:-1]
+                packed += comment.encode('utf-8')
+            flags.append(flag)
+            ends.append(len(packed))
+
+    def comment(self, index: int) -> Optional[str]:
+        flag = self.flags[index]
+        if not flag & COMMENT_FLAG:
+            return None
+        start = self.comment_ends[index - 1] if index > 0 else 0
+        comment = self.comments[start:self.comment_ends[index]].decode('utf-8')
+        return comment + '\n' if flag & LINE_BREAK_FLAG else comment
+
+    def nbytes(self) -> int:
+        """Return the bytes taken by the columns."""
+        return sum(len(column) * column.itemsize for column in (self.ids, self.days, self.intensities, self.flags,
+                                                                  self.comment_ends)) + len(self.comments)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        flag = self.flags[index]
+        return Row(self.ids[index], date.fromordinal(self.days[index]).isoformat(), self.intensities[index],
+                   int(flag & MIGRAINE_FLAG != 0), int(flag & MEDICINE_FLAG != 0), self.comment(index))
+
+    def __iter__(self) -> Iterator[Row]:
+        return map(self.__getitem__, range(len(self)))
+
+
+def check_order(ord: str) -> None:
+    if ord not in ORDERS:
+        raise ValueError('invalid report order: {ord}'.format(ord=ord))
+
+
+@lru_cache(maxsize=256)
+def compile_query(shape: Tuple[str, ...], ord: str = 'ASC', kind: str = 'select') -> str:
+    """
+    Return the statement of a query on the rows matching the conditions named by shape (keys of CONDITIONS).
+    kind is one of QUERY_KINDS: the rows themselves, their count, a page after, before or from a date, the date
+    found at an offset, the best matches of a full-text search ('rank', whose rows end with the comment
+    highlighted, and whose first parameter is the search), the first date, last date and count of the rows
+    ('bounds'), or the lowest, highest and average intensity and the count of the rows of each column of a chart
+    ('chart', whose first two parameters are the day ordinal of its first column and its columns per day).
+    The statement depends on the shape of a filter, never on its values, which are bound as parameters, so that
+    it is built once and its prepared statement reused from the cache of the connection.
+    The first parameter (after the ones of 'rank' and 'chart') is always the patient.
+    """
+    check_order(ord)
+    if kind not in QUERY_KINDS:
+        raise ValueError('invalid query kind: {kind}'.format(kind=kind))
+    conditions = ['patient_id = ?'] + [CONDITIONS[name] for name in shape]
+    if kind in KEYSET:
+        ascending, descending, reverse = KEYSET[kind]
+        conditions.append(ascending if ord == 'ASC' else descending)
+        if reverse:
+            ord = ORDERS[1] if ord == ORDERS[0] else ORDERS[0]
+    where = ' where ' + ' and '.join(conditions)
+    if kind == 'count':
+        return 'select count(*) from headache' + where
+    if kind == 'bounds':
+        return 'select min(date), max(date), count(*) from headache' + where
+    if kind == 'chart':
+        return ('select cast((julianday(date) - 1721424.5 - ?) * ? as integer) as column, min(intensity), '
+                'max(intensity), avg(intensity), count(*) from headache' + where + ' group by column order by column')
+    if kind == 'rank':
+        return ('select ' + ', '.join('headache.' + column for column in ROW_COLUMNS) +
+                ', matches.highlighted from (select rowid, rank, '
+                "highlight(headache_fts, 0, '[', ']') as highlighted from headache_fts where headache_fts match ?) "
+                'as matches join headache on headache._id = matches.rowid' + where +
+                ' order by matches.rank limit ?')
+    if kind == 'key':
+        return 'select date from headache' + where + ' order by date ' + ord + ' limit 1 offset ?'
+    statement = 'select ' + ', '.join(ROW_COLUMNS) + ' from headache' + where + ' order by date ' + ord
+    if kind != 'select':
+        statement += ' limit ?'
+    return statement
+
+
+def iso_date(value) -> str:
+    """Return a date or a 'YYYY-MM-DD' string as 'YYYY-MM-DD', or raise ValueError."""
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value).strip()).isoformat()
+
+
+def match_query(text: str) -> str:
+    """Return the full-text query of the words of text, all required, whatever characters they contain."""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class ReportFilter:
+    """
+    Conditions on the rows of a report, all optional: a date range (both bounds inclusive), a minimum intensity,
+    only the days with migraine or medicine, a text contained in the comments (ignoring the case), and words
+    searched in the full-text index of the comments.
+    The conditions are pushed down into a single parameterized query, see compile_query().
+    """
+
+    def __init__(self, start=None, end=None, min_intensity=0, migraine=False, medicine=False, comment=None,
+                 search=None):
+        self.start = None if start is None else iso_date(start)
+        self.end = None if end is None else iso_date(end)
+        self.min_intensity = int(min_intensity)
+        if not 0 <= self.min_intensity <= 3:
+            raise ValueError('invalid intensity: {}'.format(min_intensity))
+        self.migraine = bool(migraine)
+        self.medicine = bool(medicine)
+        self.comment = comment or None
+        self.search = search.strip() if search and search.strip() else None
+        shape = list()
+        params = list()
+        if self.start is not None:
+            shape.append('start')
+            params.append(self.start)
+        if self.end is not None:
+            shape.append('end')
+            params.append(self.end)
+        if self.min_intensity > 0:
+            shape.append('min_intensity')
+            params.append(self.min_intensity)
+        if self.migraine:
+            shape.append('migraine')
+        if self.medicine:
+            shape.append('medicine')
+        if self.comment is not None:
+            shape.append('comment')
+            params.append('%' + escape_like(self.comment) + '%')
+        if self.search is not None:
+            shape.append('search')
+            params.append(match_query(self.search))
+        self.shape = tuple(shape)
+        self.params = tuple(params)
+
+    @classmethod
+    def preset(cls, report_filter: str, today: Optional[date] = None) -> 'ReportFilter':
+        """Return the filter of one of the REPORT_FILTERS."""
+        if today is None:
+            today = date.today()
+        if report_filter[0] == '1':  # last 31 days
+            return cls(today + timedelta(days=-31))
+        elif report_filter[0] == '2':  # this month, from its first to its last day
+            first = today.replace(day=1)
+            return cls(first, (first + timedelta(days=31)).replace(day=1) + timedelta(days=-1))
+        return cls()  # everything
+
+    @classmethod
+    def of(cls, report_filter) -> 'ReportFilter':
+        """Return report_filter itself, or the filter of a preset name."""
+        if isinstance(report_filter, cls):
+            return report_filter
+        return cls.preset(report_filter)
+
+    def without_full_text(self) -> 'ReportFilter':
+        """
+        Return this filter for a database without full-text index, where the searched text is a text contained in
+        the comments, as in the fallback of Storage.search_comments().
+        """
+        if self.search is None:
+            return self
+        fallback = copy(self)
+        # the search is always the last condition
+        fallback.shape = self.shape[:-1] + ('search_like',)
+        fallback.params = self.params[:-1] + ('%' + escape_like(self.search) + '%',)
+        return fallback
+
+    def key(self):
+        return self.start, self.end, self.min_intensity, self.migraine, self.medicine, self.comment, self.search
+
+    def __eq__(self, other):
+        return isinstance(other, ReportFilter) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __str__(self):
+        parts = list()
+        if self.start is not None and self.end is not None:
+            parts.append('from {} to {}'.format(self.start, self.end))
+        elif self.start is not None:
+            parts.append('since {}'.format(self.start))
+        elif self.end is not None:
+            parts.append('until {}'.format(self.end))
+        if self.min_intensity > 0:
+            parts.append('intensity {} or more'.format(self.min_intensity))
+        if self.migraine:
+            parts.append('migraine only')
+        if self.medicine:
+            parts.append('medicine only')
+        if self.comment is not None:
+            parts.append('comments containing "{}"'.format(self.comment))
+        if self.search is not None:
+            parts.append('comments matching "{}"'.format(self.search))
+        return ', '.join(parts) if parts else 'all available data'
+
+
+class DatesConflict(ValueError):
+    """Some dates of a batch are already filled, and the batch may not replace them."""
+
+    def __init__(self, dates: Iterable[str]) -> None:
+        self.dates = sorted(dates)
+        ValueError.__init__(self, '{} already filled: {}'.format(
+            'a date is' if len(self.dates) == 1 else '{} dates are'.format(len(self.dates)), ', '.join(self.dates)))
+
+
+class DateIndex:
+    """
+    Set of the filled dates, kept as a bitmap of days counted from the first one (a year takes 46 bytes), so that
+    checking a date costs neither a query nor more than a few bytes per month of history.
+    """
+
+    def __init__(self, dates: Iterable[str] = ()) -> None:
+        # the ordinal of the day of the first bit (always a multiple of 8) and the bits, replaced together by a
+        # single assignment, so that the Tk thread never reads new bits with the old base while the database
+        # thread adds a date before the first one
+        self.layout = (0, bytearray())
+        self.count = 0
+        self.fill([day for day in map(self.ordinal, dates) if day is not None])
+
+    @classmethod
+    def from_days(cls, days: Iterable[int]) -> 'DateIndex':
+        """Build the index from the ordinals of the dates (see date.toordinal) instead of their ISO strings."""
+        index = cls()
+        index.fill([day for day in days if day is not None])
+        return index
+
+    @property
+    def base(self) -> int:
+        return self.layout[0]
+
+    @property
+    def bits(self) -> bytearray:
+        return self.layout[1]
+
+    def fill(self, days: List[int]) -> None:
+        if not days:
+            return
+        first = min(days)
+        base = first - first % 8
+        bits = bytearray((max(days) - base) // 8 + 1)
+        for day in days:
+            offset = day - base
+            bits[offset >> 3] |= 1 << (offset & 7)
+        self.layout = (base, bits)
+        self.count = bin(int.from_bytes(bits, 'little')).count('1')  # int.bit_count() needs python 3.10
+
+    @staticmethod
+    def ordinal(full_date: str) -> Optional[int]:
+        try:
+            return date.fromisoformat(full_date).toordinal()
+        except ValueError:
+            return None
+
+    def add(self, full_date: str) -> None:
+        day = self.ordinal(full_date)
+        if day is None:
+            return
+        base, bits = self.layout
+        if not bits or day < base:
+            # the bits move: a new layout is built, then swapped in
+            new_base = day - day % 8
+            bits = bytearray((base - new_base) // 8) + bits if bits else bytearray(1)
+            base = new_base
+            self.layout = (base, bits)
+        offset = day - base
+        if offset // 8 >= len(bits):
+            bits.extend(bytes(offset // 8 - len(bits) + 1))  # in place: the offsets of the bits do not change
+        mask = 1 << offset % 8
+        if not bits[offset // 8] & mask:
+            bits[offset // 8] |= mask
+            self.count += 1
+
+    def __contains__(self, full_date: str) -> bool:
+        day = self.ordinal(full_date)
+        base, bits = self.layout
+        if day is None or day < base:
+            return False
+        offset = day - base
+        return offset // 8 < len(bits) and bits[offset // 8] & 1 << offset % 8 != 0
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class Chart:
+    """
+    The intensity of the rows of a filter over time, summarized by the database in at most CHART_COLUMNS columns
+    of consecutive days, so that drawing it does not depend on the size of the diary. first is the day ordinal of
+    the first date, days the amount of days up to the last one, and each of the columns, in order, is a
+    (column, lowest, highest, average intensity, filled days) tuple; the empty columns are left out.
+    """
+
+    def __init__(self, report_filter, first: int = 0, days: int = 0, columns: Iterable[Tuple] = ()) -> None:
+        self.report_filter = report_filter
+        self.first = first
+        self.days = days
+        self.columns = list(columns)
+        self.width = min(days, CHART_COLUMNS)  # amount of columns, the empty ones included
+
+    def __len__(self) -> int:
+        return self.days
+
+    def date(self, column: float) -> str:
+        """Return the first date of a column (which may be fractional, to get the dates between them)."""
+        return date.fromordinal(self.first + int(column * self.days / self.width)).isoformat()
+
+    def last_date(self) -> str:
+        return date.fromordinal(self.first + self.days - 1).isoformat()
+
+
+class Storage:
+    """
+    Data access of the diary, free of any user interface.
+    It owns the connection to the database and issues every SQL statement of the application. Writes are
+    committed one by one, unless they happen inside a transaction() block, which commits them all at once.
+    The filled dates are also kept in memory, in a DateIndex loaded on first use and updated by every write, and
+    loaded again once another connection wrote.
+    Every read and write is scoped by the selected patient, see select_patient().
+    """
+
+    def __init__(self, path: str = DEFAULT_DATABASE, profile: str = DEFAULT_PROFILE, read_only: bool = False) -> None:
+        """
+        Open the database at path. A read_only Storage cannot write, nor upgrade the schema, but it can be used by
+        any thread, one at a time, e.g. from the connection pool of server.py.
+        """
+        if profile not in PROFILES:
+            raise ValueError('invalid connection profile: {profile}'.format(profile=profile))
+        self.path = path
+        self.profile = profile
+        self.read_only = read_only
+        if read_only:
+            import urllib.request  # file URI of the read-only connections, only imported by the ones who need it
+            self.connection = sql.Connection('file:{}?mode=ro'.format(urllib.request.pathname2url(
+                os.path.abspath(path))), uri=True, check_same_thread=False, cached_statements=256)
+        else:
+            self.connection = sql.Connection(path, cached_statements=256)
+        for pragma, value in PROFILES[profile].items():
+            if read_only and pragma in READ_WRITE_PRAGMAS:
+                continue
+            self.connection.execute('PRAGMA {pragma} = {value}'.format(pragma=pragma, value=value))
+        self.transaction_depth = 0
+        self.patient_id = DEFAULT_PATIENT_ID
+        self.dates = None  # DateIndex of the patient, loaded by filled_dates()
+        self.dates_version = None  # the data_version when the dates were loaded
+        self.full_text = False  # whether the comments have a full-text index, see initialize()
+        self.writes = 0  # writes of this connection; with PRAGMA data_version, tells whether a chart is still valid
+        self.charts = OrderedDict()  # (patient_id, filter key) -> (writes, data_version, Chart)
+        self.pagers = OrderedDict()  # (patient_id, filter key) -> (writes, data_version, ascending ReportPager)
+        self.pager_hits = 0
+        self.pager_misses = 0
+        if read_only:  # initialize() is left to a connection that can upgrade the schema
+            if migrations.version(self.connection) != migrations.SCHEMA_VERSION:
+                self.connection.close()
+                raise migrations.MigrationError('the database must be upgraded before it is opened read-only.')
+            self.full_text = migrations.exists(self.connection, 'headache_fts')
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @timed('storage.initialize')
+    def initialize(self, progress=None) -> None:
+        """Bring the schema of the database up to date; progress is the one of migrations.migrate()."""
+        migrations.migrate(self, progress)
+        self.full_text = migrations.exists(self.connection, 'headache_fts')
+
+    def version(self) -> Tuple[int, Optional[int]]:
+        """
+        Return the amount of writes of the diary of the patient and the time of the last one, in seconds since the
+        epoch (None before the first one), whichever connection wrote them.
+        """
+        row = self.connection.execute('select changes, modified from headache_version where patient_id = ?',
+                                      (self.patient_id,)).fetchone()
+        return (0, None) if row is None else row
+
+    def patients(self) -> List[Tuple[int, str]]:
+        """Return the _id and name of every patient, by name."""
+        return self.connection.execute('select _id, name from patient order by name').fetchall()
+
+    def add_patient(self, name: str) -> int:
+        name = name.strip()
+        if not name:
+            raise ValueError('the name of a patient cannot be empty')
+        patient_id = self.connection.execute('insert into patient (name) values (?)', (name,)).lastrowid
+        self.commit()
+        return patient_id
+
+    def select_patient(self, name: str) -> int:
+        """Scope every following read and write by the patient called name, and return its _id."""
+        row = self.connection.execute('select _id from patient where name = ?', (name,)).fetchone()
+        if row is None:
+            raise LookupError('unknown patient: {name}'.format(name=name))
+        if row[0] != self.patient_id:
+            self.patient_id = row[0]
+            self.dates = None
+        return self.patient_id
+
+    @contextmanager
+    def transaction(self) -> Iterator['Storage']:
+        """Group the writes of the block in a single transaction, rolled back if the block raises."""
+        if self.transaction_depth == 0 and not self.connection.in_transaction:
+            self.connection.execute('BEGIN')  # so that the schema changes are part of the transaction too
+        self.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.connection.rollback()
+                self.dates = None  # it may hold dates that were rolled back
+            raise
+        self.transaction_depth -= 1
+        if self.transaction_depth == 0:
+            self.connection.commit()
+
+    def commit(self) -> None:
+        if self.transaction_depth == 0:
+            self.connection.commit()
+
+    @timed('storage.insert')
+    def insert(self, full_date: str, intensity: int, migraine: int, medicine: int, comment: Optional[str]) -> None:
+        self.writes += 1
+        self.connection.execute(INSERT, (self.patient_id, full_date, intensity, migraine, medicine, comment))
+        if self.dates is not None:
+            self.dates.add(full_date)
+        self.commit()
+
+    @timed('storage.update')
+    def update(self, full_date: str, intensity: int, migraine: int, medicine: int, comment: Optional[str]) -> None:
+        self.writes += 1
+        self.connection.execute(UPDATE, (intensity, migraine, medicine, comment, self.patient_id, full_date))
+        self.commit()
+
+    def insert_many(self, entries: Iterable[Entry]) -> None:
+        self.write_many(INSERT, entries)
+
+    def upsert_many(self, entries: Iterable[Entry]) -> None:
+        """Insert the entries, replacing the values of the dates already filled."""
+        self.write_many(UPSERT, entries)
+
+    @timed('storage.write_many')
+    def write_many(self, statement: str, entries: Iterable[Entry]) -> None:
+        self.writes += 1
+        try:
+            self.connection.executemany(statement, self.scoped(entries))
+        except sql.Error:
+            self.dates = None  # some of the dates may not have been written
+            raise
+        self.commit()
+
+    def scoped(self, entries: Iterable[Entry]) -> Iterator[Tuple]:
+        """Yield the entries preceded by the patient, adding their dates to the DateIndex when it is loaded."""
+        patient_id = self.patient_id
+        dates = self.dates
+        for entry in entries:
+            if dates is not None:
+                dates.add(entry[0])
+            yield (patient_id, *entry)
+
+    @timed('storage.save_batch')
+    def save_batch(self, entries: Iterable[Entry], replace: bool = False) -> int:
+        """
+        Write the entries of many dates in a single transaction, after checking in a single query which of them are
+        already filled: they raise a DatesConflict, which writes nothing, unless replace is true. Return the amount
+        of dates written.
+        """
+        batch = {entry[0]: entry for entry in entries}
+        with self.transaction():
+            existing = self.existing_dates(batch)
+            if existing and not replace:
+                batch = None  # raised once the transaction is over: nothing was written, the dates stay loaded
+            else:
+                self.write_many(UPSERT if existing else INSERT, batch.values())
+        if batch is None:
+            raise DatesConflict(existing)
+        return len(batch)
+
+    @timed('storage.existing_dates')
+    def existing_dates(self, dates: Iterable[str]) -> Set[str]:
+        """Return which of the dates are already filled, in a single query."""
+        return {row[0] for row in self.connection.execute(EXISTING_DATES,
+                                                          (self.patient_id, json.dumps(list(dates))))}
+
+    @timed('storage.get')
+    def get(self, full_date: str) -> Optional[Entry]:
+        """Return the entry of a date, or None when it is not filled."""
+        return self.connection.execute(SELECT_DATE, (self.patient_id, full_date)).fetchone()
+
+    def exists(self, full_date: str) -> bool:
+        """Tell whether a date is filled, without querying the headache table once the dates are loaded."""
+        return full_date in self.filled_dates()
+
+    @timed('storage.filled_dates')
+    def filled_dates(self) -> DateIndex:
+        """Return the DateIndex of the patient, loaded again when another connection wrote since it was loaded."""
+        data_version = self.data_version()
+        if self.dates is None or self.dates_version != data_version:
+            self.dates = DateIndex.from_days(row[0] for row in self.connection.execute(SELECT_DAYS,
+                                                                                       (self.patient_id,)))
+            self.dates_version = data_version
+        return self.dates
+
+    def series(self, start: Optional[str] = None, end: Optional[str] = None) -> sql.Cursor:
+        """Return the (day ordinal, intensity, migraine, medicine) of the filled dates from start to end, in order."""
+        conditions = ['patient_id = ?']
+        params = [self.patient_id]
+        if start is not None:
+            conditions.append('date >= ?')
+            params.append(iso_date(start))
+        if end is not None:
+            conditions.append('date <= ?')
+            params.append(iso_date(end))
+        return self.connection.execute(SELECT_SERIES.format(where=' and '.join(conditions)), params)
+
+    def every_series(self) -> sql.Cursor:
+        """Return the (patient_id, day ordinal, intensity, migraine, medicine) of every diary, by patient and date."""
+        return self.connection.execute(SELECT_EVERY_SERIES)
+
+    def range(self, start: Optional[str] = None, end: Optional[str] = None, ord: str = 'ASC') -> sql.Cursor:
+        """Return a cursor over the rows between the dates start and end (both inclusive and optional)."""
+        return self.report(ReportFilter(start, end), ord)
+
+    @timed('storage.report')
+    def report(self, report_filter, ord: str = 'ASC') -> sql.Cursor:
+        """
+        Return a cursor over the rows of a report filter (a ReportFilter or the name of one of the REPORT_FILTERS),
+        so that they can be streamed.
+        """
+        report_filter = self.query_filter(report_filter)
+        return self.connection.execute(compile_query(report_filter.shape, ord),
+                                       (self.patient_id,) + report_filter.params)
+
+    def query_filter(self, report_filter) -> ReportFilter:
+        """Return the ReportFilter of report_filter (see ReportFilter.of()) that the queries of this database run."""
+        report_filter = ReportFilter.of(report_filter)
+        return report_filter if self.full_text else report_filter.without_full_text()
+
+    @timed('storage.search_report')
+    def search_report(self, report_filter, ord: str = 'ASC') -> List[Tuple]:
+        """
+        Run the query of a report filter and return its rows (_id, date, intensity, migraine, medicine, comment).
+        The rows are fetched in a single pass, so the amount of returned items is simply len() of the result.
+        """
+        return self.report(report_filter, ord).fetchall()
+
+    @timed('storage.search_comments')
+    def search_comments(self, text: str, report_filter=None, limit: int = SEARCH_LIMIT) -> List[Row]:
+        """
+        Return the rows whose comment contains the words of text, best matches first (bm25 ranking), among the
+        rows of report_filter when given. Each row is a Match, holding its comment with the matched words in
+        brackets. Without full-text index, the rows containing text are returned, most recent first.
+        """
+        report_filter = ReportFilter() if report_filter is None else self.query_filter(report_filter)
+        if not self.full_text:
+            # the text is one more comment condition, after the one of the filter, if any
+            cursor = self.connection.execute(compile_query(report_filter.shape + ('comment',), 'DESC'),
+                                             (self.patient_id,) + report_filter.params +
+                                             ('%' + escape_like(text) + '%',))
+            return list(starmap(Row, cursor.fetchmany(limit)))
+        return list(starmap(Match, self.connection.execute(compile_query(report_filter.shape, 'ASC', 'rank'),
+                                                           (match_query(text), self.patient_id) +
+                                                           report_filter.params + (limit,))))
+
+    @timed('storage.statistics')
+    def statistics(self, period: str = 'month', start: Optional[str] = None,
+                   end: Optional[str] = None) -> List[Statistics]:
+        """
+        Return the statistics of each month or week, read from the aggregate tables. start and end are optional
+        period names ('YYYY-MM' for months, the date of the monday for weeks), both inclusive.
+        """
+        if period not in PERIODS:
+            raise ValueError('invalid statistics period: {period}'.format(period=period))
+        conditions = ['patient_id = ?', 'days > 0']
+        params = [self.patient_id]
+        if start is not None:
+            conditions.append('period >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('period <= ?')
+            params.append(end)
+        return self.connection.execute(
+            'select period, days, headache_days, round(1.0 * intensity_sum / days, 2), migraine_days, medicine_days '
+            'from headache_{period} where {where} order by period'.format(period=period,
+                                                                          where=' and '.join(conditions)),
+            params).fetchall()
+
+    @timed('storage.chart')
+    def chart(self, report_filter) -> Chart:
+        """
+        Return the Chart of the rows of a filter (a ReportFilter or one of REPORT_FILTERS). Charts are cached by
+        patient and filter, whatever the order of the report, until this connection or another one writes.
+        """
+        report_filter = self.query_filter(report_filter)
+        key = (self.patient_id, report_filter.key())
+        stamp = self.stamp()
+        cached = self.charts.get(key)
+        if cached is not None and cached[:2] == stamp:
+            self.charts.move_to_end(key)
+            return cached[2]
+        params = (self.patient_id,) + report_filter.params
+        first, last, count = self.connection.execute(compile_query(report_filter.shape, kind='bounds'),
+                                                     params).fetchone()
+        chart = Chart(report_filter)
+        if count:
+            first = date.fromisoformat(first).toordinal()
+            days = date.fromisoformat(last).toordinal() - first + 1
+            chart = Chart(report_filter, first, days, self.connection.execute(
+                compile_query(report_filter.shape, kind='chart'),
+                (first, min(days, CHART_COLUMNS) / days) + params))
+        self.charts[key] = stamp + (chart,)
+        self.charts.move_to_end(key)
+        if len(self.charts) > CHART_CACHE_SIZE:
+            self.charts.popitem(last=False)
+        return chart
+
+    def stamp(self) -> Tuple[int, int]:
+        """Return what tells whether a cached result is still valid: the writes of this connection and of the others."""
+        return self.writes, self.data_version()
+
+    def data_version(self) -> int:
+        """Return the PRAGMA data_version, which changes when another connection commits, never this one."""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    @timed('storage.pager')
+    def pager(self, report_filter, ord: str = 'ASC') -> 'ReportPager':
+        """
+        Return the ReportPager of a filter in the order ord. Pagers are cached by patient and filter, with the pages
+        they read, until this connection or another one writes. The cached one is in ascending order, the
+        descending one being a ReversedPager of it, so that reversing a report reads neither its count nor the
+        pages already read.
+        """
+        check_order(ord)
+        report_filter = self.query_filter(report_filter)
+        key = (self.patient_id, report_filter.key())
+        stamp = self.stamp()
+        cached = self.pagers.get(key)
+        if cached is not None and cached[:2] == stamp:
+            self.pager_hits += 1
+            self.pagers.move_to_end(key)
+            pager = cached[2]
+        else:
+            self.pager_misses += 1
+            pager = self.new_pager(report_filter)
+            self.pagers[key] = stamp + (pager,)
+            self.pagers.move_to_end(key)
+            if len(self.pagers) > PAGER_CACHE_SIZE:
+                self.pagers.popitem(last=False)
+        return pager if ord == ORDERS[0] else ReversedPager(pager)
+
+    @timed('storage.pager_miss')
+    def new_pager(self, report_filter: 'ReportFilter') -> 'ReportPager':
+        return ReportPager(self.connection, report_filter, ORDERS[0], patient_id=self.patient_id)
+
+    def pager_cache(self) -> Tuple[int, int, int]:
+        """Return the hits and misses of the cache of the report pagers, and an estimate of the bytes it holds."""
+        size = sys.getsizeof(self.pagers)
+        for writes, data_version, pager in self.pagers.values():
+            size += sys.getsizeof(pager.buffer)
+            for row in pager.buffer:
+                size += sys.getsizeof(row) + sum(sys.getsizeof(getattr(row, name)) for name in Row.__slots__)
+        return self.pager_hits, self.pager_misses, size
+
+    @timed('storage.search_pager')
+    def search_pager(self, text: str, report_filter=None, limit: int = SEARCH_LIMIT) -> 'SearchPager':
+        report_filter = ReportFilter() if report_filter is None else ReportFilter.of(report_filter)
+        return SearchPager(self.connection, self.search_comments(text, report_filter, limit), text, report_filter,
+                           self.patient_id, self.full_text)
+
+
+class ReportPager:
+    """
+    Read the rows of a report filter on demand, a page at a time.
+    Pages next to the ones already in memory are fetched with keyset pagination on the date column, so that
+    scrolling costs the same at the top and at the bottom of a huge diary; only jumps (e.g. dragging the
+    scrollbar) need an offset. At most max_pages pages are kept in memory.
+    """
+
+    def __init__(self, db, report_filter, ord='ASC', page_size=100, max_pages=5, patient_id=DEFAULT_PATIENT_ID):
+        check_order(ord)
+        self.db = db
+        self.patient_id = patient_id
+        self.report_filter = ReportFilter.of(report_filter)
+        self.ord = ord
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.params = (patient_id,) + self.report_filter.params
+        self.total = self.db.execute(self.query('count'), self.params).fetchone()[0]
+        self.buffer = list()
+        self.buffer_start = 0
+
+    def query(self, kind):
+        return compile_query(self.report_filter.shape, self.ord, kind)
+
+    @timed('storage.fetch_after')
+    def fetch_after(self, key, count):
+        return list(starmap(Row, self.db.execute(self.query('after'), self.params + (key, count))))
+
+    @timed('storage.fetch_before')
+    def fetch_before(self, key, count):
+        rows = list(starmap(Row, self.db.execute(self.query('before'), self.params + (key, count))))
+        rows.reverse()
+        return rows
+
+    @timed('storage.fetch_at')
+    def fetch_at(self, offset, count):
+        # the offset is walked on the report index alone, from its nearer end (the top of a ReversedPager is the
+        # bottom of its pager), then the page itself is read by key
+        if offset >= self.total:
+            return list()
+        if offset > self.total // 2:
+            opposite = ORDERS[1] if self.ord == ORDERS[0] else ORDERS[0]
+            key = self.db.execute(compile_query(self.report_filter.shape, opposite, 'key'),
+                                  self.params + (self.total - 1 - offset,)).fetchone()
+        else:
+            key = self.db.execute(self.query('key'), self.params + (offset,)).fetchone()
+        if key is None:
+            return list()
+        return list(starmap(Row, self.db.execute(self.query('from'), self.params + (key[0], count))))
+
+    def rows(self, offset, count):
+        """Return the rows from offset (inclusive) to offset + count (exclusive) of the report."""
+        offset = max(0, min(offset, self.total))
+        end = min(offset + count, self.total)
+        buffer_end = self.buffer_start + len(self.buffer)
+        if not self.buffer or end < self.buffer_start - self.page_size or offset > buffer_end + self.page_size:
+            # far from what is in memory: jump there
+            self.buffer_start = max(0, offset - self.page_size // 2)
+            self.buffer = self.fetch_at(self.buffer_start, end - self.buffer_start + self.page_size)
+        else:
+            while offset < self.buffer_start:
+                page = self.fetch_before(self.buffer[0].date, self.page_size)
+                self.buffer[0:0] = page
+                self.buffer_start -= len(page)
+                if len(page) < self.page_size:  # the first row is reached: fewer rows before it if some were deleted
+                    self.buffer_start = 0
+                    break
+            while end > self.buffer_start + len(self.buffer):
+                page = self.fetch_after(self.buffer[-1].date, self.page_size)
+                if not page:
+                    break
+                self.buffer.extend(page)
+            self.trim(offset, end)
+        return self.buffer[offset - self.buffer_start:end - self.buffer_start]
+
+    def trim(self, offset, end):
+        """Drop the pages of the buffer that are furthest from the requested rows."""
+        limit = self.max_pages * self.page_size
+        while len(self.buffer) > limit:
+            before = offset - self.buffer_start
+            after = self.buffer_start + len(self.buffer) - end
+            if before >= self.page_size and before > after:
+                del self.buffer[:self.page_size]
+                self.buffer_start += self.page_size
+            elif after >= self.page_size:
+                del self.buffer[-self.page_size:]
+            else:
+                break
+
+    def update(self, offset, row):
+        """Replace the buffered row at offset by row, once changed."""
+        index = offset - self.buffer_start
+        if 0 <= index < len(self.buffer) and self.buffer[index].date == row.date:
+            self.buffer[index] = row
+
+    def all_rows(self):
+        """Iterate over every row of the report, straight from the database cursor."""
+        return self.db.execute(self.query('select'), self.params)
+
+
+class ReversedPager:
+    """
+    The rows of a ReportPager in the opposite order, read through it, so that they share its count and the pages
+    it holds.
+    """
+
+    def __init__(self, pager):
+        self.pager = pager
+        self.db = pager.db
+        self.patient_id = pager.patient_id
+        self.report_filter = pager.report_filter
+        self.ord = ORDERS[1] if pager.ord == ORDERS[0] else ORDERS[0]
+        self.total = pager.total
+
+    def rows(self, offset, count):
+        """Return the rows from offset (inclusive) to offset + count (exclusive) of the report."""
+        offset = max(0, min(offset, self.total))
+        end = min(offset + count, self.total)
+        rows = self.pager.rows(self.total - end, end - offset)
+        rows.reverse()
+        return rows
+
+    def update(self, offset, row):
+        """Replace the buffered row at offset by row, once changed."""
+        self.pager.update(self.total - 1 - offset, row)
+
+    def all_rows(self):
+        """Iterate over every row of the report, straight from the database cursor."""
+        return self.db.execute(compile_query(self.report_filter.shape, self.ord), self.pager.params)
+
+
+class SearchPager:
+    """
+    The best matches of a full-text search, read at once (they are at most SEARCH_LIMIT), with the interface of a
+    ReportPager, so that the report displays them the same way. The exported rows are all the matches of the
+    search, in date order.
+    """
+
+    def __init__(self, db, matches, text, report_filter, patient_id=DEFAULT_PATIENT_ID, full_text=True):
+        self.db = db
+        self.patient_id = patient_id
+        self.matches = matches
+        self.text = text
+        self.report_filter = ReportFilter(report_filter.start, report_filter.end, report_filter.min_intensity,
+                                          report_filter.migraine, report_filter.medicine, report_filter.comment,
+                                          text)
+        if not full_text:
+            self.report_filter = self.report_filter.without_full_text()
+        self.ord = 'ASC'
+        self.total = len(matches)
+
+    def rows(self, offset, count):
+        return self.matches[offset:offset + count]
+
+    def update(self, offset, row):
+        """Replace the row at offset by row, once changed."""
+        if 0 <= offset < self.total and self.matches[offset].date == row.date:
+            self.matches[offset] = row
+
+    def all_rows(self):
+        return self.db.execute(compile_query(self.report_filter.shape, self.ord),
+                               (self.patient_id,) + self.report_filter.params)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# Synthetic diaries, for the benchmarks and for trying the application with a long history. The entries look like
+# the ones of a real diary: some days are not filled, headaches are more often weak than strong, migraine and medicine
+# go with the strong ones, and the comments have a skewed length (most are short, a few are long).
+
+import argparse
+import math
+import random
+from datetime import date  # synthetic dates end today
+import storage  # database queries
+
+DENSITY = 1.0  # filled days, among all the days of the diary
+HEADACHE_RATE = 0.5  # days with a headache, among the filled ones
+INTENSITIES = (1, 2, 3)
+INTENSITY_WEIGHTS = (50, 35, 15)  # weak headaches are the most frequent
+MIGRAINE_RATES = (0.0, 0.1, 0.35, 0.7)  # days connected to migraine, by intensity
+MEDICINE_RATES = (0.02, 0.2, 0.6, 0.9)  # days when some medicine was taken, by intensity
+COMMENT_RATE = 0.3  # filled days with a comment
+COMMENT_WORDS = 8  # mean amount of words of a comment
+COMMENT_SPREAD = 0.8  # sigma of the log-normal distribution of the amount of words
+WORDS = ('wine', 'sleep', 'stress', 'coffee', 'rain', 'work', 'screen', 'noise', 'period', 'travel', 'skipped',
+         'lunch', 'late', 'bright', 'light', 'neck', 'pain', 'nausea', 'aura', 'paracetamol', 'dipyrone',
+         'naratriptan', 'woke', 'up', 'with', 'after', 'the', 'a', 'in', 'at', 'morning', 'evening', 'night')
+
+
+def entries(rows, density=DENSITY, headache_rate=HEADACHE_RATE, comment_rate=COMMENT_RATE,
+            comment_words=COMMENT_WORDS, generator=None, end=None):
+    """
+    Yield rows synthetic entries (date, intensity, migraine, medicine, comment), in date order, spread over the days
+    ending at end (default: today) so that about density of them are filled. Dates never go before 0001-01-01: the
+    biggest diaries then end after end.
+    """
+    if not 0 < density <= 1:
+        raise ValueError('invalid density: {}'.format(density))
+    if generator is None:
+        generator = random.Random(0)
+    end = date.today() if end is None else end
+    span = max(rows, round(rows / density))
+    first = max(1, end.toordinal() - span + 1)
+    days = range(span) if span == rows else sorted(generator.sample(range(span), rows))
+    mu = math.log(comment_words) - COMMENT_SPREAD ** 2 / 2  # so that the mean amount of words is comment_words
+    for day in days:
+        intensity = 0
+        if generator.random() < headache_rate:
+            intensity = generator.choices(INTENSITIES, INTENSITY_WEIGHTS)[0]
+        comment = None
+        if generator.random() < comment_rate:
+            words = max(1, round(generator.lognormvariate(mu, COMMENT_SPREAD)))
+            comment = ' '.join(generator.choices(WORDS, k=words)) + '\n'
+        yield (date.fromordinal(first + day).isoformat(), intensity,
+               int(generator.random() < MIGRAINE_RATES[intensity]),
+               int(generator.random() < MEDICINE_RATES[intensity]), comment)
+
+
+def create_diary(path, rows, seed=0, profile=storage.DEFAULT_PROFILE, patients=1, **shape):
+    """
+    Create a database at path filled with rows synthetic entries, shaped by the keyword arguments of entries().
+    With several patients, the rows are shared between the default patient and patients named 'patient 1',
+    'patient 2'...; the default patient is selected at the end. Return the Storage.
+    """
+    generator = random.Random(seed)
+    database = storage.Storage(path, profile)
+    database.initialize()
+    rows = rows // patients
+    for patient in range(1, patients):
+        database.add_patient('patient {}'.format(patient))
+        database.select_patient('patient {}'.format(patient))
+        database.insert_many(entries(rows, generator=generator, **shape))
+    database.select_patient(storage.DEFAULT_PATIENT)
+    database.insert_many(entries(rows, generator=generator, **shape))
+    return database
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create a Headache Diary database filled with synthetic entries.')
+    parser.add_argument('path', help='database file to create or to fill')
+    parser.add_argument('--years', type=float, default=5, help='length of the diary (default: %(default)s)')
+    parser.add_argument('--density', type=float, default=DENSITY,
+                        help='filled days, from 0 to 1 (default: %(default)s)')
+    parser.add_argument('--headache-rate', type=float, default=HEADACHE_RATE,
+                        help='days with a headache, among the filled ones (default: %(default)s)')
+    parser.add_argument('--comment-rate', type=float, default=COMMENT_RATE,
+                        help='filled days with a comment (default: %(default)s)')
+    parser.add_argument('--comment-words', type=float, default=COMMENT_WORDS,
+                        help='mean amount of words of a comment (default: %(default)s)')
+    parser.add_argument('--patients', type=int, default=1, help='diaries in the database (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='(default: %(default)s)')
+    args = parser.parse_args()
+    rows = round(args.years * 365.25 * args.density) * args.patients
+    database = create_diary(args.path, rows, args.seed, patients=args.patients, density=args.density,
+                            headache_rate=args.headache_rate, comment_rate=args.comment_rate,
+                            comment_words=args.comment_words)
+    database.close()
+    print('{rows} entries written to "{path}".'.format(rows=rows, path=args.path))
+
+
+if __name__ == '__main__':
+    main()
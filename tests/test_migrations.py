@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# Migrations of the diaries of version 1 (a single diary per database) to the current schema, from the start and
+# from a copy of the headache table interrupted halfway. Run with: python3 -m unittest discover tests
+
+import os
+import sqlite3 as sql  # the databases of version 1 are written directly
+import sys
+import tempfile
+import unittest
+from datetime import date  # dates of the rows and periods of the aggregates
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the modules of the application
+
+import migrations  # schema of the database
+import storage  # the migrated diaries are read through it
+
+DAYS = 60  # rows of the diaries of version 1, one per day
+COMMENTS = (None, 'coffee\n', 'aura before the rain\n', 'stress at work\n')
+WORDS = ('coffee', 'aura', 'rain', 'stress')  # searched in the full-text index
+V1_COLUMNS = '_id, date, intensity, migraine, medicine, comment'
+INSERT_V1 = 'insert into headache (date, intensity, migraine, medicine, comment) values (?, ?, ?, ?, ?)'
+
+
+def entries(count, first=date(2018, 1, 1)):
+    """Return count entries (date, intensity, migraine, medicine, comment) of consecutive days."""
+    return [((first + timedelta(days=day)).isoformat(), day % 4, int(day % 3 == 0), int(day % 5 == 0),
+             COMMENTS[day % len(COMMENTS)]) for day in range(count)]
+
+
+def full_text_available():
+    try:
+        sql.connect(':memory:').execute('create virtual table probe using fts5(text)')
+    except sql.OperationalError:
+        return False
+    return True
+
+
+class Interrupted(Exception):
+    """Raised from the progress of a migration, to stop it as a closed application would."""
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'diary.db')
+        self.database = None
+
+    def tearDown(self):
+        if self.database is not None:
+            self.database.close()
+
+    def create_v1(self, rows):
+        """Write a database of version 1 holding rows, and return them as read back, with their _id."""
+        database = storage.Storage(self.path)
+        migrations.migrate(database, target=1)
+        database.connection.executemany(INSERT_V1, rows)
+        database.connection.commit()
+        database.close()
+        return self.v1_rows()
+
+    def v1_rows(self):
+        connection = sql.connect(self.path)
+        try:
+            return connection.execute('select ' + V1_COLUMNS + ' from headache order by _id').fetchall()
+        finally:
+            connection.close()
+
+    def migrate(self, progress=None):
+        self.database = storage.Storage(self.path)
+        self.database.initialize(progress)
+        return self.database
+
+    def check_migrated(self, expected):
+        """Check that the migrated database holds the rows expected, as read from version 1, and what they make."""
+        connection = self.database.connection
+        self.assertEqual(migrations.version(connection), migrations.SCHEMA_VERSION)
+        self.assertFalse(migrations.exists(connection, 'headache_partitioned'))
+        self.assertEqual(connection.execute('select _id, name from patient').fetchall(),
+                         [(migrations.DEFAULT_PATIENT_ID, migrations.DEFAULT_PATIENT)])
+        self.assertEqual(connection.execute('select count(*) from headache').fetchone()[0], len(expected))
+        self.assertEqual(connection.execute('select ' + V1_COLUMNS + ', patient_id from headache order by _id').
+                         fetchall(), [row + (migrations.DEFAULT_PATIENT_ID,) for row in expected])
+        self.assertTrue(migrations.exists(connection, 'headache_report'))
+        self.check_aggregates(expected)
+        if full_text_available():
+            self.check_full_text(expected)
+        self.assertEqual(connection.execute('select patient_id, changes from headache_version').fetchall(),
+                         [(migrations.DEFAULT_PATIENT_ID, 0)])
+
+    def check_aggregates(self, expected):
+        for period, key in (('month', lambda day: day[:7]),
+                            ('week', lambda day: (date.fromisoformat(day) -
+                                                  timedelta(days=date.fromisoformat(day).weekday())).isoformat())):
+            totals = dict()
+            for _id, full_date, intensity, migraine, medicine, comment in expected:
+                total = totals.setdefault(key(full_date), [0, 0, 0, 0, 0])
+                for column, value in enumerate((1, intensity > 0, intensity, migraine != 0, medicine != 0)):
+                    total[column] += value
+            self.assertEqual(self.database.connection.execute(
+                'select period, days, headache_days, intensity_sum, migraine_days, medicine_days from '
+                'headache_{period} where patient_id = ? order by period'.format(period=period),
+                (migrations.DEFAULT_PATIENT_ID,)).fetchall(),
+                [(name,) + tuple(total) for name, total in sorted(totals.items())], period)
+
+    def check_full_text(self, expected):
+        connection = self.database.connection
+        self.assertTrue(self.database.full_text)
+        connection.execute('insert into headache_fts (headache_fts) values (\'integrity-check\')')
+        for word in WORDS:
+            self.assertEqual(
+                [row[0] for row in connection.execute('select rowid from headache_fts where headache_fts match ? '
+                                                      'order by rowid', (word,))],
+                [row[0] for row in expected if row[5] is not None and word in row[5].split()], word)
+        self.assertEqual(sorted(row.id for row in self.database.search_comments('rain', limit=DAYS)),
+                         [row[0] for row in expected if row[5] is not None and 'rain' in row[5]])
+
+    def test_version_1(self):
+        expected = self.create_v1(entries(DAYS))
+        self.migrate()
+        self.check_migrated(expected)
+        self.assertEqual(migrations.migrate(self.database), 0)  # up to date
+
+    def test_interrupted_copy(self):
+        self.create_v1(entries(DAYS))
+        batch_size = migrations.BATCH_SIZE
+        migrations.BATCH_SIZE = 10
+        self.addCleanup(setattr, migrations, 'BATCH_SIZE', batch_size)
+
+        def progress(description, done, total):
+            if description == migrations.MIGRATIONS[1][0] and done > 0:
+                raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            self.migrate(progress)
+        self.database.close()
+        self.database = None
+        connection = sql.connect(self.path)
+        try:
+            self.assertEqual(migrations.version(connection), 1)
+            self.assertEqual(connection.execute('select count(*) from headache_partitioned').fetchone()[0], 10)
+            # the writes made before the next start are mirrored, in the rows already copied or not
+            connection.execute('update headache set intensity = 3, comment = ? where _id = 5', ('rain again\n',))
+            connection.execute('update headache set migraine = 1 where _id = 40')
+            connection.execute('delete from headache where _id in (3, 50)')
+            connection.execute(INSERT_V1, ('2019-01-01', 2, 1, 0, 'stress\n'))
+            connection.commit()
+        finally:
+            connection.close()
+        expected = self.v1_rows()
+        self.migrate()
+        self.check_migrated(expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
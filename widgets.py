@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+# What the windows share, kept apart from them so that the main window can start without importing the others.
+
+import os
+
+DISABLED_BUTTON_BKGRND = 'DarkGray'
+ENABLED_BUTTON_BKGRND = 'LightGreen'
+
+
+def load_tix(widget):
+    """
+    Load the Tix extension, whose balloons and lists the windows use, into the Tcl interpreter of widget. It is done
+    like tix.Tk does, but only when first needed: loading it takes a noticeable part of the start of the application.
+    """
+    if widget.tk.call('package', 'provide', 'Tix'):
+        return
+    widget.tk.eval('global auto_path; lappend auto_path [file dir [info nameof]]')
+    tixlib = os.environ.get('TIX_LIBRARY')
+    if tixlib is not None:
+        widget.tk.eval('global auto_path; lappend auto_path {%s}' % tixlib)
+        widget.tk.eval('global tcl_pkgPath; lappend tcl_pkgPath {%s}' % tixlib)
+    widget.tk.eval('package require Tix')
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Headache Diary - Keep track of the dates and intensity of your headaches
+Copyright (C) 2018 Gidalti Lourenço Junior
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+
+import queue  # results travel back to the user interface through a queue
+import time
+from concurrent.futures import ThreadPoolExecutor  # the database thread
+from tkinter import TclError
+import storage  # database queries
+import instrumentation  # opt-in timing of the work, as the user interface waits for it
+
+POLL_INTERVAL = 20  # milliseconds between two checks of the finished work by the user interface
+
+
+class DatabaseWorker:
+    """
+    Run the database work of the user interface in a single dedicated thread, which owns the Storage (a sqlite
+    connection can only be used by the thread that opened it), so that a slow query never freezes the Tk mainloop.
+    Work is submitted as a function receiving the Storage; its callback, or its errback on exception, is then
+    called back in the Tk thread once attach() started the polling of the finished work. When the database cannot
+    be opened, every work fails with the error of the opening, which only the first errback receives.
+    """
+
+    def __init__(self, path=storage.DEFAULT_DATABASE, profile=storage.DEFAULT_PROFILE):
+        self.storage = None  # only used from the database thread
+        self.failure = None  # the error of the opening of the database, if it failed
+        self.failure_reported = False
+        self.finished = queue.SimpleQueue()
+        self.widget = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database',
+                                           initializer=self.open, initargs=(path, profile))
+
+    def open(self, path, profile):
+        instrumentation.profile_thread()
+        try:
+            self.storage = storage.Storage(path, profile)
+        except Exception as error:  # raised by the initializer, it would break the executor for every work
+            self.failure = error
+
+    def close(self):
+        instrumentation.end_thread_profile()
+        if self.storage is not None:
+            self.storage.close()
+
+    def run(self, function, args):
+        if self.storage is None:
+            raise self.failure
+        return function(self.storage, *args)
+
+    def submit(self, function, *args, callback=None, errback=None):
+        """Run function(storage, *args) in the database thread and return its Future."""
+        future = self.executor.submit(self.run, function, args)
+        if callback is not None or errback is not None:
+            if instrumentation.ENABLED:
+                # from the submission to the callback, queueing behind the previous work included
+                callback = self.waited(function, callback, time.perf_counter())
+            future.add_done_callback(lambda done: self.finished.put((done, callback, errback)))
+        return future
+
+    @staticmethod
+    def waited(function, callback, start):
+        operation = 'worker.' + getattr(function, '__qualname__', 'work').replace('Storage.', '')
+
+        def recorded(result):
+            instrumentation.record(operation, time.perf_counter() - start)
+            if callback is not None:
+                callback(result)
+        return recorded
+
+    def post(self, function, *args):
+        """Call function(*args) in the Tk thread; used by the database thread, e.g. to report progress."""
+        self.finished.put((None, lambda result: function(*args), None))
+
+    def attach(self, widget):
+        """Start delivering the callbacks in the Tk thread of widget."""
+        self.widget = widget
+        self.widget.after(POLL_INTERVAL, self.poll)
+
+    def poll(self):
+        try:
+            while True:
+                try:
+                    future, callback, errback = self.finished.get_nowait()
+                except queue.Empty:
+                    break
+                if future is None:
+                    callback(None)
+                elif future.exception() is not None:
+                    if errback is not None and not self.reported(future.exception()):
+                        errback(future.exception())
+                elif callback is not None:
+                    callback(future.result())
+        finally:
+            try:
+                self.widget.after(POLL_INTERVAL, self.poll)
+            except TclError:  # the application was destroyed
+                pass
+
+    def reported(self, error):
+        """Tell whether error is the failure of the opening of the database, already given to an errback."""
+        if error is not self.failure:
+            return False
+        reported, self.failure_reported = self.failure_reported, True
+        return reported
+
+    def shutdown(self):
+        """Close the database once the work already submitted is done."""
+        self.executor.submit(self.close)
+        self.executor.shutdown(wait=True)